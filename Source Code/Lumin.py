@@ -1,50 +1,72 @@
-import json
+import os
 import sys
 import logging
+import threading
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QTabWidget, QWidget,
-                             QTableWidget, QTableWidgetItem, QDoubleSpinBox, QLabel, QPushButton,
-                             QFormLayout, QStatusBar, QListWidget, QLineEdit, QDialog, QProgressBar,
-                             QHBoxLayout, QComboBox, QInputDialog, QMessageBox, QListWidgetItem)
+                             QDoubleSpinBox, QLabel, QPushButton,
+                             QFormLayout, QStatusBar, QLineEdit, QDialog, QProgressBar,
+                             QHBoxLayout, QComboBox, QInputDialog, QMessageBox, QHeaderView, QFileDialog)
 from PyQt5.QtGui import QPixmap, QFont
-from PyQt5.QtCore import Qt
-from web3 import Web3
+from PyQt5.QtCore import Qt, QTimer
+from workers import TaskRunner, CallbackSignal
+from models import PagedListModel, PagedTableModel, TimedListView, TimedTableView
+from event_sync import SALE_ID, PANEL_ID, PANEL_OWNER
+from allocation import STRATEGIES, plan_allocation
+from lazy_client import LazyClient
+from exporter import DEFAULT_CHUNK_SIZE, ExportCancelled, export
+from metrics import metrics, serve_metrics
+from order_book import AMOUNT, POSTED, UNIT_PRICE, OrderBook, eth_per_kwh, parse_filter
 
 # Setup logging
 logging.basicConfig(filename='application.log', level=logging.ERROR,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Connect to local Ethereum node via ganache's cli
-web3 = Web3(Web3.HTTPProvider('http://127.0.0.1:8545'))
+# Connect to local Ethereum node via ganache's cli; list more nodes to spread reads and fail over between them
+rpc_urls = ['http://127.0.0.1:8545']
+
+# WebSocket endpoint of the same node for live updates; set to None to poll a log filter over HTTP instead
+ws_url = 'ws://127.0.0.1:8545'
 
 # Path to the ABI file generated by Truffle, modify as needed
 abi_file_path = "build/contracts/EnergyManagement.json"
 
-# Load the ABI
-try:
-    with open(abi_file_path, 'r') as abi_file:
-        abi = json.load(abi_file)['abi']
-except FileNotFoundError:
-    logging.error(f"ABI file not found at {abi_file_path}")
-    sys.exit(f"Error: ABI file not found at {abi_file_path}")
-except json.JSONDecodeError:
-    logging.error(f"Error decoding ABI JSON from {abi_file_path}")
-    sys.exit("Error: ABI file is not a valid JSON")
-
 # Contract details
 contract_address = '0xyoucontractaddress'
 
-# Create the contract instance
-try:
-    contract = web3.eth.contract(address=contract_address, abi=abi)
-except Exception as e:
-    logging.error(f"Failed to create contract instance: {e}")
-    sys.exit("Error: Failed to create contract instance")
+# Path to the local SQLite index of the contract, kept between runs
+index_db_path = "lumin_index.db"
+
+# Directory of the compact ABI copies extracted from the artifact, so starts after the first skip parsing it
+abi_cache_dir = ".lumin_cache"
+
+# Port of the local Prometheus endpoint (http://127.0.0.1:<port>/metrics) with RPC, transaction and repaint timings;
+# set to None to turn it off. trace_log_path, when set, also records every timed operation as one JSON line.
+metrics_port = 9464
+trace_log_path = None
+
+# File types offered when exporting: filter -> extension added when none is typed
+EXPORT_FILTERS = {
+    "CSV (*.csv)": ".csv",
+    "JSON lines (*.jsonl)": ".jsonl",
+    "Parquet (*.parquet)": ".parquet",
+}
+
+# The GUI's offer sort options: option -> (OrderBook order, descending). Prices are compared per kWh.
+OFFER_SORT_OPTIONS = {
+    "Lowest Price per kWh to Highest": (UNIT_PRICE, False),
+    "Highest Price per kWh to Lowest": (UNIT_PRICE, True),
+    "Lowest Amount to Highest": (AMOUNT, False),
+    "Highest Amount to Lowest": (AMOUNT, True),
+    "Oldest to Newest": (POSTED, False),
+}
 
 
 class LoginWindow(QDialog):
-    def __init__(self):
+    def __init__(self, client):
         super().__init__()
 
+        self.client = client
+
         self.setWindowTitle("Login")
         self.setGeometry(100, 100, 400, 450)
 
@@ -109,53 +131,74 @@ class LoginWindow(QDialog):
             QMessageBox.warning(self, "Role Selection", "Please select a role before logging in.")
             return
 
-        # Hash the password using keccak256
-        password_hash = web3.keccak(text=password)
-
         try:
-            accounts = web3.eth.accounts
-            for address in accounts:
-                user = contract.functions.users(address).call()
-
-                if user[0] == username and user[2] == password_hash:
-                    if (role == "Manager" and user[4]) or (role == "User" and not user[4]):
-                        self.accept()
-                        self.manager = user[4]
-                        self.user_address = address  # Store the logged-in user's address
-                        return
-                    else:
-                        QMessageBox.warning(self, "Login Failed", "Selected role does not match the user's role.")
-                        self.username_field.clear()
-                        self.password_field.clear()
-                        self.role_combo.setCurrentIndex(0)
-                        return
+            account = self.client.login(username, password)
+            if account is not None:
+                address, is_manager = account
+                if (role == "Manager" and is_manager) or (role == "User" and not is_manager):
+                    self.accept()
+                    self.manager = is_manager
+                    self.user_address = address  # Store the logged-in user's address
+                    return
+                else:
+                    QMessageBox.warning(self, "Login Failed", "Selected role does not match the user's role.")
+                    self.username_field.clear()
+                    self.password_field.clear()
+                    self.role_combo.setCurrentIndex(0)
+                    return
             QMessageBox.warning(self, "Login Failed", "Invalid username or password. Please try again.")
         except Exception as e:
+            # The node may only be unreachable for now; the window stays open so the login can be retried
             logging.error(f"Error during login: {e}")
-            QMessageBox.critical(self, "Login Error", "An unexpected error occurred during login.")
-            sys.exit("Error: Login failed")
+            QMessageBox.critical(self, "Login Error", f"An unexpected error occurred during login: {str(e)}")
 
 
 class SolarEnergySystem(QMainWindow):
-    def __init__(self, user_address, is_manager=False):
+    def __init__(self, client, user_address, is_manager=False):
         super().__init__()
 
+        self.client = client
         self.user_address = user_address  # Store the logged-in user's address
         self.is_manager = is_manager
         self.setWindowTitle("Solar Energy Trading System")
         self.setGeometry(100, 100, 800, 600)
 
+        # Every contract call and transaction runs through this pool so the window never blocks on the node
+        self.tasks = TaskRunner(self)
+
         self.main_layout = QVBoxLayout()
 
         self.tabs = QTabWidget()
         self.main_layout.addWidget(self.tabs)
 
+        # Only the first tab is built up front, the others the first time they are opened
+        self.lazy_tabs = {}  # tab index -> function returning the tab's widget
+        self.tabs.currentChanged.connect(self.build_tab)
+
+        # Filled from the market analytics once the Buy & Sell or Analytics tab has been opened
+        self.analytics_report = None
+        self.exchange_rate_label = None
+        self.market_label = None
+
         if self.is_manager:
-            self.create_manager_tab()
+            self.tabs.addTab(self.create_manager_tab(), "Manager Dashboard")
+            self.add_lazy_tab("Analytics", self.create_analytics_tab)
         else:
-            self.create_dashboard_and_user_info_tab()
-            self.create_buy_and_sell_tab()
-            self.create_history_tab()
+            # The dashboard request also fills the offers and the history, so their models exist before their tabs
+            self.offer_model = PagedListModel(self.tasks, "offers_page", self.format_offer)
+            # Sorting and filtering the offers work on this local copy; live changes move single sales within it
+            self.order_book = OrderBook()
+            self.offer_order = (POSTED, False)
+            self.offer_bounds = {}  # OrderBook.query() keywords of the offer filter, None while it is invalid
+            self.best_offer_label = None
+            self.history_model = PagedTableModel(self.tasks, "history_page",
+                                                 ["Transaction ID", "Type", "Amount", "Price", "Timestamp"],
+                                                 self.format_history_cell)
+            self.tabs.addTab(self.create_dashboard_and_user_info_tab(), "Dashboard & User Info")
+            self.add_lazy_tab("Buy & Sell Energy", self.create_buy_and_sell_tab)
+            self.add_lazy_tab("History", self.create_history_tab)
+            self.add_lazy_tab("Analytics", self.create_analytics_tab)
+            self.refresh_dashboard()
 
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
@@ -172,13 +215,70 @@ class SolarEnergySystem(QMainWindow):
         self.logout_button.clicked.connect(self.logout)
         self.status_bar.addPermanentWidget(self.logout_button)
 
+        # Rows changed by anyone's transactions are pushed into the views as their blocks are mined
+        self.pending_changes = None
+        self.live_signal = CallbackSignal(self)
+        self.live_signal.fired.connect(self.queue_live_changes)
+        self.live_feed = self.client.watch(self.live_signal.fired.emit)
+
+    def add_lazy_tab(self, title, create):
+        page = QWidget()
+        page_layout = QVBoxLayout()
+        page_layout.setContentsMargins(0, 0, 0, 0)
+        page.setLayout(page_layout)
+        self.lazy_tabs[self.tabs.addTab(page, title)] = create
+
+    def build_tab(self, index):
+        create = self.lazy_tabs.pop(index, None)
+        if create is not None:
+            with metrics.timed("lumin_ui_build_tab_seconds", tab=self.tabs.tabText(index)):
+                self.tabs.widget(index).layout().addWidget(create())
+
+    def closeEvent(self, event):
+        self.live_feed.stop()
+        if self.is_manager and self.export_cancel is not None:
+            self.export_cancel.set()  # The file would never be finished; stop writing it
+        super().closeEvent(event)
+
+    def queue_live_changes(self, changes):
+        # Blocks mined while an update is being read are merged and applied together afterwards
+        if self.pending_changes is None:
+            self.pending_changes = changes
+        else:
+            self.pending_changes.merge(changes)
+        self.apply_live_changes()
+
+    def apply_live_changes(self):
+        if self.pending_changes is None or self.tasks.is_running("live_changes"):
+            return
+        changes, self.pending_changes = self.pending_changes, None
+        accounts = self.client.visible_accounts(self.user_address, self.is_manager)
+        self.tasks.submit("live_changes", self.client.read_changes, changes, accounts,
+                          on_success=lambda result: self.show_live_changes(changes, result),
+                          on_error=self.live_changes_failed)
+
+    def show_live_changes(self, changes, result):
+        sales, panels, panel_count, transaction_count = result
+        if self.is_manager:
+            self.show_manager_changes(changes, panels, panel_count, transaction_count)
+        else:
+            self.show_user_changes(changes, sales, panels, panel_count, transaction_count)
+        if self.analytics_report is not None and (changes.sale_ids or transaction_count is not None):
+            self.refresh_analytics(replace=True)  # New trades move the prices, new readings the panel series
+        self.apply_live_changes()
+
+    def live_changes_failed(self, e):
+        logging.error(f"Error applying live updates: {e}")
+        self.apply_live_changes()
+
     def logout(self):
+        self.tasks.cancel_all()  # Drop results of requests still in flight for the old session
         self.close()  # Close the current window
-        self.login_window = LoginWindow()  # Create a new instance of the login window
+        self.login_window = LoginWindow(self.client)  # Create a new instance of the login window
         if self.login_window.exec_() == QDialog.Accepted:
             user_address = self.login_window.user_address  # Retrieve the logged-in user's address from the login window
             is_manager = self.login_window.manager
-            self.__init__(user_address=user_address, is_manager=is_manager)  # Re-initialize the main window with new user
+            self.__init__(self.client, user_address=user_address, is_manager=is_manager)  # Re-initialize the main window with new user
             self.show()  # Show the main window again
 
     def create_manager_tab(self):
@@ -193,13 +293,17 @@ class SolarEnergySystem(QMainWindow):
         transaction_label.setFont(font)
         layout.addWidget(transaction_label)
 
-        self.transaction_list = QListWidget()
+        # Transactions and panels are loaded page by page as the lists are scrolled
+        self.transaction_model = PagedListModel(self.tasks, "manager_transactions_page", self.format_transaction)
+        self.transaction_list = TimedListView("manager_transactions")
+        self.transaction_list.setUniformItemSizes(True)
+        self.transaction_list.setModel(self.transaction_model)
         layout.addWidget(self.transaction_list)
 
         self.transaction_search_field = QLineEdit()
         self.transaction_search_field.setFont(font)
-        self.transaction_search_field.setPlaceholderText("Search Transaction by Index")
-        self.transaction_search_field.returnPressed.connect(self.search_transaction)
+        self.transaction_search_field.setPlaceholderText("Search Transactions: #index, name, time:from..to, amount:min..max")
+        self.transaction_search_field.textChanged.connect(self.search_transaction)  # Filter as the user types
         layout.addWidget(self.transaction_search_field)
 
         # Label for panels
@@ -207,103 +311,217 @@ class SolarEnergySystem(QMainWindow):
         panel_label.setFont(font)
         layout.addWidget(panel_label)
 
-        self.panel_list = QListWidget()
+        self.panel_model = PagedListModel(self.tasks, "manager_panels_page", self.format_panel)
+        self.panel_list = TimedListView("manager_panels")
+        self.panel_list.setUniformItemSizes(True)
+        self.panel_list.setModel(self.panel_model)
         layout.addWidget(self.panel_list)
 
         self.panel_search_field = QLineEdit()
         self.panel_search_field.setFont(font)
-        self.panel_search_field.setPlaceholderText("Search Panel by ID")
-        self.panel_search_field.returnPressed.connect(self.search_panel)
+        self.panel_search_field.setPlaceholderText("Search Panels: id, location, owner, loc:..., owner:...")
+        self.panel_search_field.textChanged.connect(self.search_panel)
         layout.addWidget(self.panel_search_field)
 
+        # Full histories and panel lists are streamed to a file in the background, one chunk at a time
+        export_layout = QHBoxLayout()
+        self.export_button = QPushButton("Export...")
+        self.export_button.setFont(font)
+        self.export_button.clicked.connect(self.export_or_cancel)
+        export_layout.addWidget(self.export_button)
+        self.export_progress = QProgressBar()
+        self.export_progress.setVisible(False)
+        export_layout.addWidget(self.export_progress)
+        layout.addLayout(export_layout)
+        self.export_cancel = None  # threading.Event of the running export
+        self.export_signal = CallbackSignal(self)
+        self.export_signal.fired.connect(self.show_export_progress)
+
+        # Searches run against in-memory indexes rebuilt from the local chain index after every refresh
+        self.manager_data = None
+        self.manager_data_stale = False  # Set once live updates have changed rows after the last full load
+        self.panel_index = None
+        self.transaction_index = None
+
         # Immediately refresh the data when the manager tab is created
         self.refresh_manager_data()
 
         manager_tab.setLayout(layout)
-        self.tabs.addTab(manager_tab, "Manager Dashboard")
+        return manager_tab
+
+    def format_panel(self, number, panel):
+        return (
+            f"Panel ID: {panel[0]}, Capacity: {panel[1]} kWh, Location: {panel[2]}, "
+            f"Energy Balance: {panel[5]} kWh, Efficiency: {panel[6]}%"
+        )
+
+    def format_transaction(self, number, tx):
+        return (
+            f"Transaction ID: {number}, From: {tx[0]}, To: {tx[1]}, Produced: {tx[2]} kWh, Consumed: {tx[3]} kWh, "
+            f"Tokens: {self.client.web3.from_wei(tx[4], 'ether')}, Timestamp: {tx[5]}"
+        )
+
+    def refresh_manager_data(self, replace=False):
+        self.tasks.submit("manager_data", self.fetch_manager_data, on_success=self.show_manager_data,
+                          on_error=self.manager_data_failed, replace=replace)
+
+    def fetch_manager_data(self):
+        # Only the counts and the first page of each list are read up front
+        page_size = self.panel_model.loader.page_size
+        accounts, panel_count, panels = self.client.panels(self.user_address, True, 0, page_size)
+        _, transaction_count, transactions = self.client.history(self.user_address, True, 0, page_size)
+        return accounts, panel_count, panels, transaction_count, transactions
+
+    def show_manager_data(self, result):
+        self.manager_data = result
+        self.manager_data_stale = False
+        if not self.panel_search_field.text().strip():
+            self.show_all_panels()
+        if not self.transaction_search_field.text().strip():
+            self.show_all_transactions()
+        self.tasks.submit("manager_search_index", self.client.search_indexes, result[0],
+                          on_success=self.set_search_indexes,
+                          on_error=lambda e: logging.error(f"Error building the search index: {e}"), replace=True)
+
+    def show_all_panels(self):
+        if self.manager_data_stale:
+            self.refresh_manager_data(replace=True)
+            return
+        accounts, panel_count, panels, _, _ = self.manager_data
+        indexer = self.client.indexer
+        self.panel_model.load(panel_count, lambda offset, limit: indexer.get_panels(accounts, offset, limit), panels)
 
-    def refresh_manager_data(self):
-        self.panel_list.clear()
-        self.transaction_list.clear()
+    def show_all_transactions(self):
+        if self.manager_data_stale:
+            self.refresh_manager_data(replace=True)
+            return
+        accounts, _, _, transaction_count, transactions = self.manager_data
+        indexer = self.client.indexer
+        self.transaction_model.load(transaction_count,
+                                    lambda offset, limit: indexer.get_transactions(accounts, offset, limit),
+                                    transactions)
+
+    def show_manager_changes(self, changes, panels, panel_count, transaction_count):
+        if self.user_address in changes.users:
+            # The manager's list of users changed, so every view covers different accounts now
+            self.refresh_manager_data(replace=True)
+            return
+        if self.manager_data is None or not (panels or transaction_count is not None):
+            return
 
-        try:
-            panels = contract.functions.displayManagedPanels().call({'from': self.user_address})
-            for panel in panels:
-                item_text = (
-                    f"Panel ID: {panel[0]}, Capacity: {panel[1]} kWh, Location: {panel[2]}, "
-                    f"Energy Balance: {panel[5]} kWh, Efficiency: {panel[6]}%"
-                )
-                item = QListWidgetItem(item_text)
-                font = QFont("Arial", 11)  # Set the font size to 11 points
-                item.setFont(font)
-                self.panel_list.addItem(item)
-
-            transactions = contract.functions.displayManagedTransactions().call({'from': self.user_address})
-            for i, tx in enumerate(transactions):
-                item_text = (
-                    f"Transaction ID: {i}, From: {tx[0]}, To: {tx[1]}, Produced: {tx[2]} kWh, Consumed: {tx[3]} kWh, "
-                    f"Tokens: {web3.from_wei(tx[4], 'ether')}, Timestamp: {tx[5]}"
-                )
-                item = QListWidgetItem(item_text)
-                font = QFont("Arial", 11)  # Set the font size to 11 points
-                item.setFont(font)
-                self.transaction_list.addItem(item)
-        except Exception as e:
-            logging.error(f"Error refreshing manager data: {e}")
-            self.panel_list.addItem("Failed to load panels")
-            self.transaction_list.addItem("Failed to load transactions")
+        # Lists showing everything are patched in place; searches are re-run once the indexes are rebuilt
+        if not self.panel_search_field.text().strip():
+            for (owner, panel_id), panel in panels.items():
+                self.panel_model.update_row(lambda row: row[PANEL_OWNER] == owner and row[PANEL_ID] == panel_id, panel)
+            if panel_count is not None:
+                self.panel_model.grow(panel_count)
+        if transaction_count is not None and not self.transaction_search_field.text().strip():
+            self.transaction_model.grow(transaction_count)
+
+        # The first pages kept for when a search is cleared are out of date now
+        self.manager_data_stale = True
+        self.tasks.submit("manager_search_index", self.client.search_indexes, self.manager_data[0],
+                          on_success=self.set_search_indexes,
+                          on_error=lambda e: logging.error(f"Error building the search index: {e}"), replace=True)
+
+    def export_or_cancel(self):
+        if self.export_cancel is not None:
+            self.export_cancel.set()
+            return
+        kind, ok = QInputDialog.getItem(self, "Export", "What to export:", ["Transactions", "Panels"], 0, False)
+        if not ok:
+            return
+        path, selected_filter = QFileDialog.getSaveFileName(self, "Export", f"lumin_{kind.lower()}.csv",
+                                                            ";;".join(EXPORT_FILTERS))
+        if not path:
+            return
+        if not os.path.splitext(path)[1]:
+            path += EXPORT_FILTERS.get(selected_filter, ".csv")
+
+        self.export_cancel = threading.Event()
+        self.export_button.setText("Cancel Export")
+        self.export_progress.setRange(0, 0)  # Busy until the row count arrives with the first chunk
+        self.export_progress.setVisible(True)
+        self.tasks.submit("export", export, self.client, self.user_address, kind.lower(), path, None, True,
+                          DEFAULT_CHUNK_SIZE, lambda written, total: self.export_signal.fired.emit((written, total)),
+                          self.export_cancel,
+                          on_success=lambda written: self.export_done(written, path), on_error=self.export_failed)
+
+    def show_export_progress(self, progress):
+        written, total = progress
+        self.export_progress.setRange(0, max(total, 1))
+        self.export_progress.setValue(written)
+        self.export_progress.setFormat(f"{written} of {total} rows")
+
+    def export_finished(self):
+        self.export_cancel = None
+        self.export_button.setText("Export...")
+        self.export_progress.setVisible(False)
+
+    def export_done(self, written, path):
+        self.export_finished()
+        QMessageBox.information(self, "Export Complete", f"Exported {written} rows to {path}.")
+
+    def export_failed(self, e):
+        self.export_finished()
+        if isinstance(e, ExportCancelled):
+            self.status_bar.showMessage("Export cancelled", 5000)
+            return
+        logging.error(f"Error exporting: {e}")
+        QMessageBox.critical(self, "Export Failed", f"An error occurred while exporting: {str(e)}")
+
+    def manager_data_failed(self, e):
+        logging.error(f"Error refreshing manager data: {e}")
+        self.panel_model.set_message("Failed to load panels")
+        self.transaction_model.set_message("Failed to load transactions")
+
+    def set_search_indexes(self, indexes):
+        self.panel_index, self.transaction_index = indexes
+        # Re-run searches typed while the indexes were being rebuilt
+        if self.panel_search_field.text().strip():
+            self.search_panel()
+        if self.transaction_search_field.text().strip():
+            self.search_transaction()
 
     def search_panel(self):
-        panel_id = self.panel_search_field.text().strip()
-        self.panel_list.clear()
+        text = self.panel_search_field.text().strip()
+        if not text:
+            if self.manager_data is not None:
+                self.show_all_panels()
+            return
+        if self.panel_index is None:
+            self.panel_model.set_message("Loading search index...")
+            return
 
         try:
-            panels = contract.functions.displayManagedPanels().call({'from': self.user_address})
-            found = False
-            for panel in panels:
-                if str(panel[0]) == panel_id:
-                    item_text = (
-                        f"Panel ID: {panel[0]}, Capacity: {panel[1]} kWh, Location: {panel[2]}, "
-                        f"Energy Balance: {panel[5]} kWh, Efficiency: {panel[6]}%"
-                    )
-                    item = QListWidgetItem(item_text)
-                    font = QFont("Arial", 11)  # Set the font size to 11 points
-                    item.setFont(font)
-                    self.panel_list.addItem(item)
-                    found = True
-                    break
-
-            if not found:
-                self.panel_list.addItem("Panel not found")
-        except Exception as e:
-            logging.error(f"Error searching for panel: {e}")
-            self.panel_list.addItem("Failed to search panel")
+            found = self.panel_index.search(text)
+        except ValueError as e:
+            self.panel_model.set_message(f"Invalid search: {e}")
+            return
+        if found:
+            self.panel_model.set_rows(found)
+        else:
+            self.panel_model.set_message("Panel not found")
 
     def search_transaction(self):
-        transaction_index = self.transaction_search_field.text().strip()
-        self.transaction_list.clear()
+        text = self.transaction_search_field.text().strip()
+        if not text:
+            if self.manager_data is not None:
+                self.show_all_transactions()
+            return
+        if self.transaction_index is None:
+            self.transaction_model.set_message("Loading search index...")
+            return
 
         try:
-            transactions = contract.functions.displayManagedTransactions().call({'from': self.user_address})
-            if transaction_index.isdigit():
-                index = int(transaction_index)
-                if 0 <= index < len(transactions):
-                    tx = transactions[index]
-                    item_text = (
-                        f"Transaction ID: {index}, From: {tx[0]}, To: {tx[1]}, Produced: {tx[2]} kWh, Consumed: {tx[3]} kWh, "
-                        f"Tokens: {web3.from_wei(tx[4], 'ether')}, Timestamp: {tx[5]}"
-                    )
-                    item = QListWidgetItem(item_text)
-                    font = QFont("Arial", 11)  # Set the font size to 11 points
-                    item.setFont(font)
-                    self.transaction_list.addItem(item)
-                else:
-                    self.transaction_list.addItem("Transaction not found")
-            else:
-                self.transaction_list.addItem("Invalid transaction index")
-        except Exception as e:
-            logging.error(f"Error searching for transaction: {e}")
-            self.transaction_list.addItem("Failed to search transaction")
+            numbers, found = self.transaction_index.search(text)
+        except ValueError as e:
+            self.transaction_model.set_message(f"Invalid search: {e}")
+            return
+        if found:
+            self.transaction_model.set_rows(found, numbers=numbers)
+        else:
+            self.transaction_model.set_message("Transaction not found")
 
     def create_dashboard_and_user_info_tab(self):
         dashboard_tab = QWidget()
@@ -316,16 +534,13 @@ class SolarEnergySystem(QMainWindow):
             # Set font size
             font = QFont("Arial", 11)
 
-            # Fetch user details from the contract
-            user = contract.functions.users(self.user_address).call()
-
-            # Display user's name
-            self.name_label = QLabel(user[1] if user[1] else "N/A")  # user[1] is actualName
+            # Display user's name, filled in once the user details arrive from the contract
+            self.name_label = QLabel("Loading...")
             self.name_label.setFont(font)  # Set font
             user_info_form_layout.addRow("Name", self.name_label)
 
             user_info_form_layout.setVerticalSpacing(5)
-            self.balance_label = QLabel(f"{web3.from_wei(web3.eth.get_balance(self.user_address), 'ether')} ETH")
+            self.balance_label = QLabel("Loading...")
             self.balance_label.setFont(font)  # Set font
             user_info_form_layout.addRow("Balance", self.balance_label)
 
@@ -342,9 +557,6 @@ class SolarEnergySystem(QMainWindow):
             self.panel_dropdown.setFixedWidth(200)
             user_info_form_layout.addRow("Select Panel", self.panel_dropdown)
 
-            # Refresh panel info to include capacity and energy balance
-            self.refresh_panel_info()
-
             # Add the "Panel Info" label
             user_info_form_layout.addRow("Panel Info", self.panel_info_label)
 
@@ -361,10 +573,6 @@ class SolarEnergySystem(QMainWindow):
             # Handle panel selection changes
             self.panel_dropdown.currentIndexChanged.connect(self.display_selected_panel_info)
 
-            # Display info for the default/first panel when loaded
-            if self.panel_dropdown.count() > 0:
-                self.display_selected_panel_info()
-
         except Exception as e:
             logging.error(f"Error fetching user information: {e}")
             self.name_label = QLabel("N/A")
@@ -398,13 +606,96 @@ class SolarEnergySystem(QMainWindow):
         main_layout.addLayout(image_layout)  # Add the centered image to the main layout
 
         dashboard_tab.setLayout(main_layout)
-        self.tabs.addTab(dashboard_tab, "Dashboard & User Info")
+        return dashboard_tab
+
+    def refresh_dashboard(self):
+        # Fill every tab of the user window from a single request to the node
+        self.tasks.submit("dashboard", self.fetch_dashboard, on_success=self.show_dashboard,
+                          on_error=self.dashboard_failed)
+
+    def fetch_dashboard(self):
+        return self.client.dashboard(self.user_address, self.history_model.loader.page_size)
+
+    def show_dashboard(self, result):
+        user_info, panels, sales, history = result
+        self.show_user_info(user_info)
+        self.show_panel_info(panels)
+        self.show_offers(sales)
+        self.show_history(history)
+
+    def dashboard_failed(self, e):
+        self.user_info_failed(e)
+        self.panel_info_failed(e)
+        self.offers_failed(e)
+        self.history_failed(e)
+
+    def show_user_changes(self, changes, sales, panels, panel_count, transaction_count):
+        # Every changed sale is moved to its row in the current order, found in the order book instead of by
+        # scanning the list; a filtered list is rebuilt from the book instead
+        order, descending = self.offer_order
+        in_place = self.offer_bounds == {} and self.offer_model.loader.message is None
+        for sale_id, sale in sales.items():
+            if not in_place:
+                self.order_book.apply(sale_id, sale)
+                continue
+            old_position = self.order_book.position(sale_id, order, descending)
+            self.order_book.apply(sale_id, sale)
+            position = self.order_book.position(sale_id, order, descending)
+            if old_position is not None and old_position == position:
+                self.offer_model.update_row_at(position, sale)
+                continue
+            if old_position is not None:
+                self.offer_model.remove_row_at(old_position)
+            if position is not None:
+                self.offer_model.insert_row(position, sale)
+        if sales:
+            if self.offer_bounds:
+                self.show_order_book()
+            else:
+                self.show_best_offer()
 
-    def refresh_panel_info(self):
+        if panels:
+            if panel_count is not None and panel_count != self.panel_dropdown.count():
+                self.refresh_panel_info(replace=True)
+            else:
+                self.update_panel_dropdown(panels)
+        if transaction_count is not None:
+            self.history_model.grow(transaction_count)
+        if self.user_address in changes.accounts:
+            self.refresh_balance()  # Energy was bought or sold, so ETH changed hands
+
+    def update_panel_dropdown(self, panels):
+        # Only the first panel with an id changes, like in the contract
+        seen = set()
+        for index in range(self.panel_dropdown.count()):
+            panel_id = self.panel_dropdown.itemData(index)[PANEL_ID]
+            panel = panels.get((self.user_address, panel_id)) if panel_id not in seen else None
+            seen.add(panel_id)
+            if panel is not None:
+                self.panel_dropdown.setItemData(index, panel)
+                if index == self.panel_dropdown.currentIndex():
+                    self.display_selected_panel_info()
+
+    def show_user_info(self, result):
+        user, balance = result
+        self.name_label.setText(user[1] if user[1] else "N/A")  # user[1] is actualName
+        self.balance_label.setText(f"{balance} ETH")
+
+    def user_info_failed(self, e):
+        logging.error(f"Error fetching user information: {e}")
+        self.name_label.setText("N/A")
+        self.balance_label.setText("N/A")
+
+    def refresh_panel_info(self, replace=False):
+        self.tasks.submit("panels", self.fetch_panels, on_success=self.show_panel_info,
+                          on_error=self.panel_info_failed, replace=replace)
+
+    def fetch_panels(self):
+        # Bring the local index up to date and read the panels associated with the user from it
+        return self.client.panels(self.user_address, self.is_manager)[2]
+
+    def show_panel_info(self, panels):
         try:
-            # Fetch panels associated with the user
-            panels = contract.functions.displayPanels().call({'from': self.user_address})
-
             # Clear existing items
             self.panel_dropdown.clear()
 
@@ -423,8 +714,11 @@ class SolarEnergySystem(QMainWindow):
             else:
                 self.panel_info_label.setText("No Panels Registered")
         except Exception as e:
-            logging.error(f"Error fetching panel information: {e}")
-            self.panel_info_label.setText("N/A")
+            self.panel_info_failed(e)
+
+    def panel_info_failed(self, e):
+        logging.error(f"Error fetching panel information: {e}")
+        self.panel_info_label.setText("N/A")
 
     def display_selected_panel_info(self):
         panel_data = self.panel_dropdown.currentData()
@@ -470,12 +764,12 @@ class SolarEnergySystem(QMainWindow):
         buy_and_sell_tab = QWidget()
         layout = QVBoxLayout()
 
-        # Add the exchange rate label with a larger font size
-        exchange_rate_label = QLabel("The price of converting 1 Solar Energy (SEG) to ETH is ETH0.071015 today.")
+        # Add the exchange rate label with a larger font size, filled in from the market analytics
+        self.exchange_rate_label = QLabel("Loading the price of solar energy...")
         font_large = QFont("Arial", 11)  # Set font size to 11
-        exchange_rate_label.setFont(font_large)  # Apply larger font size
-        exchange_rate_label.setStyleSheet("font-weight: bold; color: black;")
-        layout.addWidget(exchange_rate_label)
+        self.exchange_rate_label.setFont(font_large)  # Apply larger font size
+        self.exchange_rate_label.setStyleSheet("font-weight: bold; color: black;")
+        layout.addWidget(self.exchange_rate_label)
 
         # Buy Section with bold font
         buy_section_label = QLabel("Buy Energy")
@@ -483,21 +777,21 @@ class SolarEnergySystem(QMainWindow):
         buy_section_label.setFont(font)  # Apply bold font
         layout.addWidget(buy_section_label)
 
-        self.offer_list = QListWidget()
+        self.best_offer_label = QLabel()
+        self.best_offer_label.setFont(font)
+        layout.addWidget(self.best_offer_label)
+        self.show_best_offer()
 
-        try:
-            sales = contract.functions.getAvailableEnergySales().call()
-            for sale in sales:
-                item_text = (
-                    f"Seller: {sale[0]}, Amount: {sale[2]} kWh, Price: {web3.from_wei(sale[3], 'ether')} ETH")
-                item = QListWidgetItem(item_text)
-                font = QFont("Arial", 11)  # Set the font size to 11 points
-                item.setFont(font)
-                self.offer_list.addItem(item)
+        self.offer_filter_field = QLineEdit()
+        self.offer_filter_field.setFont(font)
+        self.offer_filter_field.setPlaceholderText("Filter Offers: amount:100.. (kWh), price:..0.01 (ETH per kWh)")
+        self.offer_filter_field.textChanged.connect(self.filter_offers)
+        layout.addWidget(self.offer_filter_field)
 
-        except Exception as e:
-            logging.error(f"Error fetching available energy sales: {e}")
-            self.offer_list.addItem("Failed to load offers")
+        # Offers are kept as raw sale tuples and only formatted for the rows on screen
+        self.offer_list = TimedListView("offers")
+        self.offer_list.setUniformItemSizes(True)
+        self.offer_list.setModel(self.offer_model)
 
         layout.addWidget(self.offer_list)
 
@@ -517,6 +811,12 @@ class SolarEnergySystem(QMainWindow):
         buy_button.clicked.connect(self.buy_energy)
         button_layout.addWidget(buy_button)
 
+        best_price_button = QPushButton("Buy at Best Price")
+        best_price_button.setFixedSize(250, 30)
+        best_price_button.setFont(font_button)
+        best_price_button.clicked.connect(self.buy_best_price)
+        button_layout.addWidget(best_price_button)
+
         layout.addLayout(button_layout)
 
         # Separator
@@ -530,8 +830,8 @@ class SolarEnergySystem(QMainWindow):
         layout.addWidget(sell_section_label)
 
         self.sell_amount = QDoubleSpinBox()
-        self.sell_amount.setDecimals(2)  # Allow up to 2 decimal places
-        self.sell_amount.setMaximum(9999.99)  # Adjust the maximum value as needed
+        self.sell_amount.setDecimals(0)  # Energy is sold in whole kWh
+        self.sell_amount.setMaximum(9999)  # Adjust the maximum value as needed
         self.sell_amount.setSuffix(" kWh")
         self.sell_amount.setFont(font_button)  # Apply the font to the sell amount spin box
         layout.addWidget(self.sell_amount)
@@ -550,198 +850,257 @@ class SolarEnergySystem(QMainWindow):
         layout.addWidget(sell_button)
 
         buy_and_sell_tab.setLayout(layout)
-        self.tabs.addTab(buy_and_sell_tab, "Buy & Sell Energy")
+
+        # The price shown is the measured market average
+        if self.analytics_report is not None:
+            self.show_exchange_rate()
+        self.refresh_analytics()
+        return buy_and_sell_tab
 
     def sort_offers(self):
-        options = [
-            "Lowest Price to Highest",
-            "Highest Price to Lowest",
-            "Lowest Amount to Highest",
-            "Highest Amount to Lowest"
-        ]
+        # Re-orders the order book already held; nothing is fetched from the node
+        options = list(OFFER_SORT_OPTIONS)
         sort_option, ok = QInputDialog.getItem(self, "Sort Offers", "Sort by:", options, 0, False)
 
         if ok and sort_option:
-            self.offer_list.clear()
-
-            try:
-                sales = contract.functions.getAvailableEnergySales().call()
-
-                if sort_option == "Lowest Price to Highest":
-                    sorted_sales = sorted(sales, key=lambda x: x[3])
-                elif sort_option == "Highest Price to Lowest":
-                    sorted_sales = sorted(sales, key=lambda x: x[3], reverse=True)
-                elif sort_option == "Lowest Amount to Highest":
-                    sorted_sales = sorted(sales, key=lambda x: x[2])
-                elif sort_option == "Highest Amount to Lowest":
-                    sorted_sales = sorted(sales, key=lambda x: x[2], reverse=True)
-
-                for sale in sorted_sales:
-                    item_text = (
-                        f"Seller: {sale[0]}, Amount: {sale[2]} kWh, Price: {web3.from_wei(sale[3], 'ether')} ETH")
-                    item = QListWidgetItem(item_text)
-                    font = QFont("Arial", 11)  # Set the font size to 11 points
-                    item.setFont(font)
-                    self.offer_list.addItem(item)
-            except Exception as e:
-                logging.error(f"Error sorting offers: {e}")
-                self.offer_list.addItem("Failed to sort offers")
+            self.offer_order = OFFER_SORT_OPTIONS[sort_option]
+            self.show_order_book()
 
-    def buy_energy(self):
+    def filter_offers(self):
         try:
-            sale_index = self.offer_list.currentRow()
-            if sale_index < 0:
-                QMessageBox.warning(self, "No Selection", "Please select an energy offer to purchase.")
-                return
-
-            # Fetch the selected sale
-            sales = contract.functions.getAvailableEnergySales().call()
-            selected_sale = sales[sale_index]
-
-            # Check if the logged-in user is the same as the seller
-            if selected_sale[1] == self.user_address:
-                QMessageBox.warning(self, "Invalid Purchase", "You cannot buy energy from yourself.")
-                return
-
-            # Calculate the total price based on the amount
-            amount = selected_sale[2]
-            total_price = selected_sale[3] * amount // selected_sale[2]
-
-            # Execute the purchase transaction and send the corresponding amount of ETH
-            tx_hash = contract.functions.buyEnergy(sale_index, int(amount)).transact({
-                'from': self.user_address,
-                'value': int(total_price)  # Send ETH equal to the calculated price
-            })
-            web3.eth.wait_for_transaction_receipt(tx_hash)
-            QMessageBox.information(self, "Purchase Successful", "Energy purchased successfully!")
-
-            # Refresh the balance label to update the user's ETH balance
-            self.refresh_balance()
-
-            # After purchase, prompt the user to allocate energy to panels
-            self.allocate_energy(int(amount))
-
-            # Refresh the offers list, dashboard, and history after purchase
-            self.refresh_offers()
-            self.refresh_panel_info()
-            self.refresh_history()
+            self.offer_bounds = parse_filter(self.offer_filter_field.text())
+        except ValueError as e:
+            self.offer_bounds = None
+            self.offer_model.set_message(f"Invalid filter: {e}")
+            return
+        self.show_order_book()
 
-        except Exception as e:
-            logging.error(f"Error buying energy: {e}")
-            QMessageBox.critical(self, "Purchase Failed",
-                                 f"An error occurred while trying to purchase energy: {str(e)}")
+    def buy_energy(self):
+        # Sales are addressed by their stable id, so sorting or other buyers cannot shift the selection
+        selected_sale = self.offer_model.row_data(self.offer_list.currentIndex().row())
+        if selected_sale is None:
+            QMessageBox.warning(self, "No Selection", "Please select an energy offer to purchase.")
+            return
+
+        if self.tasks.is_running("buy_energy"):
+            self.status_bar.showMessage("A purchase is already being processed...")
+            return
+
+        self.status_bar.showMessage("Submitting purchase...")
+        self.tasks.submit("buy_energy", self.client.buy, self.user_address, selected_sale[SALE_ID], on_success=self.purchase_done,
+                          on_error=self.purchase_failed)
+
+    def buy_best_price(self):
+        # Buy an amount of energy across as many offers as needed, cheapest first, in one transaction
+        if self.tasks.is_running("buy_energy"):
+            self.status_bar.showMessage("A purchase is already being processed...")
+            return
+
+        amount, ok = QInputDialog.getInt(self, "Buy at Best Price", "Energy to buy (kWh):", 1, 1, 1000000000)
+        if not ok:
+            return
+        max_price, ok = QInputDialog.getDouble(self, "Buy at Best Price",
+                                               "Highest price per kWh in ETH (0 for no limit):", 0, 0, 1000000, 6)
+        if not ok:
+            return
+        max_unit_price = self.client.web3.to_wei(max_price, 'ether') if max_price > 0 else None
+
+        self.status_bar.showMessage("Finding the best offers...")
+        self.tasks.submit("plan_order", self.client.plan_order, self.user_address, amount, max_unit_price,
+                          on_success=self.confirm_order,
+                          on_error=self.purchase_failed, replace=True)
+
+    def confirm_order(self, plan):
+        self.status_bar.clearMessage()
+        if not plan.fills:
+            QMessageBox.information(self, "No Matching Offers", "No offers match the requested price.")
+            return
+
+        from_wei = self.client.web3.from_wei
+        lines = [f"{sale[0]}: {take} kWh for {from_wei(cost, 'ether')} ETH" for sale, take, cost in plan.fills[:10]]
+        if len(plan.fills) > 10:
+            lines.append(f"... and {len(plan.fills) - 10} more offers")
+        if plan.filled < plan.amount:
+            lines.append(f"Only {plan.filled} of the {plan.amount} kWh requested are available.")
+        lines.append(f"Total: {plan.filled} kWh for {from_wei(plan.cost, 'ether')} ETH")
+        reply = QMessageBox.question(self, "Confirm Purchase", "\n".join(lines), QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+
+        self.status_bar.showMessage("Submitting order...")
+        self.tasks.submit("buy_energy", self.client.submit_order, self.user_address, plan, on_success=self.purchase_done,
+                          on_error=self.purchase_failed)
+
+    def purchase_done(self, amount):
+        self.status_bar.clearMessage()
+        if amount is None:
+            QMessageBox.warning(self, "Invalid Purchase", "You cannot buy energy from yourself.")
+            return
+
+        QMessageBox.information(self, "Purchase Successful", "Energy purchased successfully!")
+
+        # Refresh the balance label to update the user's ETH balance
+        self.refresh_balance()
+
+        # After purchase, prompt the user to allocate energy to panels
+        self.allocate_energy(int(amount))
+
+        # Refresh the offers list, dashboard, and history after purchase
+        self.refresh_offers(replace=True)
+        self.refresh_panel_info(replace=True)
+        self.refresh_history(replace=True)
+
+    def purchase_failed(self, e):
+        self.status_bar.clearMessage()
+        logging.error(f"Error buying energy: {e}")
+        QMessageBox.critical(self, "Purchase Failed",
+                             f"An error occurred while trying to purchase energy: {str(e)}")
+        self.refresh_offers(replace=True)  # The offer may have been sold or changed in the meantime
 
     def refresh_balance(self):
-        try:
-            # Update the balance label with the current balance
-            balance = web3.from_wei(web3.eth.get_balance(self.user_address), 'ether')
-            self.balance_label.setText(f"{balance} ETH")
-        except Exception as e:
-            logging.error(f"Error refreshing balance: {e}")
+        self.tasks.submit("balance", self.client.balance, self.user_address, on_success=self.show_balance,
+                          on_error=lambda e: logging.error(f"Error refreshing balance: {e}"), replace=True)
+
+    def show_balance(self, balance):
+        # Update the balance label with the current balance
+        self.balance_label.setText(f"{balance} ETH")
+
+    def refresh_offers(self, replace=False):
+        self.tasks.submit("offers", self.client.offers, on_success=self.show_offers,
+                          on_error=self.offers_failed, replace=replace)
+
+    def format_offer(self, number, sale):
+        return (f"Seller: {sale[0]}, Amount: {sale[2]} kWh, Price: {self.client.web3.from_wei(sale[3], 'ether')} ETH "
+                f"({eth_per_kwh(sale):.6g} ETH/kWh)")
+
+    def show_offers(self, sales):
+        self.order_book = OrderBook(sales)
+        self.show_order_book()
+
+    def show_order_book(self):
+        # The offers in the chosen order, narrowed down by the filter
+        if self.offer_bounds is None:
+            return  # The filter field shows why it is invalid
+        order, descending = self.offer_order
+        if self.offer_bounds:
+            sales = self.order_book.query(order=order, descending=descending, **self.offer_bounds)
+            if not sales:
+                self.offer_model.set_message("No offers match the filter")
+        else:
+            sales = self.order_book.ordered(order, descending)
+        if sales or not self.offer_bounds:
+            self.offer_model.set_rows(sales)
+        self.show_best_offer()
 
-    def refresh_offers(self):
-        self.offer_list.clear()
-        try:
-            sales = contract.functions.getAvailableEnergySales().call()
-            for sale in sales:
-                item_text = (
-                    f"Seller: {sale[0]}, Amount: {sale[2]} kWh, Price: {web3.from_wei(sale[3], 'ether')} ETH")
-                item = QListWidgetItem(item_text)
-                font = QFont("Arial", 11)  # Set the font size to 11 points
-                item.setFont(font)
-                self.offer_list.addItem(item)
-        except Exception as e:
-            logging.error(f"Error fetching available energy sales: {e}")
-            self.offer_list.addItem("Failed to load offers")
+    def show_best_offer(self):
+        if self.best_offer_label is None:
+            return
+        sale = self.order_book.best(self.user_address)
+        if sale is None:
+            self.best_offer_label.setText("Best offer: none")
+        else:
+            self.best_offer_label.setText(f"Best offer: {eth_per_kwh(sale):.6g} ETH/kWh from {sale[0]}, {sale[2]} kWh")
+
+    def offers_failed(self, e):
+        logging.error(f"Error fetching available energy sales: {e}")
+        self.offer_model.set_message("Failed to load offers")
 
     def allocate_energy(self, amount):
-        try:
-            panels = contract.functions.displayPanels().call({'from': self.user_address})
-            if len(panels) == 0:
-                QMessageBox.warning(self, "No Panels", "You do not have any panels to allocate energy to.")
-                return
-
-            for panel in panels:
-
-                panel_id = panel[0]
-                panel_name = f"Panel {panel_id} at {panel[2]}"
-                panel_capacity = panel[1]
-                panel_energy_balance = panel[5]  # Assuming this is the current energy balance of the panel
-                remaining_capacity = panel_capacity - panel_energy_balance
-                max_allocatable_energy = min(amount, remaining_capacity)
-                energy_to_allocate, ok = QInputDialog.getDouble(self, f"Allocate Energy to {panel_name}",
-                                                                f"How much energy (kWh) do you want to allocate to {panel_name}? (Max: {max_allocatable_energy} kWh)",
-                                                                min=0, max=max_allocatable_energy)
-                if ok and energy_to_allocate > 0:
-                    # Convert panel_id and energy_to_allocate to the correct type
-                    panel_id = int(panel_id)
-                    energy_to_allocate = int(energy_to_allocate)
-
-                    # Call the allocateEnergyToPanel function with the correct types
-                    tx_hash = contract.functions.allocateEnergyToPanel(panel_id, energy_to_allocate).transact(
-                        {'from': self.user_address})
-                    web3.eth.wait_for_transaction_receipt(tx_hash)
-                    amount -= energy_to_allocate
-                    if amount <= 0:
-                        break
-
-            if amount > 0:
-                QMessageBox.information(self, "Unallocated Energy", f"{amount} kWh could not be allocated.")
-
-            # Refresh the panel info after allocation
-            self.refresh_panel_info()
+        self.tasks.submit("allocate_panels", self.fetch_panels,
+                          on_success=lambda panels: self.preview_allocation(panels, amount),
+                          on_error=self.allocation_failed, replace=True)
 
-        except Exception as e:
-            logging.error(f"Error allocating energy: {e}")
-            QMessageBox.critical(self, "Allocation Failed", f"An error occurred while allocating energy: {str(e)}")
+    def preview_allocation(self, panels, amount):
+        if len(panels) == 0:
+            QMessageBox.warning(self, "No Panels", "You do not have any panels to allocate energy to.")
+            return
+
+        strategy, ok = QInputDialog.getItem(self, "Allocate Energy",
+                                            f"How should {amount} kWh be split across your panels?",
+                                            STRATEGIES, 0, False)
+        if not ok:
+            return
+
+        # Show the whole plan once and send it as a single transaction
+        allocations, unallocated = plan_allocation(panels, amount, strategy)
+        if not allocations:
+            QMessageBox.information(self, "Unallocated Energy", f"Your panels have no room for the {amount} kWh.")
+            return
+        lines = [f"Panel {panel_id}: {energy} kWh" for panel_id, energy in allocations[:20]]
+        if len(allocations) > 20:
+            lines.append(f"... and {len(allocations) - 20} more panels")
+        if unallocated > 0:
+            lines.append(f"{unallocated} kWh do not fit in your panels.")
+        reply = QMessageBox.question(self, "Confirm Allocation", "\n".join(lines), QMessageBox.Yes | QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+
+        self.status_bar.showMessage("Allocating energy...")
+        self.tasks.submit("allocate_energy", self.client.allocate, self.user_address, allocations,
+                          on_success=lambda _: self.allocation_done(unallocated), on_error=self.allocation_failed)
+
+    def allocation_done(self, amount):
+        self.status_bar.clearMessage()
+        if amount > 0:
+            QMessageBox.information(self, "Unallocated Energy", f"{amount} kWh could not be allocated.")
+
+        # Refresh the panel info after allocation
+        self.refresh_panel_info(replace=True)
+
+    def allocation_failed(self, e):
+        self.status_bar.clearMessage()
+        logging.error(f"Error allocating energy: {e}")
+        QMessageBox.critical(self, "Allocation Failed", f"An error occurred while allocating energy: {str(e)}")
 
     def sell_energy(self):
-        try:
-            amount = self.sell_amount.value()
-            price = self.sell_price.value()
+        amount = self.sell_amount.value()
+        price = self.sell_price.value()
 
-            if amount <= 0 or price <= 0:
-                QMessageBox.warning(self, "Invalid Inputs", "Please enter valid amounts for energy and price.")
-                return
+        if amount <= 0 or price <= 0:
+            QMessageBox.warning(self, "Invalid Inputs", "Please enter valid amounts for energy and price.")
+            return
 
-            # Get user panels
-            panels = contract.functions.displayPanels().call({'from': self.user_address})
-            if len(panels) == 0:
-                QMessageBox.warning(self, "No Panels", "You do not have any panels to sell energy from.")
-                return
+        # Get user panels
+        self.tasks.submit("sell_panels", self.fetch_panels,
+                          on_success=lambda panels: self.choose_sale_panel(panels, amount, price),
+                          on_error=self.sale_failed, replace=True)
 
-            # Allow user to select a panel
-            panel_items = [f"Panel ID: {panel[0]} at {panel[2]}" for panel in panels]
-            panel_choice, ok = QInputDialog.getItem(self, "Select Panel", "Choose a panel to sell energy from:",
-                                                    panel_items, 0, False)
-            if not ok or not panel_choice:
-                return
+    def choose_sale_panel(self, panels, amount, price):
+        if len(panels) == 0:
+            QMessageBox.warning(self, "No Panels", "You do not have any panels to sell energy from.")
+            return
 
-            selected_panel_index = panel_items.index(panel_choice)
-            selected_panel = panels[selected_panel_index]
+        # Allow user to select a panel
+        panel_items = [f"Panel ID: {panel[0]} at {panel[2]}" for panel in panels]
+        panel_choice, ok = QInputDialog.getItem(self, "Select Panel", "Choose a panel to sell energy from:",
+                                                panel_items, 0, False)
+        if not ok or not panel_choice:
+            return
 
-            if amount > selected_panel[5]:  # Check if the selected panel has enough energy
-                QMessageBox.warning(self, "Insufficient Energy",
-                                    f"The selected panel only has {selected_panel[5]} kWh available.")
-                return
+        selected_panel_index = panel_items.index(panel_choice)
+        selected_panel = panels[selected_panel_index]
 
-            # Post the energy for sale
-            tx_hash = contract.functions.postEnergyForSale(int(amount), web3.to_wei(price, 'ether')).transact(
-                {'from': self.user_address})
-            web3.eth.wait_for_transaction_receipt(tx_hash)
+        if amount > selected_panel[5]:  # Check if the selected panel has enough energy
+            QMessageBox.warning(self, "Insufficient Energy",
+                                f"The selected panel only has {selected_panel[5]} kWh available.")
+            return
 
-            # Here, instead of trying to modify the tuple, you could directly call a contract function to adjust the balance
-            contract.functions.reduceEnergyBalance(selected_panel[0], int(amount)).transact({'from': self.user_address})
+        self.status_bar.showMessage("Posting energy sale...")
+        self.tasks.submit("sell_energy", self.client.sell, self.user_address, selected_panel[0], amount, price,
+                          on_success=self.sale_done, on_error=self.sale_failed)
 
-            QMessageBox.information(self, "Sale Successful", "Energy sale posted successfully!")
+    def sale_done(self, _):
+        self.status_bar.clearMessage()
+        QMessageBox.information(self, "Sale Successful", "Energy sale posted successfully!")
 
-            # Refresh the buy tab to show the new offer
-            self.refresh_offers()
-            self.refresh_panel_info()
+        # Refresh the buy tab to show the new offer
+        self.refresh_offers(replace=True)
+        self.refresh_panel_info(replace=True)
 
-        except Exception as e:
-            logging.error(f"Error selling energy: {e}")
-            QMessageBox.critical(self, "Sale Failed", f"An error occurred while trying to sell energy: {str(e)}")
+    def sale_failed(self, e):
+        self.status_bar.clearMessage()
+        logging.error(f"Error selling energy: {e}")
+        QMessageBox.critical(self, "Sale Failed", f"An error occurred while trying to sell energy: {str(e)}")
 
     def create_history_tab(self):
         history_tab = QWidget()
@@ -750,64 +1109,212 @@ class SolarEnergySystem(QMainWindow):
         # Set a larger font size
         font = QFont("Arial", 11)
 
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(5)
-        self.history_table.setHorizontalHeaderLabels(["Transaction ID", "Type", "Amount", "Price", "Timestamp"])
+        # The history is loaded page by page as the table is scrolled
+        self.history_table = TimedTableView("history")
+        self.history_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)  # Rows are never measured one by one
+        self.history_table.setModel(self.history_model)
         self.history_table.setFont(font)  # Apply the font to the table
         self.history_table.horizontalHeader().setFont(font)  # Apply the font to the table headers
         layout.addWidget(self.history_table)
 
-        self.refresh_history()
-
         refresh_button = QPushButton("Refresh History")
         refresh_button.setFont(font)  # Apply the font to the button
         refresh_button.clicked.connect(self.refresh_history)
         layout.addWidget(refresh_button)
 
         history_tab.setLayout(layout)
-        self.tabs.addTab(history_tab, "History")
+        return history_tab
+
+    def format_history_cell(self, number, tx, column):
+        if column == 0:
+            return str(number)  # Assuming transaction ID is index
+        if column == 1:
+            return "Produced" if tx[2] > 0 else "Consumed"
+        if column == 2:
+            return str(tx[2] if tx[2] > 0 else tx[3])
+        if column == 3:
+            return str(self.client.web3.from_wei(tx[4], 'ether'))
+        return str(tx[5])
+
+    def refresh_history(self, replace=False):
+        self.tasks.submit("history", self.fetch_history, on_success=self.show_history,
+                          on_error=self.history_failed, replace=replace)
+
+    def fetch_history(self):
+        # Only the count and the first page are read up front
+        return self.client.history(self.user_address, self.is_manager, 0, self.history_model.loader.page_size)
+
+    def show_history(self, result):
+        accounts, count, transactions = result
+        indexer = self.client.indexer
+        self.history_model.load(count, lambda offset, limit: indexer.get_transactions(accounts, offset, limit),
+                                transactions)
+
+    def history_failed(self, e):
+        logging.error(f"Error fetching transaction history: {e}")
+        QMessageBox.critical(self, "History Fetch Failed", "An error occurred while fetching transaction history.")
+
+    def create_analytics_tab(self):
+        analytics_tab = QWidget()
+        layout = QVBoxLayout()
 
-    def refresh_history(self):
-        try:
-            transactions = contract.functions.displayTransactions().call({'from': self.user_address})
-            self.history_table.setRowCount(len(transactions))
-            for i, tx in enumerate(transactions):
-                # Set a larger font size for each item
-                font = QFont("Arial", 11)
-
-                item_id = QTableWidgetItem(str(i))
-                item_id.setFont(font)
-                self.history_table.setItem(i, 0, item_id)  # Assuming transaction ID is index
-
-                item_type = QTableWidgetItem("Produced" if tx[2] > 0 else "Consumed")
-                item_type.setFont(font)
-                self.history_table.setItem(i, 1, item_type)
-
-                item_amount = QTableWidgetItem(str(tx[2] if tx[2] > 0 else tx[3]))
-                item_amount.setFont(font)
-                self.history_table.setItem(i, 2, item_amount)
-
-                item_price = QTableWidgetItem(str(web3.from_wei(tx[4], 'ether')))
-                item_price.setFont(font)
-                self.history_table.setItem(i, 3, item_price)
-
-                item_timestamp = QTableWidgetItem(str(tx[5]))
-                item_timestamp.setFont(font)
-                self.history_table.setItem(i, 4, item_timestamp)
-        except Exception as e:
-            logging.error(f"Error fetching transaction history: {e}")
-            QMessageBox.critical(self, "History Fetch Failed", "An error occurred while fetching transaction history.")
+        font = QFont("Arial", 11)
+        bold_font = QFont("Arial", 11, QFont.Bold)
+
+        self.market_label = QLabel("Loading market prices...")
+        self.market_label.setFont(bold_font)
+        self.market_label.setWordWrap(True)
+        layout.addWidget(self.market_label)
+
+        self.production_label = QLabel()
+        self.production_label.setFont(font)
+        self.production_label.setWordWrap(True)
+        layout.addWidget(self.production_label)
+
+        # Per-panel figures over every indexed reading; yields are kWh produced per kW of capacity per day
+        self.analytics_model = PagedTableModel(self.tasks, "analytics_page",
+                                               ["Owner", "Panel ID", "Capacity", "Efficiency", "Days", "Produced",
+                                                "Consumed", "Daily Yield", "Yield Trend"],
+                                               self.format_analytics_cell)
+        self.analytics_table = TimedTableView("analytics")
+        self.analytics_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.analytics_table.setModel(self.analytics_model)
+        self.analytics_table.setFont(font)
+        self.analytics_table.horizontalHeader().setFont(font)
+        layout.addWidget(self.analytics_table)
+
+        refresh_button = QPushButton("Refresh Analytics")
+        refresh_button.setFont(font)
+        refresh_button.clicked.connect(self.refresh_analytics)
+        layout.addWidget(refresh_button)
+
+        analytics_tab.setLayout(layout)
+
+        if self.analytics_report is not None:
+            self.show_market_analytics()
+        self.refresh_analytics()
+        return analytics_tab
+
+    def format_analytics_cell(self, number, row, column):
+        name, panel_id, capacity, efficiency, days, produced, consumed, mean_yield, trend = row
+        if column == 0:
+            return name
+        if column == 1:
+            return str(panel_id)
+        if column == 2:
+            return f"{capacity:g} kW"
+        if column == 3:
+            return f"{efficiency:g}%"
+        if column == 4:
+            return str(days)
+        if column == 5:
+            return f"{produced:g} kWh"
+        if column == 6:
+            return f"{consumed:g} kWh"
+        if column == 7:
+            return f"{mean_yield:.2f}"
+        return f"{trend:+.3f}/day"
+
+    def refresh_analytics(self, replace=False):
+        self.tasks.submit("analytics", self.fetch_analytics, on_success=self.show_analytics,
+                          on_error=self.analytics_failed, replace=replace)
+
+    def fetch_analytics(self):
+        # Owner names are looked up here so the table never reads the index from the GUI thread
+        report = self.client.analytics(self.user_address, self.is_manager)
+        names = {}
+        for panel in report['panels']:
+            if panel[0] not in names:
+                user = self.client.indexer.get_user(panel[0])
+                names[panel[0]] = user[0] if user else panel[0]
+        report['panels'] = [(names[panel[0]],) + tuple(panel[1:]) for panel in report['panels']]
+        return report
+
+    def show_analytics(self, report):
+        # Only the tabs built so far are filled; the others use the report when they are opened
+        self.analytics_report = report
+        if self.exchange_rate_label is not None:
+            self.show_exchange_rate()
+        if self.market_label is not None:
+            self.show_market_analytics()
+
+    def current_market(self):
+        # The last day's trades, or every trade when there were none; prices are in wei per kWh
+        recent, overall = self.analytics_report['market'], self.analytics_report['market_all']
+        return (recent, True) if recent['vwap'] is not None else (overall, False)
+
+    def show_exchange_rate(self):
+        market, is_recent = self.current_market()
+        if market['vwap'] is None:
+            self.exchange_rate_label.setText("No solar energy has been traded yet.")
+        else:
+            when = "today" if is_recent else "on average so far"
+            self.exchange_rate_label.setText(
+                f"The price of 1 kWh of solar energy is ETH{market['vwap'] / 1e18:.6f} {when}.")
+
+    def show_market_analytics(self):
+        report = self.analytics_report
+        market, is_recent = self.current_market()
+        if market['vwap'] is None:
+            self.market_label.setText("No energy has been traded yet.")
+        else:
+            low, median, high = (market['percentiles'][p] / 1e18 for p in (10, 50, 90))
+            span = "the last 24 hours" if is_recent else "all trades so far"
+            self.market_label.setText(
+                f"Over {span}: {market['trades']} trades of {market['energy']:g} kWh at ETH{market['vwap'] / 1e18:.6f} "
+                f"per kWh on average (median ETH{median:.6f}, 10th-90th percentile ETH{low:.6f}-ETH{high:.6f})")
+
+        series = report['series']
+        produced = sum(step[1] for step in series)
+        consumed = sum(step[2] for step in series)
+        text = f"Metered over {len(series)} days: {produced:g} kWh produced, {consumed:g} kWh consumed."
+        if series:
+            text += f" Latest day: {series[-1][1]:g} kWh produced, {series[-1][2]:g} kWh consumed."
+        if report['manager'] is not None:
+            users, _, _, sold, bought, earned, spent = report['manager']
+            text += (f" Your {users} users sold {sold:g} kWh for ETH{earned / 1e18:.6f} and bought {bought:g} kWh "
+                     f"for ETH{spent / 1e18:.6f}.")
+        self.production_label.setText(text)
+        self.analytics_model.load(len(report['panels']), None, report['panels'])
+
+    def analytics_failed(self, e):
+        logging.error(f"Error computing analytics: {e}")
+        if self.market_label is not None:
+            self.market_label.setText("Market prices are not available.")
+            self.analytics_model.load(0, None)
+        if self.exchange_rate_label is not None:
+            self.exchange_rate_label.setText("The price of solar energy is not available.")
+
+
+def connect_client():
+    # Imported here rather than at the top so web3 is only loaded once the login window is up
+    from client import LuminClient
+    return LuminClient.connect(rpc_urls, contract_address, abi_file_path, index_db_path, ws_url=ws_url,
+                               abi_cache_dir=abi_cache_dir)
 
 
 if __name__ == "__main__":
+    # Contract calls, the local index and transactions all go through the GUI-free client in client.py. It connects
+    # in the background once the login window is shown; a node that cannot be reached is reported at login.
+    client = LazyClient(connect_client)
+
+    if trace_log_path is not None:
+        metrics.enable_trace(trace_log_path)
+    if metrics_port is not None:
+        try:
+            serve_metrics(metrics_port)
+        except OSError as e:
+            logging.error(f"Metrics endpoint not started on port {metrics_port}: {e}")
+
     app = QApplication(sys.argv)
 
     while True:
-        login_window = LoginWindow()
+        login_window = LoginWindow(client)
+        QTimer.singleShot(0, client.warm_up)  # Once the window is up
         if login_window.exec_() == QDialog.Accepted:
             user_address = login_window.user_address  # Retrieve the logged-in user's address from the login window
             is_manager = login_window.manager
-            main_window = SolarEnergySystem(user_address=user_address, is_manager=is_manager)
+            main_window = SolarEnergySystem(client, user_address=user_address, is_manager=is_manager)
             main_window.show()
             app.exec_()  # Start the application's event loop after login
         else:
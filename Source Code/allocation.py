@@ -0,0 +1,60 @@
+from fractions import Fraction
+
+from event_sync import PANEL_ID, PANEL_CAPACITY, PANEL_BALANCE, PANEL_EFFICIENCY
+
+# Splits purchased energy across a user's panels so it can be sent as one allocateEnergyBatch transaction. No panel
+# is given more than its remaining capacity (capacity - energyBalance); the split is either proportional to that
+# remaining capacity or to the panels' efficiency.
+
+BY_CAPACITY = "By remaining capacity"
+BY_EFFICIENCY = "By efficiency"
+STRATEGIES = [BY_CAPACITY, BY_EFFICIENCY]
+
+
+def split(amount, weights, caps):
+    # Whole kWh shares proportional to weights and never above caps; what a capped panel cannot take is spread over
+    # the others, and rounding leftovers go to the largest fractional shares
+    shares = [0] * len(weights)
+    remaining = amount
+    active = [i for i in range(len(weights)) if caps[i] > 0 and weights[i] > 0]
+    while remaining > 0 and active:
+        total_weight = sum(weights[i] for i in active)
+        exact = {i: Fraction(remaining * weights[i], total_weight) for i in active}
+        given = {i: min(int(exact[i]), caps[i] - shares[i]) for i in active}
+        leftover = remaining - sum(given.values())
+        for i in sorted(active, key=lambda i: (-(exact[i] - int(exact[i])), i)):
+            if leftover == 0:
+                break
+            if shares[i] + given[i] < caps[i]:
+                given[i] += 1
+                leftover -= 1
+
+        handed_out = sum(given.values())
+        if handed_out == 0:
+            break
+        for i, share in given.items():
+            shares[i] += share
+        remaining -= handed_out
+        active = [i for i in active if shares[i] < caps[i]]
+    return shares
+
+
+def plan_allocation(panels, amount, strategy=BY_CAPACITY):
+    # Returns ([(panel id, kWh)], kWh left over) for rows laid out like the Panel struct
+    # The contract always updates the first panel with an id, so later duplicates cannot receive energy
+    reachable = []
+    seen = set()
+    for panel in panels:
+        if panel[PANEL_ID] not in seen:
+            seen.add(panel[PANEL_ID])
+            reachable.append(panel)
+
+    caps = [max(panel[PANEL_CAPACITY] - panel[PANEL_BALANCE], 0) for panel in reachable]
+    if strategy == BY_EFFICIENCY:
+        weights = [panel[PANEL_EFFICIENCY] for panel in reachable]
+    else:
+        weights = caps
+    shares = split(int(amount), weights, caps)
+
+    allocations = [(panel[PANEL_ID], share) for panel, share in zip(reachable, shares) if share > 0]
+    return allocations, int(amount) - sum(shares)
@@ -0,0 +1,249 @@
+import threading
+import time
+
+import numpy as np
+
+# Energy and market analytics over the local chain index. Every indexed transaction row is loaded once into columnar
+# NumPy arrays and later refreshes only append the rows added since, so per-panel production and consumption series,
+# yield trends, VWAP and unit price percentiles and per-manager totals are a few vectorised passes over months of
+# history instead of Python loops over every row. Addresses and (owner, panel id) pairs are stored as small integer
+# codes; a reorg or index rebuild (ChainIndexer.generation) reloads everything.
+#
+# Energy is in kWh and capacities in kW as in the contract, prices and token amounts in wei.
+
+DAY = 86400
+
+# Unit price percentiles reported for the market
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# Starting capacity of the row columns; they double whenever they fill up
+INITIAL_ROWS = 1024
+
+
+class Codes:
+    # Dense integer code for every distinct key, in order of first appearance
+    def __init__(self):
+        self.codes = {}
+        self.keys = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def code(self, key):
+        code = self.codes.get(key)
+        if code is None:
+            code = self.codes[key] = len(self.keys)
+            self.keys.append(key)
+        return code
+
+    def lookup(self, keys):
+        # Codes of the keys seen so far; unknown keys are left out
+        return np.array([self.codes[key] for key in keys if key in self.codes], dtype=np.int64)
+
+
+class Columns:
+    # Append-only table of equally long NumPy columns
+    def __init__(self, dtypes):
+        self.dtypes = dtypes
+        self.size = 0
+        self.arrays = {name: np.empty(INITIAL_ROWS, dtype) for name, dtype in dtypes.items()}
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.size]
+
+    def append(self, **columns):
+        count = len(next(iter(columns.values())))
+        needed = self.size + count
+        capacity = len(next(iter(self.arrays.values())))
+        if needed > capacity:
+            capacity = max(needed, capacity * 2)
+            for name, array in self.arrays.items():
+                grown = np.empty(capacity, self.dtypes[name])
+                grown[:self.size] = array[:self.size]
+                self.arrays[name] = grown
+        for name, values in columns.items():
+            self.arrays[name][self.size:needed] = values
+        self.size = needed
+
+    def clear(self):
+        self.size = 0
+
+
+class AnalyticsEngine:
+    def __init__(self, indexer, bucket=DAY):
+        self.indexer = indexer
+        self.bucket = bucket  # Width of a time series step in seconds
+        self.lock = threading.Lock()
+        self.generation = None  # Index generation the columns were loaded from
+        self.last_rowid = 0
+        self.accounts = Codes()  # address
+        self.panel_codes = Codes()  # (owner address, panel id)
+        self.rows = Columns({
+            'account': np.int64,
+            'panel': np.int64,  # Panel code of a metered row, -1 for trades
+            'produced': np.float64,
+            'consumed': np.float64,
+            'tokens': np.float64,
+            'timestamp': np.int64,
+            'trade': np.bool_,
+        })
+        # Per panel code; panels are few and their totals change in place, so they are reloaded on every refresh
+        self.panel_owner = np.empty(0, np.int64)
+        self.capacity = np.empty(0, np.float64)
+        self.efficiency = np.empty(0, np.float64)
+        self.listed = np.empty(0, np.bool_)  # Whether the index still has the panel
+        # (manager code, user code) of every assignment
+        self.assignments = np.empty((2, 0), np.int64)
+
+    def refresh(self):
+        # Load the rows indexed since the last refresh; returns how many were added
+        with self.lock:
+            generation = self.indexer.generation
+            if generation != self.generation:
+                self.rows.clear()
+                self.last_rowid = 0
+            rows = self.indexer.get_transaction_columns(self.last_rowid)
+            if rows:
+                rowids, accounts, panels, produced, consumed, tokens, timestamps, trades = zip(*rows)
+                self.rows.append(
+                    account=[self.accounts.code(account) for account in accounts],
+                    panel=[-1 if panel is None else self.panel_codes.code((account, panel))
+                           for account, panel in zip(accounts, panels)],
+                    produced=produced, consumed=consumed, tokens=[float(amount) for amount in tokens],
+                    timestamp=timestamps, trade=trades)
+                self.last_rowid = rowids[-1]
+            self.generation = generation
+            self.load_panels()
+            self.load_assignments()
+            return len(rows)
+
+    def load_panels(self):
+        panels = self.indexer.get_panel_columns()
+        for owner, panel_id, capacity, produced, consumed, efficiency in panels:
+            self.panel_codes.code((owner, panel_id))
+        size = len(self.panel_codes)
+        self.panel_owner = np.array([self.accounts.code(owner) for owner, panel_id in self.panel_codes.keys],
+                                    dtype=np.int64)
+        self.capacity = np.zeros(size)
+        self.efficiency = np.zeros(size)
+        self.listed = np.zeros(size, np.bool_)
+        # Reversed so the first panel with an id wins, like the contract's updates
+        for owner, panel_id, capacity, produced, consumed, efficiency in reversed(panels):
+            code = self.panel_codes.codes[(owner, panel_id)]
+            self.capacity[code] = capacity
+            self.efficiency[code] = efficiency
+            self.listed[code] = True
+
+    def load_assignments(self):
+        pairs = [(self.accounts.code(manager), self.accounts.code(user))
+                 for manager, user in self.indexer.get_manager_assignments()]
+        self.assignments = np.array(pairs, dtype=np.int64).reshape(-1, 2).T
+
+    def market(self, since=None):
+        # Volume weighted average and percentiles of the unit price (wei per kWh) of the trades since a timestamp.
+        # Every trade is indexed once for the buyer and once for the seller; the seller's row is used.
+        rows = self.rows
+        mask = rows['trade'] & (rows['produced'] > 0)
+        if since is not None:
+            mask &= rows['timestamp'] >= since
+        energy = rows['produced'][mask]
+        tokens = rows['tokens'][mask]
+        result = {'trades': int(mask.sum()), 'energy': float(energy.sum()), 'volume': float(tokens.sum()),
+                  'vwap': None, 'percentiles': {}}
+        if result['energy'] > 0:
+            result['vwap'] = result['volume'] / result['energy']
+            unit_prices = tokens / energy
+            result['percentiles'] = dict(zip(PERCENTILES, np.percentile(unit_prices, PERCENTILES).tolist()))
+        return result
+
+    def series(self, codes):
+        # Metered production and consumption of the accounts per time bucket: (bucket start, produced, consumed)
+        rows = self.rows
+        mask = ~rows['trade'] & np.isin(rows['account'], codes)
+        buckets, inverse = np.unique(rows['timestamp'][mask] // self.bucket, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        produced = np.bincount(inverse, rows['produced'][mask], len(buckets))
+        consumed = np.bincount(inverse, rows['consumed'][mask], len(buckets))
+        return list(zip((buckets * self.bucket).tolist(), produced.tolist(), consumed.tolist()))
+
+    def panel_stats(self, codes):
+        # Per panel of the accounts: (owner, panel id, capacity, rated efficiency, active buckets, produced, consumed,
+        # mean yield, yield trend). Yield is the energy produced in a bucket per kW of capacity; the trend is the least
+        # squares slope of that yield per bucket, negative when the panel is degrading.
+        rows = self.rows
+        size = len(self.panel_codes)
+        mask = ~rows['trade'] & np.isin(rows['account'], codes) & (rows['panel'] >= 0)
+        panel = rows['panel'][mask]
+        bucket = rows['timestamp'][mask] // self.bucket
+        if len(panel):
+            pairs, inverse = np.unique(np.stack([panel, bucket]), axis=1, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            pairs, inverse = np.empty((2, 0), np.int64), np.empty(0, np.int64)
+        produced = np.bincount(inverse, rows['produced'][mask], pairs.shape[1])
+        consumed = np.bincount(inverse, rows['consumed'][mask], pairs.shape[1])
+
+        group = pairs[0]
+        capacity = self.capacity[group]
+        yields = np.divide(produced, capacity, out=np.zeros(len(produced)), where=capacity > 0)
+        x = (pairs[1] - pairs[1].min()).astype(np.float64) if len(group) else np.zeros(0)  # Centred for precision
+        n = np.bincount(group, minlength=size).astype(np.float64)
+        sum_x = np.bincount(group, x, size)
+        sum_y = np.bincount(group, yields, size)
+        sum_xx = np.bincount(group, x * x, size)
+        sum_xy = np.bincount(group, x * yields, size)
+        denominator = n * sum_xx - sum_x * sum_x
+        trend = np.divide(n * sum_xy - sum_x * sum_y, denominator, out=np.zeros(size), where=denominator > 0)
+        mean_yield = np.divide(sum_y, n, out=np.zeros(size), where=n > 0)
+        total_produced = np.bincount(group, produced, size)
+        total_consumed = np.bincount(group, consumed, size)
+
+        selected = np.flatnonzero(self.listed & np.isin(self.panel_owner, codes))
+        keys = self.panel_codes.keys
+        return [(keys[code][0], keys[code][1], self.capacity[code].item(), self.efficiency[code].item(),
+                 int(n[code]), total_produced[code].item(), total_consumed[code].item(), mean_yield[code].item(),
+                 trend[code].item()) for code in selected.tolist()]
+
+    def account_totals(self):
+        # Per account code: metered produced, metered consumed, energy sold, energy bought, wei earned, wei spent
+        rows = self.rows
+        size = len(self.accounts)
+        account = rows['account']
+        trade = rows['trade']
+        produced = rows['produced']
+        consumed = rows['consumed']
+        sold = trade & (produced > 0)
+        bought = trade & (consumed > 0)
+        return np.stack([
+            np.bincount(account, np.where(trade, 0.0, produced), size),
+            np.bincount(account, np.where(trade, 0.0, consumed), size),
+            np.bincount(account, np.where(sold, produced, 0.0), size),
+            np.bincount(account, np.where(bought, consumed, 0.0), size),
+            np.bincount(account, np.where(sold, rows['tokens'], 0.0), size),
+            np.bincount(account, np.where(bought, rows['tokens'], 0.0), size),
+        ])
+
+    def manager_totals(self):
+        # manager address -> (users, produced, consumed, sold, bought, earned, spent) summed over their users
+        managers, users = self.assignments
+        size = len(self.accounts)
+        totals = self.account_totals()
+        per_manager = np.stack([np.bincount(managers, minlength=size)] +
+                               [np.bincount(managers, column[users], size) for column in totals])
+        return {self.accounts.keys[code]: (int(per_manager[0, code]),) + tuple(per_manager[1:, code].tolist())
+                for code in np.unique(managers).tolist()}
+
+    def report(self, accounts, manager=None, window=DAY):
+        # Everything the analytics views show for the accounts; manager adds that manager's totals
+        with self.lock:
+            codes = self.accounts.lookup(accounts)
+            return {
+                'market': self.market(time.time() - window),
+                'market_all': self.market(),
+                'series': self.series(codes),
+                'panels': self.panel_stats(codes),
+                'manager': self.manager_totals().get(manager) if manager is not None else None,
+            }
@@ -0,0 +1,181 @@
+import itertools
+import requests
+from hexbytes import HexBytes
+from web3._utils.abi import map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+
+from event_sync import canonical_type
+from metrics import metrics
+from provider_pool import ProviderPool
+
+# Collects several JSON-RPC reads (contract view calls, balances, blocks, logs) and sends them to the node as one
+# JSON-RPC batch, so building a window costs a single HTTP round-trip however many reads it needs. Results are
+# decoded the same way web3's call() does and handed back through PendingResult objects.
+
+
+class BatchRequestError(Exception):
+    pass
+
+
+class PendingResult:
+    def __init__(self, method, formatter):
+        self.method = method
+        self.formatter = formatter
+        self.done = False
+        self.value = None
+        self.error = None
+
+    @property
+    def result(self):
+        if not self.done:
+            raise BatchRequestError(f"{self.method} has not been executed yet")
+        if self.error is not None:
+            raise BatchRequestError(f"{self.method} failed: {self.error}")
+        return self.value
+
+
+class BatchReader:
+    ids = itertools.count()
+
+    def __init__(self, web3, session=None, timeout=30):
+        self.web3 = web3
+        self.session = session
+        self.timeout = timeout
+        self.requests = []  # (id, method, params, pending)
+
+    def __len__(self):
+        return len(self.requests)
+
+    def request(self, method, params, formatter=None):
+        pending = PendingResult(method, formatter)
+        self.requests.append((next(self.ids), method, params, pending))
+        return pending
+
+    def call(self, contract_function, transaction=None, block_identifier='latest'):
+        # Queue an eth_call of a contract view; the result matches contract_function.call()
+        call = {'to': contract_function.address, 'data': contract_function._encode_transaction_data()}
+        if transaction and 'from' in transaction:
+            call['from'] = transaction['from']
+        output_types = [canonical_type(output) for output in contract_function.abi['outputs']]
+        function = contract_function.fn_name
+        metrics.inc("lumin_contract_calls_total", function=function, via="batch")
+
+        def decode(raw):
+            with metrics.timed("lumin_abi_decode_seconds", function=function):
+                decoded = self.web3.codec.decode(output_types, HexBytes(raw))
+                normalized = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, decoded)
+            return normalized[0] if len(normalized) == 1 else list(normalized)
+
+        return self.request("eth_call", [call, block_param(block_identifier)], decode)
+
+    def balance(self, address, block_identifier='latest'):
+        return self.request("eth_getBalance", [address, block_param(block_identifier)], to_int)
+
+    def block_number(self):
+        return self.request("eth_blockNumber", [], to_int)
+
+    def get_block(self, block_identifier):
+        return self.request("eth_getBlockByNumber", [block_param(block_identifier), False], format_block)
+
+    def receipt(self, tx_hash):
+        # None while the transaction is still pending
+        if not isinstance(tx_hash, str):
+            tx_hash = '0x' + bytes(tx_hash).hex()
+        return self.request("eth_getTransactionReceipt", [tx_hash], format_receipt)
+
+    def get_logs(self, log_filter):
+        params = dict(log_filter)
+        if isinstance(params.get('address'), str):
+            params['address'] = [params['address']]  # As web3's get_logs sends it, which its middlewares expect
+        for key in ('fromBlock', 'toBlock'):
+            if key in params:
+                params[key] = block_param(params[key])
+        return self.request("eth_getLogs", [params], lambda logs: [format_log(log) for log in logs])
+
+    def execute(self):
+        if not self.requests:
+            return
+        queued, self.requests = self.requests, []
+
+        provider = self.web3.provider
+        endpoint = getattr(provider, 'endpoint_uri', None)
+        if endpoint is not None or isinstance(provider, ProviderPool):
+            payload = [{'jsonrpc': '2.0', 'id': request_id, 'method': method, 'params': params}
+                       for request_id, method, params, _ in queued]
+            if isinstance(provider, ProviderPool):
+                # A ProviderPool picks the endpoint and retries on another one if it fails. Other providers' own
+                # make_batch_request (web3's HTTPProvider has one) take (method, params) pairs, so they are not used.
+                body = provider.send_batch(payload)
+            else:
+                session = self.session or requests
+                response = session.post(str(endpoint), json=payload, timeout=self.timeout)
+                response.raise_for_status()
+                body = response.json()
+            if isinstance(body, dict):
+                # Nodes answer a rejected batch with one error object instead of a list
+                raise BatchRequestError(f"Batch request rejected: {body.get('error')}")
+            responses = {item.get('id'): item for item in body}
+        else:
+            # Providers without an HTTP endpoint (e.g. eth-tester) get the same requests one at a time, through web3's
+            # middlewares since their raw make_request does not take JSON-RPC parameters (eth-tester wants from_block)
+            responses = {request_id: self.request_one(method, params) for request_id, method, params, _ in queued}
+
+        for request_id, method, params, pending in queued:
+            response = responses.get(request_id)
+            pending.done = True
+            if response is None:
+                pending.error = "no response"
+            elif response.get('error') is not None:
+                pending.error = response['error']
+            else:
+                result = response.get('result')
+                pending.value = pending.formatter(result) if pending.formatter and result is not None else result
+
+    def request_one(self, method, params):
+        # A failed request only fails its own result, like an error entry in a batch response. eth-tester raises its
+        # own exceptions where a node would answer with a JSON-RPC error, e.g. for logs past the head.
+        try:
+            return {'result': self.web3.manager.request_blocking(method, params)}
+        except Exception as e:
+            return {'error': str(e)}
+
+
+def block_param(block_identifier):
+    if isinstance(block_identifier, int):
+        return hex(block_identifier)
+    return block_identifier
+
+
+def to_int(value):
+    return int(value, 16) if isinstance(value, str) else value
+
+
+def format_block(block):
+    return {'number': to_int(block['number']), 'hash': HexBytes(block['hash']),
+            'timestamp': to_int(block['timestamp'])}
+
+
+def format_log(log):
+    # Raw logs have hex strings everywhere; event.process_log expects ints and bytes like web3's get_logs
+    return {
+        'address': log['address'],
+        'topics': [HexBytes(topic) for topic in log['topics']],
+        'data': HexBytes(log['data']),
+        'blockNumber': to_int(log['blockNumber']),
+        'blockHash': HexBytes(log['blockHash']),
+        'transactionHash': HexBytes(log['transactionHash']),
+        'transactionIndex': to_int(log['transactionIndex']),
+        'logIndex': to_int(log['logIndex']),
+    }
+
+
+def format_receipt(receipt):
+    # The fields the client reads, with logs formatted so contract events can process_receipt() them
+    return {
+        'transactionHash': HexBytes(receipt['transactionHash']),
+        'blockNumber': to_int(receipt['blockNumber']),
+        'blockHash': HexBytes(receipt['blockHash']),
+        'status': to_int(receipt.get('status', '0x1')),
+        'gasUsed': to_int(receipt['gasUsed']),
+        'logs': [format_log(log) for log in receipt['logs']],
+    }
@@ -0,0 +1,297 @@
+import argparse
+import collections
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# End-to-end benchmark of the client against a freshly deployed EnergyManagement contract. A local chain (ganache over
+# JSON-RPC, or py-evm in process through eth-tester) is seeded with synthetic market data: N users under one manager,
+# M panels per user, T meter readings (transaction records) and K open sales, all from a fixed random seed. The
+# client's key paths are then timed as the GUI and service.py use them, and the gas used by every contract function is
+# recorded. Results are written as JSON so runs on different commits can be compared.
+#
+#   truffle compile
+#   ganache --wallet.totalAccounts 60 --miner.blockGasLimit 30000000 &
+#   python benchmarks/bench_chain.py --users 50 --panels 4 --sales 200 --transactions 2000 --json after.json
+#   python benchmarks/bench_chain.py --tester --users 20 --json after.json --compare before.json
+#
+# The artifact must come from the current contracts/Lumin.sol (truffle compile), since the contract is deployed from
+# its bytecode. The chain needs one funded, unlocked account per user plus one for the manager.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Readings per recordReadings transaction while seeding
+READINGS_PER_TX = 50
+PAGE_SIZE = 200
+CASES = ["index_cold_sync", "login", "dashboard", "offers_sorted", "history", "manager_dashboard", "buy", "sell",
+         "allocate"]
+
+
+def connect(args):
+    from web3 import Web3
+
+    if args.tester:
+        from eth_tester import EthereumTester, PyEVMBackend
+        from web3.providers.eth_tester import EthereumTesterProvider
+
+        backend = PyEVMBackend(genesis_state=PyEVMBackend.generate_genesis_state(num_accounts=args.users + 1))
+        return Web3(EthereumTesterProvider(EthereumTester(backend)))
+
+    from provider_pool import ProviderPool
+    return Web3(ProviderPool([args.rpc]))
+
+
+def deploy(web3, artifact_path, deployer):
+    with open(artifact_path, 'r') as artifact_file:
+        artifact = json.load(artifact_file)
+    names = {entry.get('name') for entry in artifact['abi'] if entry['type'] == 'function'}
+    missing = {"addressOfUsername", "matchOrder", "allocateEnergyBatch", "recordReadings"} - names
+    if missing or not artifact.get('bytecode'):
+        sys.exit(f"{artifact_path} is out of date (missing {', '.join(sorted(missing)) or 'bytecode'}), "
+                 f"run `truffle compile` first")
+    factory = web3.eth.contract(abi=artifact['abi'], bytecode=artifact['bytecode'])
+    receipt = web3.eth.wait_for_transaction_receipt(factory.constructor().transact({'from': deployer}))
+    return web3.eth.contract(address=receipt['contractAddress'], abi=artifact['abi']), receipt['gasUsed']
+
+
+def record_gas(pipeline, gas):
+    # Collect gasUsed per contract function from every receipt the client's pipeline resolves
+    track = pipeline.track
+
+    def tracked(tx_hash, function="unknown"):
+        future = track(tx_hash, function)
+        future.add_done_callback(lambda done: gas[function].append(done.result()['gasUsed'])
+                                 if done.exception() is None else None)
+        return future
+    pipeline.track = tracked
+
+
+def seed(client, manager, users, args, rng):
+    # Sends everything through the client's pipeline, many transactions in flight at once
+    contract = client.contract
+    pipeline = client.pipeline
+    password_hash = client.web3.keccak
+
+    def wait(futures):
+        for future in futures:
+            future.result()
+
+    wait([pipeline.send(contract.functions.register(f"user{i}", f"User {i}", password_hash(text=f"pass{i}"), False),
+                        {'from': user}) for i, user in enumerate(users)])
+    wait([pipeline.send(contract.functions.registerManagerWithUsers("manager", "Manager", password_hash(text="pass"),
+                                                                    users), {'from': manager})])
+
+    # Panels start half full so readings, sales and allocations all have room either way
+    futures = []
+    for user in users:
+        for panel_id in range(1, args.panels + 1):
+            capacity = rng.randrange(5000, 20000)
+            futures.append(pipeline.send(contract.functions.addPanelToUser(
+                user, panel_id, capacity, f"Site {rng.randrange(100)}", capacity // 2, 0, rng.randrange(50, 100)),
+                {'from': manager}))
+    wait(futures)
+
+    # Alternating +1/-1 kWh readings leave every balance where it was
+    futures = []
+    remaining = args.transactions
+    turn = 0
+    while remaining > 0:
+        user = users[turn % len(users)]
+        count = min(READINGS_PER_TX, remaining)
+        panel_ids = [rng.randrange(1, args.panels + 1) for _ in range(count)]
+        deltas = [1 if i % 2 == 0 else -1 for i in range(count)]
+        futures.append(pipeline.send(contract.functions.recordReadings(panel_ids, deltas), {'from': user}))
+        remaining -= count
+        turn += 1
+    wait(futures)
+
+    futures = []
+    for i in range(args.sales):
+        energy = rng.randrange(1, 50)
+        unit_price = rng.randrange(1, 100) * 10 ** 14
+        futures.append(pipeline.send(contract.functions.postEnergyForSale(energy, energy * unit_price),
+                                     {'from': users[i % len(users)]}))
+    wait(futures)
+
+
+def time_case(client, fn, repeat):
+    # Each run starts with an empty view cache, as after a new block, so the index sync and node reads are included
+    samples = []
+    for run in range(repeat):
+        client.view_cache.invalidate()
+        start = time.perf_counter()
+        fn(run)
+        samples.append(time.perf_counter() - start)
+    return {
+        "runs": len(samples),
+        "min_ms": round(min(samples) * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def run_cases(client, manager, users, args):
+    from allocation import BY_CAPACITY
+    from event_sync import SALE_ID, SALE_SELLER_ADDRESS
+
+    user = users[0]
+    buyer = users[-1]
+    timings = {}
+
+    timings["index_cold_sync"] = time_case(client, lambda run: client.sync(), 1)
+    timings["login"] = time_case(client, lambda run: client.login("user0", "pass0"), args.repeat)
+    timings["dashboard"] = time_case(client, lambda run: client.dashboard(user, PAGE_SIZE), args.repeat)
+    timings["offers_sorted"] = time_case(client, lambda run: client.offers("price"), args.repeat)
+    timings["history"] = time_case(client, lambda run: client.history(user, False, 0, PAGE_SIZE), args.repeat)
+
+    def manager_dashboard(run):
+        client.panels(manager, True, 0, PAGE_SIZE)
+        client.history(manager, True, 0, PAGE_SIZE)
+    timings["manager_dashboard"] = time_case(client, manager_dashboard, args.repeat)
+
+    def buy(run):
+        # The cheapest offer someone else posted, as a user picking from the sorted list would
+        sale = next(sale for sale in client.offers("price") if sale[SALE_SELLER_ADDRESS] != buyer)
+        client.buy(buyer, sale[SALE_ID])
+    timings["buy"] = time_case(client, buy, args.repeat)
+
+    timings["sell"] = time_case(client, lambda run: client.sell(user, 1, 1, 0.0001), args.repeat)
+
+    def allocate(run):
+        allocations, _ = client.plan_allocation(user, args.panels, BY_CAPACITY)
+        client.allocate(user, allocations)
+    timings["allocate"] = time_case(client, allocate, args.repeat)
+    return timings
+
+
+def summarize_gas(gas):
+    return {function: {"count": len(used), "mean": round(statistics.fmean(used)), "min": min(used), "max": max(used)}
+            for function, used in sorted(gas.items())}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance, gas_tolerance):
+    # Prints the change of every median time and mean gas; returns the names of the regressions
+    regressions = []
+    print(f"\n{'case':>18} {'before (ms)':>12} {'after (ms)':>11} {'change':>8}")
+    for case, timing in results["timings"].items():
+        before = baseline.get("timings", {}).get(case)
+        if before is None or not before["median_ms"]:
+            continue
+        change = timing["median_ms"] / before["median_ms"] - 1
+        flag = " !" if change > tolerance else ""
+        print(f"{case:>18} {before['median_ms']:>12.1f} {timing['median_ms']:>11.1f} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(case)
+
+    print(f"\n{'function':>26} {'gas before':>11} {'gas after':>10} {'change':>8}")
+    for function, used in results["gas"].items():
+        before = baseline.get("gas", {}).get(function)
+        if before is None or not before["mean"]:
+            continue
+        change = used["mean"] / before["mean"] - 1
+        flag = " !" if change > gas_tolerance else ""
+        print(f"{function:>26} {before['mean']:>11} {used['mean']:>10} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(f"gas:{function}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the client's key paths against a seeded local chain")
+    parser.add_argument("--rpc", default="http://127.0.0.1:8545", help="JSON-RPC endpoint of a local chain")
+    parser.add_argument("--tester", action="store_true", help="Use an in-process py-evm chain instead of --rpc")
+    parser.add_argument("--abi", default="build/contracts/EnergyManagement.json",
+                        help="Truffle artifact with the ABI and bytecode")
+    parser.add_argument("--users", type=int, default=20, help="Users under the manager (N)")
+    parser.add_argument("--panels", type=int, default=4, help="Panels per user (M)")
+    parser.add_argument("--sales", type=int, default=100, help="Open sales (K)")
+    parser.add_argument("--transactions", type=int, default=1000, help="Meter readings recorded (T)")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each timed path")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the synthetic data")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Slowdown of a median reported as a regression")
+    parser.add_argument("--gas-tolerance", type=float, default=0.0, help="Gas increase reported as a regression")
+    args = parser.parse_args()
+    if args.users < 2 or args.panels < 1:
+        parser.error("--users must be at least 2 (buyers and sellers differ) and --panels at least 1")
+    if args.sales < args.repeat:
+        parser.error("--sales must be at least --repeat, every buy run takes one offer")
+
+    from client import LuminClient
+
+    web3 = connect(args)
+    accounts = web3.eth.accounts
+    if len(accounts) < args.users + 1:
+        sys.exit(f"The chain has {len(accounts)} accounts, {args.users + 1} are needed "
+                 f"(e.g. ganache --wallet.totalAccounts {args.users + 1})")
+    manager, users = accounts[0], accounts[1:args.users + 1]
+
+    contract, deploy_gas = deploy(web3, args.abi, manager)
+    workdir = tempfile.mkdtemp(prefix="lumin-bench-")
+    client = LuminClient(web3, contract, os.path.join(workdir, "index.db"))
+    gas = collections.defaultdict(list)
+    gas["constructor"].append(deploy_gas)
+    record_gas(client.pipeline, gas)
+
+    try:
+        start = time.perf_counter()
+        seed(client, manager, users, args, random.Random(args.seed))
+        seed_seconds = time.perf_counter() - start
+        timings = run_cases(client, manager, users, args)
+    finally:
+        client.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "chain": "py-evm" if args.tester else web3.client_version,
+            "python": platform.python_version(),
+            "users": args.users, "panels": args.panels, "sales": args.sales, "transactions": args.transactions,
+            "repeat": args.repeat, "seed": args.seed,
+            "seed_seconds": round(seed_seconds, 3),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "timings": timings,
+        "gas": summarize_gas(gas),
+    }
+
+    print(f"{'case':>18} {'median (ms)':>12} {'min (ms)':>9} {'max (ms)':>9}")
+    for case in CASES:
+        timing = timings[case]
+        print(f"{case:>18} {timing['median_ms']:>12.1f} {timing['min_ms']:>9.1f} {timing['max_ms']:>9.1f}")
+    print(f"\n{'function':>26} {'calls':>6} {'mean gas':>9}")
+    for function, used in results["gas"].items():
+        print(f"{function:>26} {used['count']:>6} {used['mean']:>9}")
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.tolerance, args.gas_tolerance)
+        if regressions:
+            sys.exit(f"\nRegressions: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# Compares refreshing the offer list the old way (one QListWidgetItem and QFont per row, every row formatted up
+# front) with the model/view classes in models.py at 1k/10k/100k rows. Each case runs in its own process so the
+# resident set sizes do not mix.
+#
+#   python benchmarks/bench_models.py [--sizes 1000 10000 100000] [--json results.json]
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+VARIANTS = ["widgets", "model"]
+
+
+def synthetic_sales(count):
+    # Same layout as the EnergySale struct: (sellerName, sellerAddress, energy, price in wei, id)
+    return [(f"user{i % 500}", f"0x{i % 500:040x}", 1 + i % 1000, (1 + i % 997) * 10 ** 15, i + 1)
+            for i in range(count)]
+
+
+def rss_kb():
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * resource.getpagesize() // 1024
+
+
+def run_widgets(app, sales):
+    from PyQt5.QtWidgets import QListWidget, QListWidgetItem
+    from PyQt5.QtGui import QFont
+    from web3 import Web3
+
+    offer_list = QListWidget()
+    offer_list.show()
+    start = time.perf_counter()
+    for sale in sales:
+        item_text = f"Seller: {sale[0]}, Amount: {sale[2]} kWh, Price: {Web3.from_wei(sale[3], 'ether')} ETH"
+        item = QListWidgetItem(item_text)
+        font = QFont("Arial", 11)
+        item.setFont(font)
+        offer_list.addItem(item)
+    app.processEvents()
+    return time.perf_counter() - start, offer_list
+
+
+def run_model(app, sales):
+    from PyQt5.QtWidgets import QListView
+    from web3 import Web3
+    from models import PagedListModel
+    from workers import TaskRunner
+
+    def format_offer(number, sale):
+        return f"Seller: {sale[0]}, Amount: {sale[2]} kWh, Price: {Web3.from_wei(sale[3], 'ether')} ETH"
+
+    tasks = TaskRunner()
+    model = PagedListModel(tasks, "offers_page", format_offer)
+    offer_list = QListView()
+    offer_list.setUniformItemSizes(True)
+    offer_list.setModel(model)
+    offer_list.show()
+    start = time.perf_counter()
+    model.set_rows(sales)
+    app.processEvents()
+    return time.perf_counter() - start, (offer_list, model, tasks)
+
+
+def run_child(variant, count):
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication(sys.argv[:1])
+    sales = synthetic_sales(count)
+    before = rss_kb()
+    runner = run_widgets if variant == "widgets" else run_model
+    elapsed, keep_alive = runner(app, sales)
+    after = rss_kb()
+    print(json.dumps({"variant": variant, "rows": count, "refresh_seconds": elapsed,
+                      "rss_kb": after, "rss_delta_kb": after - before}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offer list refresh time and memory")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Row counts to measure")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--child", nargs=2, metavar=("VARIANT", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child[0], int(args.child[1]))
+        return
+
+    results = []
+    print(f"{'rows':>8} {'variant':>8} {'refresh (ms)':>13} {'RSS (MB)':>9} {'RSS delta (MB)':>15}")
+    for count in args.sizes:
+        for variant in VARIANTS:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", variant, str(count)],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            results.append(result)
+            print(f"{count:>8} {variant:>8} {result['refresh_seconds'] * 1000:>13.1f} "
+                  f"{result['rss_kb'] / 1024:>9.1f} {result['rss_delta_kb'] / 1024:>15.1f}")
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_chain import git_commit
+
+# Cold-start benchmark of the GUI: how long after launching a fresh interpreter Lumin.py has been imported, its login
+# window is on screen and, given a node and a login, its main window is on screen. Every run is a new process so
+# import and first-use costs count each time. Reading the ABI is also timed in process, from the full Truffle artifact
+# and from the compact cached copy. Windows are drawn with Qt's offscreen platform unless QT_QPA_PLATFORM is set.
+#
+#   python benchmarks/bench_startup.py --json before.json
+#   python benchmarks/bench_startup.py --address 0x... --username alice --password secret --compare before.json
+
+SOURCE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SOURCE_DIR)
+
+# Child process stages, in the order they are reached
+IMPORT = "import"
+LOGIN_WINDOW = "login_window"
+MAIN_WINDOW = "main_window"
+
+
+def child(stage, launched, args):
+    # Runs in the timed process: goes as far as stage and prints the seconds since launch
+    import Lumin
+
+    if stage != IMPORT:
+        from PyQt5.QtWidgets import QApplication
+        app = QApplication([])
+        Lumin.ws_url = None  # No live feed; only the start-up is measured
+        if args.address:
+            Lumin.rpc_urls = [args.rpc]
+            Lumin.contract_address = args.address
+            Lumin.abi_file_path = args.abi
+        client = Lumin.LazyClient(Lumin.connect_client)
+        if stage == LOGIN_WINDOW:
+            window = Lumin.LoginWindow(client)
+        else:
+            address, is_manager = client.login(args.username, args.password)
+            window = Lumin.SolarEnergySystem(client, address, is_manager)
+        window.show()
+        app.processEvents()
+    print(json.dumps({"seconds": time.time() - launched}), flush=True)
+    os._exit(0)  # Skips Qt and thread teardown, which is not part of the start-up
+
+
+def run_stage(stage, args, env):
+    command = [sys.executable, os.path.abspath(__file__), "--child", stage, "--launched", repr(time.time()),
+               "--rpc", args.rpc, "--abi", args.abi]
+    if args.address:
+        command += ["--address", args.address, "--username", args.username, "--password", args.password]
+    completed = subprocess.run(command, cwd=SOURCE_DIR, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        sys.exit(f"The {stage} run failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])["seconds"]
+
+
+def summarize(samples):
+    return {
+        "runs": len(samples),
+        "min_ms": round(min(samples) * 1000, 3),
+        "median_ms": round(statistics.median(samples) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def time_abi(abi_path, repeat):
+    from client import load_abi
+
+    full = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(abi_path, 'r') as abi_file:
+            json.load(abi_file)['abi']
+        full.append(time.perf_counter() - start)
+
+    cache_dir = tempfile.mkdtemp(prefix="lumin-abi-")
+    try:
+        load_abi(abi_path, cache_dir)  # Extracts the ABI once
+        cached = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            load_abi(abi_path, cache_dir)
+            cached.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return summarize(full), summarize(cached)
+
+
+def compare(results, baseline, tolerance):
+    # Prints the change of every median; returns the names of the regressions
+    regressions = []
+    print(f"\n{'case':>18} {'before (ms)':>12} {'after (ms)':>11} {'change':>8}")
+    for case, timing in results["timings"].items():
+        before = baseline.get("timings", {}).get(case)
+        if before is None or not before["median_ms"]:
+            continue
+        change = timing["median_ms"] / before["median_ms"] - 1
+        flag = " !" if change > tolerance else ""
+        print(f"{case:>18} {before['median_ms']:>12.1f} {timing['median_ms']:>11.1f} {change:>+8.1%}{flag}")
+        if flag:
+            regressions.append(case)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the GUI's time to first window")
+    parser.add_argument("--rpc", default="http://127.0.0.1:8545", help="JSON-RPC endpoint for the main window runs")
+    parser.add_argument("--address", help="Deployed contract; with a login, the main window is timed as well")
+    parser.add_argument("--username", help="User or manager to log in as")
+    parser.add_argument("--password", help="Their password")
+    parser.add_argument("--abi", default="build/contracts/EnergyManagement.json", help="Truffle artifact with the ABI")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs of each stage")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Slowdown of a median reported as a regression")
+    parser.add_argument("--child", choices=[IMPORT, LOGIN_WINDOW, MAIN_WINDOW], help=argparse.SUPPRESS)
+    parser.add_argument("--launched", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.launched, args)
+        return
+    if args.address and not (args.username and args.password):
+        parser.error("--address needs --username and --password to log in")
+
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    stages = [IMPORT, LOGIN_WINDOW] + ([MAIN_WINDOW] if args.address else [])
+    timings = {stage: summarize([run_stage(stage, args, env) for _ in range(args.repeat)]) for stage in stages}
+    timings["abi_full_artifact"], timings["abi_cached"] = time_abi(os.path.join(SOURCE_DIR, args.abi), args.repeat)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": env["QT_QPA_PLATFORM"],
+            "repeat": args.repeat,
+            "artifact_bytes": os.path.getsize(os.path.join(SOURCE_DIR, args.abi)),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "timings": timings,
+    }
+
+    print(f"{'case':>18} {'median (ms)':>12} {'min (ms)':>9} {'max (ms)':>9}")
+    for case, timing in timings.items():
+        print(f"{case:>18} {timing['median_ms']:>12.1f} {timing['min_ms']:>9.1f} {timing['max_ms']:>9.1f}")
+
+    if args.json:
+        with open(args.json, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit(f"\nRegressions: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
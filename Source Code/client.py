@@ -0,0 +1,394 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from web3 import Web3
+from web3.logs import DISCARD
+
+from allocation import BY_CAPACITY, plan_allocation
+from batch_reads import BatchReader
+from event_sync import (PANEL_ID, PANEL_BALANCE, SALE_ENERGY, SALE_PRICE, SALE_SELLER_ADDRESS, ZERO_ADDRESS,
+                        expand_record)
+from indexer import ChainIndexer
+from live_updates import LiveFeed
+from matching import plan_order
+from metrics import metrics
+from order_book import OrderBook, POSTED, UNIT_PRICE, AMOUNT
+from provider_pool import ProviderPool, ROUND_ROBIN
+from search_index import PanelIndex, TransactionIndex
+from tx_pipeline import TransactionPipeline
+from view_cache import ViewCache
+
+# GUI-free client for the EnergyManagement contract: login, panels, offers, buying and selling, allocation and history.
+# A LuminClient owns the web3 connection, the local chain index, the view cache and the transaction pipeline, and is
+# safe to share between threads, so the PyQt GUI, the CLI and every request thread of the HTTP service (service.py)
+# work through one pool of connections to the node. Every method blocks; the GUI runs them on its TaskRunner.
+
+# Orderings of the offer list: name -> (OrderBook order, descending). Prices are compared per kWh.
+OFFER_SORTS = {
+    "price": (UNIT_PRICE, False),
+    "price-desc": (UNIT_PRICE, True),
+    "amount": (AMOUNT, False),
+    "amount-desc": (AMOUNT, True),
+}
+
+
+# Compact copies of artifact ABIs, keyed by the SHA-256 of the artifact, so a start-up parses a few kB of JSON instead
+# of the whole Truffle artifact with its bytecode, source maps and AST. A recompiled artifact gets a new entry.
+ABI_CACHE_DIR = ".lumin_cache"
+
+
+class ClientError(Exception):
+    pass
+
+
+def load_abi(path, cache_dir=ABI_CACHE_DIR):
+    # The ABI from a Truffle artifact, e.g. build/contracts/EnergyManagement.json; cache_dir None skips the cache
+    try:
+        with open(path, 'rb') as abi_file:
+            data = abi_file.read()
+    except FileNotFoundError:
+        raise ClientError(f"ABI file not found at {path}")
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, hashlib.sha256(data).hexdigest() + ".abi.json")
+        try:
+            with open(cache_path, 'r') as cache_file:
+                return json.load(cache_file)
+        except (OSError, ValueError):
+            pass  # Not cached yet, or a damaged copy that is written again below
+
+    try:
+        abi = json.loads(data)['abi']
+    except (ValueError, KeyError, TypeError):
+        raise ClientError(f"ABI file {path} is not a valid Truffle artifact")
+
+    if cache_path is not None:
+        # Written under a temporary name so a concurrent start never reads half a file
+        temporary = f"{cache_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(temporary, 'w') as cache_file:
+                json.dump(abi, cache_file, separators=(',', ':'))
+            os.replace(temporary, cache_path)
+        except OSError as e:
+            logging.error(f"Could not cache the ABI of {path} in {cache_dir}: {e}")
+    return abi
+
+
+class UsernameIndex:
+    # Client-side cache of username -> address resolved through the contract's addressOfUsername mapping,
+    # so a login costs at most one lookup plus the users() record instead of a scan of every node account.
+    # name_of() goes the other way for the counterparty addresses in the contract's transaction records.
+    def __init__(self, contract):
+        self.contract = contract
+        self.addresses = {}
+        self.names = {}
+
+    def resolve(self, username):
+        address = self.addresses.get(username)
+        if address is None:
+            address = self.contract.functions.addressOfUsername(username).call()
+            if address == ZERO_ADDRESS:
+                return None
+            self.remember(username, address)
+        return address
+
+    def name_of(self, address):
+        name = self.names.get(address)
+        if name is None:
+            name = self.contract.functions.users(address).call()[0]
+            if not name:
+                return ""  # Not registered (yet), so asked again next time
+            self.remember(name, address)
+        return name
+
+    def remember(self, username, address):
+        self.addresses[username] = address
+        self.names[address] = username
+
+    def forget(self, username):
+        address = self.addresses.pop(username, None)
+        if address is not None:
+            self.names.pop(address, None)
+
+
+class LuminClient:
+    def __init__(self, web3, contract, index_db_path="lumin_index.db", session=None, ws_url=None):
+        self.web3 = web3
+        self.contract = contract
+        self.session = session  # requests session for batched reads over a plain HTTPProvider
+        self.ws_url = ws_url  # WebSocket endpoint for live updates, or None to poll a log filter over HTTP
+
+        # Local chain index that history, offers and panels are read from
+        self.indexer = ChainIndexer(web3, contract, index_db_path, session=session)
+
+        # View results shared by every consumer, valid until a new block or one of our own transactions
+        self.view_cache = ViewCache(web3)
+
+        # Transactions are sent with locally managed nonces and their receipts polled in the background; every cached
+        # view may be out of date once one of them is mined
+        self.pipeline = TransactionPipeline(web3, on_receipt=lambda receipt: self.view_cache.invalidate(),
+                                            session=session)
+
+        self.username_index = UsernameIndex(contract)
+
+        # Columnar copy of the index for analytics(), created on first use
+        self.analytics_engine = None
+        self.analytics_lock = threading.Lock()
+
+        # The open sales ordered for offers() and plan_order(), kept up to date from the sales the index changes
+        self.book = None
+        self.book_generation = None  # Index generation the book was built from
+        self.book_lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, rpc, address, abi_path, index_db_path="lumin_index.db", pool_size=10, ws_url=None,
+                routing=ROUND_ROBIN, abi_cache_dir=ABI_CACHE_DIR):
+        # rpc is one endpoint or a list of them. Web3 calls and JSON-RPC batches from every thread go through a
+        # ProviderPool holding up to pool_size persistent connections per endpoint.
+        urls = [rpc] if isinstance(rpc, str) else list(rpc)
+        try:
+            web3 = Web3(ProviderPool(urls, routing, pool_size=pool_size))
+        except ValueError as e:
+            raise ClientError(str(e))
+
+        abi = load_abi(abi_path, abi_cache_dir)
+        try:
+            contract = web3.eth.contract(address=address, abi=abi)
+        except Exception as e:
+            raise ClientError(f"Failed to create contract instance: {e}")
+        try:
+            return cls(web3, contract, index_db_path, ws_url=ws_url)
+        except Exception as e:
+            raise ClientError(f"Failed to open the chain index at {index_db_path}: {e}")
+
+    def provider_stats(self):
+        # Health and latency per node when connected through a ProviderPool, otherwise an empty list
+        stats = getattr(self.web3.provider, 'stats', None)
+        return stats() if stats is not None else []
+
+    def close(self):
+        self.indexer.close()
+
+    def batch(self):
+        return BatchReader(self.web3, self.session)
+
+    def sync(self, batch=None):
+        # Skipped while the head block has not moved and this client has sent nothing since the last sync
+        def run():
+            with metrics.timed("lumin_index_sync_seconds"):
+                applied = self.indexer.sync(batch)
+            metrics.inc("lumin_index_events_total", applied)
+            return self.indexer.head
+        self.view_cache.sync("index", run)
+
+    def watch(self, on_changes):
+        # Start a LiveFeed calling on_changes(BlockChanges) from its own thread as blocks touching the contract are
+        # mined; stop() it when done. The view cache learns about each block first so the next sync is not skipped.
+        def changed(changes):
+            self.view_cache.observe_block(changes.head)
+            on_changes(changes)
+        return LiveFeed(self.web3, self.contract, changed, self.ws_url).start()
+
+    def read_changes(self, changes, accounts):
+        # Re-read the rows a BlockChanges touched, as far as the given accounts can see them. Returns (sales by id,
+        # None once filled; panels by (owner, panel id); panel count and transaction count, None when unchanged).
+        self.sync()
+        accounts = set(accounts)
+        sales = {sale_id: self.indexer.get_sale(sale_id) for sale_id in changes.sale_ids}
+        panels = {}
+        for owner, panel_id in changes.panels:
+            if owner in accounts:
+                panels[(owner, panel_id)] = self.indexer.get_panel(owner, panel_id)
+        panel_count = self.indexer.count_panels(accounts) if panels else None
+        transaction_count = self.indexer.count_transactions(accounts) if changes.accounts & accounts else None
+        return sales, panels, panel_count, transaction_count
+
+    def login(self, username, password):
+        # Returns (address, is_manager) when the username and password match, otherwise None
+        password_hash = self.web3.keccak(text=password)
+
+        # Resolve the username to its account through the on-chain index instead of scanning every account
+        address = self.username_index.resolve(username)
+        if address is None:
+            return None
+        user = self.view_cache.call(self.contract.functions.users(address))
+        if user[0] != username:
+            # The cached entry is stale, drop it so the next attempt asks the contract again
+            self.username_index.forget(username)
+            return None
+        if user[2] != password_hash:
+            return None
+        return address, user[4]
+
+    def visible_accounts(self, account, is_manager=False):
+        # A manager sees every user assigned to them, a user only their own account
+        if is_manager:
+            return self.indexer.get_managed_users(account)
+        return [account]
+
+    def dashboard(self, account, page_size):
+        # User details, ETH balance and the index sync share one JSON-RPC batch; the rest is read from the index.
+        # Returns ((user, balance in ETH), panels, offers, (accounts, transaction count, first page of history)).
+        batch = self.batch()
+        user = batch.call(self.contract.functions.users(account))
+        balance = batch.balance(account)
+        self.sync(batch)
+        batch.execute()  # Still needed when the index was already current and the sync sent nothing
+
+        accounts = [account]
+        panels = self.indexer.get_panels(accounts)
+        sales = self.indexer.get_sales()
+        count = self.indexer.count_transactions(accounts)
+        transactions = self.indexer.get_transactions(accounts, 0, page_size)
+        return (user.result, self.web3.from_wei(balance.result, 'ether')), panels, sales, (accounts, count, transactions)
+
+    def balance(self, account):
+        # ETH balance of the account
+        return self.web3.from_wei(self.view_cache.balance(account), 'ether')
+
+    def panels(self, account, is_manager=False, offset=0, limit=-1):
+        # Returns (accounts, total panel count, panels from offset on); a negative limit reads to the end
+        self.sync()
+        accounts = self.visible_accounts(account, is_manager)
+        return accounts, self.indexer.count_panels(accounts), self.indexer.get_panels(accounts, offset, limit)
+
+    def history(self, account, is_manager=False, offset=0, limit=-1):
+        # Returns (accounts, total transaction count, transactions from offset on); a negative limit reads to the end
+        self.sync()
+        accounts = self.visible_accounts(account, is_manager)
+        return (accounts, self.indexer.count_transactions(accounts),
+                self.indexer.get_transactions(accounts, offset, limit))
+
+    def chain_history(self, account, is_manager=False, offset=0, limit=-1):
+        # Like history(), but read from the contract's packed transaction records instead of the index, e.g. to check
+        # the index against the chain. Counterparty addresses are resolved through the username index's cache.
+        functions = self.contract.functions
+        call = {'from': account}
+        if is_manager:
+            accounts = self.view_cache.call(functions.getManagedUsers(), call)
+            count = self.view_cache.call(functions.getManagedTransactionCount(), call)
+        else:
+            accounts = [account]
+            count = self.view_cache.call(functions.getTransactionCount(), call)
+        limit = max(count - offset, 0) if limit < 0 else limit
+        if is_manager:
+            owners, records = self.view_cache.call(functions.displayManagedTransactionsPage(offset, limit), call)
+        else:
+            records = self.view_cache.call(functions.displayTransactionsPage(offset, limit), call)
+            owners = [account] * len(records)
+        name_of = self.username_index.name_of
+        return accounts, count, [expand_record(owner, record, name_of) for owner, record in zip(owners, records)]
+
+    def analytics(self, account, is_manager=False, window=86400):
+        # Market prices, per-panel series and trends and the manager's totals, see analytics.py. The market summary is
+        # given for the last window seconds and for all time. Only rows indexed since the last call are loaded.
+        from analytics import AnalyticsEngine  # numpy is only needed once analytics are asked for
+        self.sync()
+        with self.analytics_lock:
+            if self.analytics_engine is None:
+                self.analytics_engine = AnalyticsEngine(self.indexer)
+        self.analytics_engine.refresh()
+        accounts = self.visible_accounts(account, is_manager)
+        return self.analytics_engine.report(accounts, account if is_manager else None, window)
+
+    def search_indexes(self, accounts):
+        # Reads the full lists from the local database only, never from the node
+        usernames = {}
+        for account in accounts:
+            user = self.indexer.get_user(account)
+            usernames[account] = user[0] if user else ""
+        panel_index = PanelIndex(self.indexer.get_panels(accounts), usernames)
+        transaction_index = TransactionIndex(self.indexer.get_transactions(accounts))
+        return panel_index, transaction_index
+
+    def order_book(self):
+        # The OrderBook of the open sales; only the sales the index changed since the last call are read again.
+        # Callers hold book_lock while they use it.
+        changed = self.indexer.take_sale_changes()
+        generation = self.indexer.generation
+        if self.book is None or generation != self.book_generation:
+            self.book = OrderBook(self.indexer.get_sales())
+            self.book_generation = generation
+        else:
+            for sale_id in changed:
+                self.book.apply(sale_id, self.indexer.get_sale(sale_id))
+        return self.book
+
+    def offers(self, sort=None, min_energy=None, max_unit_price=None):
+        # Open sales in posting order, or ordered by one of OFFER_SORTS; optionally only those of at least min_energy
+        # kWh and at most max_unit_price wei per kWh
+        self.sync()
+        order, descending = OFFER_SORTS[sort] if sort is not None else (POSTED, False)
+        with self.book_lock:
+            return self.order_book().query(min_energy=min_energy, max_unit_price=max_unit_price, order=order,
+                                           descending=descending)
+
+    def buy(self, account, sale_id):
+        # Buy the whole of one sale; returns the kWh bought, or None when the sale is the account's own
+        # Fetch the latest state of the selected sale
+        self.sync()
+        sale = self.indexer.get_sale(sale_id)
+        if sale is None:
+            raise ValueError("This offer has already been sold.")
+        if sale[SALE_SELLER_ADDRESS] == account:
+            return None
+
+        # Send ETH equal to the sale's price for the whole amount
+        amount = sale[SALE_ENERGY]
+        total_price = sale[SALE_PRICE] * amount // sale[SALE_ENERGY]
+        self.pipeline.send(self.contract.functions.buyEnergy(sale_id, int(amount)), {
+            'from': account,
+            'value': int(total_price)
+        }).result()
+        return amount
+
+    def plan_order(self, account, amount, max_unit_price=None):
+        # Plan buying amount kWh across the cheapest offers; max_unit_price is in wei per kWh
+        self.sync()
+        with self.book_lock:
+            sales = self.order_book().query(max_unit_price=max_unit_price, exclude_seller=account, order=UNIT_PRICE)
+        return plan_order(sales, amount, account, max_unit_price)
+
+    def submit_order(self, account, plan):
+        # Settle a plan in one matchOrder transaction; returns the kWh filled
+        receipt = self.pipeline.send(plan.contract_call(self.contract),
+                                     {'from': account, 'value': int(plan.value)}).result()
+        # Other buyers may have taken planned offers first, so report what the contract actually filled
+        matched = self.contract.events.OrderMatched().process_receipt(receipt, errors=DISCARD)
+        return matched[0]['args']['filled'] if matched else plan.filled
+
+    def plan_allocation(self, account, amount, strategy=BY_CAPACITY):
+        # Returns ([(panel id, kWh)], kWh left over) for the account's panels
+        _, _, panels = self.panels(account)
+        return plan_allocation(panels, amount, strategy)
+
+    def allocate(self, account, allocations):
+        # Send a plan_allocation() result as one allocateEnergyBatch transaction
+        panel_ids = [panel_id for panel_id, _ in allocations]
+        amounts = [energy for _, energy in allocations]
+        self.pipeline.send(self.contract.functions.allocateEnergyBatch(panel_ids, amounts), {'from': account}).result()
+
+    def sell(self, account, panel_id, amount, price):
+        # Post amount kWh from one of the account's panels for price ETH; energy is sold in whole kWh
+        if amount != int(amount) or amount < 1:
+            raise ValueError(f"Energy is sold in whole kWh of at least 1, not {amount}.")
+        amount = int(amount)
+        self.sync()
+        panel = next((panel for panel in self.indexer.get_panels([account]) if panel[PANEL_ID] == panel_id), None)
+        if panel is None:
+            raise ValueError(f"Panel {panel_id} does not belong to {account}.")
+        if amount > panel[PANEL_BALANCE]:
+            raise ValueError(f"The selected panel only has {panel[PANEL_BALANCE]} kWh available.")
+
+        # Post the energy for sale and reduce the panel's balance in the same block, then wait for both
+        futures = self.pipeline.send_all([
+            (self.contract.functions.postEnergyForSale(amount, self.web3.to_wei(price, 'ether')), {'from': account}),
+            (self.contract.functions.reduceEnergyBalance(panel_id, amount), {'from': account}),
+        ])
+        for future in futures:
+            future.result()
@@ -0,0 +1,118 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+// The panel lookups EnergyManagement used before panels were indexed by id: every call walks the caller's panels.
+// Only deployed by the gas benchmark in test/EnergyManagement.test.js to compare against the indexed version.
+contract LinearPanelScan {
+    struct Panel {
+        uint256 id;
+        uint256 capacity;
+        string location;
+        uint256 producedEnergy;
+        uint256 consumedEnergy;
+        uint256 energyBalance;
+        uint256 efficiency;
+        address owner;
+    }
+
+    struct Transaction {
+        string from;
+        string to;
+        uint256 energyProduced;
+        uint256 energyConsumed;
+        uint256 tokensTransferred;
+        uint256 timestamp;
+    }
+
+    struct EnergySale {
+        string sellerName;
+        address sellerAddress;
+        uint256 energy;
+        uint256 price;
+    }
+
+    mapping(address => string) public usernames;
+    mapping(address => Panel[]) public userPanels;
+    mapping(address => Transaction[]) public userTransactions;
+    EnergySale[] public energySales;
+
+    event EnergyPosted(uint256 indexed saleIndex, address indexed seller, uint256 energy, uint256 price);
+    event EnergyProduced(address indexed owner, uint256 indexed panelId, uint256 energy, uint256 timestamp);
+    event EnergyConsumed(address indexed owner, uint256 indexed panelId, uint256 energy, uint256 timestamp);
+    event EnergyAllocated(address indexed owner, uint256 indexed panelId, uint256 energy);
+    event EnergyBalanceReduced(address indexed owner, uint256 indexed panelId, uint256 amount);
+
+    function register(string memory _username) public {
+        usernames[msg.sender] = _username;
+    }
+
+    function addPanelToUser(address _user, uint256 _id, uint256 _capacity, string memory _location,
+                            uint256 _producedEnergy, uint256 _consumedEnergy, uint256 _efficiency) public {
+        uint256 initialEnergyBalance = _producedEnergy > _consumedEnergy ? _producedEnergy - _consumedEnergy : 0;
+        userPanels[_user].push(Panel(_id, _capacity, _location, _producedEnergy, _consumedEnergy, initialEnergyBalance,
+                                     _efficiency, _user));
+    }
+
+    function postEnergyForSale(uint256 _energy, uint256 _price) public {
+        uint256 totalAvailableEnergy = 0;
+        for (uint256 i = 0; i < userPanels[msg.sender].length; i++) {
+            totalAvailableEnergy += userPanels[msg.sender][i].energyBalance;
+        }
+
+        require(_energy <= totalAvailableEnergy, "Not enough energy available in your panels to sell");
+
+        energySales.push(EnergySale(usernames[msg.sender], msg.sender, _energy, _price));
+        emit EnergyPosted(energySales.length - 1, msg.sender, _energy, _price);
+    }
+
+    function produceEnergy(uint256 _panelId, uint256 _energy) public {
+        for (uint256 i = 0; i < userPanels[msg.sender].length; i++) {
+            if (userPanels[msg.sender][i].id == _panelId) {
+                require(userPanels[msg.sender][i].energyBalance + _energy <= userPanels[msg.sender][i].capacity, "Exceeds panel capacity");
+                userPanels[msg.sender][i].producedEnergy += _energy;
+                userPanels[msg.sender][i].energyBalance += _energy;
+                userTransactions[msg.sender].push(Transaction(usernames[msg.sender], "", _energy, 0, 0, block.timestamp));
+                emit EnergyProduced(msg.sender, _panelId, _energy, block.timestamp);
+                break;
+            }
+        }
+    }
+
+    function consumeEnergy(uint256 _panelId, uint256 _energy) public {
+        for (uint256 i = 0; i < userPanels[msg.sender].length; i++) {
+            if (userPanels[msg.sender][i].id == _panelId) {
+                require(userPanels[msg.sender][i].energyBalance >= _energy, "Not enough energy in the panel");
+                userPanels[msg.sender][i].consumedEnergy += _energy;
+                userPanels[msg.sender][i].energyBalance -= _energy;
+                userTransactions[msg.sender].push(Transaction(usernames[msg.sender], "", 0, _energy, 0, block.timestamp));
+                emit EnergyConsumed(msg.sender, _panelId, _energy, block.timestamp);
+                break;
+            }
+        }
+    }
+
+    function allocateEnergyToPanel(uint256 panelId, uint256 energyAmount) public {
+        for (uint256 i = 0; i < userPanels[msg.sender].length; i++) {
+            if (userPanels[msg.sender][i].id == panelId) {
+                require(userPanels[msg.sender][i].energyBalance + energyAmount <= userPanels[msg.sender][i].capacity, "Exceeds panel capacity");
+                userPanels[msg.sender][i].producedEnergy += energyAmount;
+                userPanels[msg.sender][i].energyBalance += energyAmount;
+                emit EnergyAllocated(msg.sender, panelId, energyAmount);
+                return;
+            }
+        }
+        revert("Panel not found");
+    }
+
+    function reduceEnergyBalance(uint256 panelId, uint256 amount) public {
+        for (uint256 i = 0; i < userPanels[msg.sender].length; i++) {
+            if (userPanels[msg.sender][i].id == panelId) {
+                require(userPanels[msg.sender][i].energyBalance >= amount, "Not enough energy in the panel");
+                userPanels[msg.sender][i].energyBalance -= amount;
+                emit EnergyBalanceReduced(msg.sender, panelId, amount);
+                return;
+            }
+        }
+        revert("Panel not found");
+    }
+}
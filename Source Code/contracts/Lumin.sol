@@ -13,13 +13,14 @@ contract EnergyManagement {
         address owner;
     }
 
+    // Packed into two storage slots. A record belongs to the account it is stored under, so only the other side of
+    // a trade is kept, as an address clients resolve to a username; amounts are range-checked in record()
     struct Transaction {
-        string from;  // Store the name of the user
-        string to;
-        uint256 energyProduced;
-        uint256 energyConsumed;
-        uint256 tokensTransferred;
-        uint256 timestamp;
+        address counterparty;       // Other side of a trade, zero for production and consumption
+        uint64 timestamp;
+        uint64 energyProduced;      // in kWh
+        uint64 energyConsumed;      // in kWh
+        uint128 tokensTransferred;  // in wei
     }
 
     struct EnergySale {
@@ -27,6 +28,7 @@ contract EnergyManagement {
         address sellerAddress;
         uint256 energy;    // Amount of energy for sale (in kWh)
         uint256 price;     // Price for the energy (in wei)
+        uint256 id;        // Stable sale id, never reused
     }
 
     struct User {
@@ -42,23 +44,53 @@ contract EnergyManagement {
     mapping(address => Transaction[]) public userTransactions;
     mapping(address => uint256) public balances;
     mapping(address => address[]) public managerToUsers; // Mapping from manager to their users
-    EnergySale[] public energySales;
+    mapping(string => address) public addressOfUsername; // Username index so login does not scan every account
+    mapping(address => mapping(uint256 => uint256)) private panelSlot; // Panel id -> index + 1 in userPanels, 0 if absent
+    mapping(address => uint256) public totalEnergyBalance; // Sum of energyBalance over a user's panels
+    mapping(uint256 => EnergySale) public energySales; // Open sales by id
+    uint256[] private openSaleIds; // Ids of the open sales, in no particular order
+    mapping(uint256 => uint256) private openSaleSlot; // Sale id -> index + 1 in openSaleIds, 0 once closed
+    uint256 public nextSaleId = 1;
 
     uint256 public panelCount = 0;
 
+    // Events let clients follow state changes through eth_getLogs instead of re-downloading whole arrays
+    event UserRegistered(address indexed user, string username, bool isManager);
+    event ManagerAssigned(address indexed manager, address[] users);
+    event PanelAdded(address indexed owner, uint256 indexed panelId, uint256 capacity, string location, uint256 producedEnergy, uint256 consumedEnergy, uint256 efficiency);
+    event EnergyPosted(uint256 indexed saleId, address indexed seller, uint256 energy, uint256 price);
+    event EnergyBought(uint256 indexed saleId, address indexed buyer, address indexed seller, uint256 amount, uint256 totalPrice, uint256 remainingEnergy, uint256 timestamp);
+    event OrderMatched(address indexed buyer, uint256 requested, uint256 filled, uint256 totalPrice);
+    event EnergyProduced(address indexed owner, uint256 indexed panelId, uint256 energy, uint256 timestamp);
+    event EnergyConsumed(address indexed owner, uint256 indexed panelId, uint256 energy, uint256 timestamp);
+    event EnergyAllocated(address indexed owner, uint256 indexed panelId, uint256 energy);
+    event EnergyBalanceReduced(address indexed owner, uint256 indexed panelId, uint256 amount);
+
     // Register a new user with username, actual name, hashed password, and role
     function register(string memory _username, string memory _actualName, bytes32 _passwordHash, bool _isManager) public {
         require(!users[msg.sender].registered, "User already registered");
+        require(addressOfUsername[_username] == address(0), "Username already taken");
         users[msg.sender] = User(_username, _actualName, _passwordHash, true, _isManager);
+        addressOfUsername[_username] = msg.sender;
 
         // Initialize the user's token balance if required (for token-based transactions)
         balances[msg.sender] = 1000; // Example: 1000 tokens
+
+        emit UserRegistered(msg.sender, _username, _isManager);
     }
 
     // Register a manager and assign users to them
     function registerManagerWithUsers(string memory _username, string memory _actualName, bytes32 _passwordHash, address[] memory _users) public {
         register(_username, _actualName, _passwordHash, true);
         managerToUsers[msg.sender] = _users;
+
+        emit ManagerAssigned(msg.sender, _users);
+    }
+
+    // Function to list the users assigned to the calling manager
+    function getManagedUsers() public view returns (address[] memory) {
+        require(users[msg.sender].isManager, "Only a manager can view managed users");
+        return managerToUsers[msg.sender];
     }
 
     // Function to add a panel to a user's array of panels
@@ -86,6 +118,14 @@ contract EnergyManagement {
             owner: _user
         }));
         panelCount++;
+
+        // Like the old linear search, the first panel added with an id is the one later calls update
+        if (panelSlot[_user][_id] == 0) {
+            panelSlot[_user][_id] = userPanels[_user].length;
+        }
+        totalEnergyBalance[_user] += initialEnergyBalance;
+
+        emit PanelAdded(_user, _id, _capacity, _location, _producedEnergy, _consumedEnergy, _efficiency);
     }
 
     // Login function
@@ -100,82 +140,179 @@ contract EnergyManagement {
     // Function to post energy for sale
     function postEnergyForSale(uint256 _energy, uint256 _price) public {
         require(users[msg.sender].registered, "User must be logged in to post energy for sale");
+        require(_energy > 0, "Energy amount must be greater than 0");
 
-        // Calculate total available energy
-        uint256 totalAvailableEnergy = 0;
-        for (uint256 i = 0; i < userPanels[msg.sender].length; i++) {
-            totalAvailableEnergy += userPanels[msg.sender][i].energyBalance;
-        }
-        
-        require(_energy <= totalAvailableEnergy, "Not enough energy available in your panels to sell");
+        require(_energy <= totalEnergyBalance[msg.sender], "Not enough energy available in your panels to sell");
 
         string memory sellerName = users[msg.sender].username;
-        energySales.push(EnergySale(sellerName, msg.sender, _energy, _price));
+        uint256 saleId = nextSaleId++;
+        energySales[saleId] = EnergySale(sellerName, msg.sender, _energy, _price, saleId);
+        openSaleIds.push(saleId);
+        openSaleSlot[saleId] = openSaleIds.length;
+
+        emit EnergyPosted(saleId, msg.sender, _energy, _price);
     }
 
     // Function to buy energy (payable to accept ETH)
-    function buyEnergy(uint256 saleIndex, uint256 _amount) public payable {
-        require(saleIndex < energySales.length, "Invalid sale index");
+    function buyEnergy(uint256 saleId, uint256 _amount) public payable {
+        require(openSaleSlot[saleId] != 0, "Invalid sale id");
         require(users[msg.sender].registered, "User must be logged in to buy energy");
-        EnergySale memory sale = energySales[saleIndex];
-
-        require(_amount <= sale.energy, "Amount exceeds available energy for sale");
+        require(_amount <= energySales[saleId].energy, "Amount exceeds available energy for sale");
 
         // Calculate the total price in Wei for the requested amount
-        uint256 totalPrice = sale.price * _amount / sale.energy;
+        uint256 totalPrice = energySales[saleId].price * _amount / energySales[saleId].energy;
         require(msg.value >= totalPrice, "Insufficient ETH sent");
 
-        // Transfer the ETH from the buyer to the seller
-        payable(sale.sellerAddress).transfer(totalPrice);
-
-        // Update the sale
-        sale.energy -= _amount;
-        if (sale.energy == 0) {
-            // Remove the sale from the list if all energy is bought
-            for (uint256 i = saleIndex; i < energySales.length - 1; i++) {
-                energySales[i] = energySales[i + 1];
+        fillSale(saleId, _amount, totalPrice);
+    }
+
+    // Function to buy up to _amount kWh across several sales in one transaction. saleIds are the candidate sales in
+    // the order to fill them (cheapest first, as planned by the client); sales that are gone, belong to the buyer or
+    // cost more than maxUnitPrice wei per kWh are skipped, the last sale used may be filled partially, and the ETH
+    // not spent is refunded.
+    function matchOrder(uint256[] memory saleIds, uint256 _amount, uint256 maxUnitPrice) public payable {
+        require(users[msg.sender].registered, "User must be logged in to buy energy");
+        require(_amount > 0, "Energy amount must be greater than 0");
+
+        uint256 remaining = _amount;
+        uint256 spent = 0;
+        for (uint256 i = 0; i < saleIds.length && remaining > 0; i++) {
+            uint256 saleId = saleIds[i];
+            if (openSaleSlot[saleId] == 0) {
+                continue;
+            }
+            EnergySale storage sale = energySales[saleId];
+            // Sales of 0 kWh, which older versions accepted, cannot be bought
+            if (sale.sellerAddress == msg.sender || sale.energy == 0) {
+                continue;
             }
-            energySales.pop();
+            if (maxUnitPrice <= type(uint256).max / sale.energy && sale.price > maxUnitPrice * sale.energy) {
+                continue;
+            }
+            uint256 take = remaining < sale.energy ? remaining : sale.energy;
+            uint256 totalPrice = sale.price * take / sale.energy;
+            spent += totalPrice;
+            require(msg.value >= spent, "Insufficient ETH sent");
+            remaining -= take;
+            fillSale(saleId, take, totalPrice);
+        }
+
+        require(remaining < _amount, "No sale matched the order");
+        emit OrderMatched(msg.sender, _amount, _amount - remaining, spent);
+
+        if (msg.value > spent) {
+            payable(msg.sender).transfer(msg.value - spent);
+        }
+    }
+
+    // Pay the seller, update or close the sale and record the trade for both sides
+    function fillSale(uint256 saleId, uint256 _amount, uint256 totalPrice) internal {
+        // Only the fields used are read; the seller's name stays in storage
+        EnergySale storage sale = energySales[saleId];
+        address seller = sale.sellerAddress;
+        uint256 remaining = sale.energy - _amount;
+
+        // Transfer the ETH from the buyer to the seller
+        payable(seller).transfer(totalPrice);
+
+        // Update the sale; the price left is for the energy left, so the price per kWh stays the same
+        if (remaining == 0) {
+            // Remove the sale if all energy is bought
+            removeSale(saleId);
         } else {
-            energySales[saleIndex] = sale;
+            sale.energy = remaining;
+            sale.price -= totalPrice;
         }
 
-        // Record the transaction
-        string memory buyerName = users[msg.sender].username;
-        userTransactions[msg.sender].push(Transaction(buyerName, sale.sellerName, 0, _amount, totalPrice, block.timestamp));
-        userTransactions[sale.sellerAddress].push(Transaction(sale.sellerName, buyerName, _amount, 0, totalPrice, block.timestamp));
+        // Record the transaction for both sides
+        record(msg.sender, seller, 0, _amount, totalPrice);
+        record(seller, msg.sender, _amount, 0, totalPrice);
+
+        emit EnergyBought(saleId, msg.sender, seller, _amount, totalPrice, remaining, block.timestamp);
+    }
+
+    // Append a packed transaction record to owner's history
+    function record(address owner, address counterparty, uint256 produced, uint256 consumed, uint256 tokens) internal {
+        require(produced <= type(uint64).max && consumed <= type(uint64).max, "Energy amount too large");
+        require(tokens <= type(uint128).max, "Token amount too large");
+        userTransactions[owner].push(Transaction(counterparty, uint64(block.timestamp), uint64(produced),
+                                                 uint64(consumed), uint128(tokens)));
+    }
+
+    // Close a sale in constant time: the last open id takes its slot in openSaleIds
+    function removeSale(uint256 saleId) internal {
+        uint256 index = openSaleSlot[saleId] - 1;
+        uint256 lastId = openSaleIds[openSaleIds.length - 1];
+        openSaleIds[index] = lastId;
+        openSaleSlot[lastId] = index + 1;
+        openSaleIds.pop();
+        delete openSaleSlot[saleId];
+        delete energySales[saleId];
+    }
+
+    // Position of a user's panel in userPanels, looked up by id in constant time
+    function panelIndex(address _owner, uint256 _panelId) internal view returns (bool found, uint256 index) {
+        uint256 slot = panelSlot[_owner][_panelId];
+        return (slot != 0, slot == 0 ? 0 : slot - 1);
     }
 
     // Function to record energy production
     function produceEnergy(uint256 _panelId, uint256 _energy) public {
         require(users[msg.sender].registered, "User must be logged in to produce energy");
-        for (uint256 i = 0; i < userPanels[msg.sender].length; i++) {
-            if (userPanels[msg.sender][i].id == _panelId) {
-                require(userPanels[msg.sender][i].energyBalance + _energy <= userPanels[msg.sender][i].capacity, "Exceeds panel capacity");
-                userPanels[msg.sender][i].producedEnergy += _energy;
-                userPanels[msg.sender][i].energyBalance += _energy;
-                string memory producerName = users[msg.sender].username;
-                userTransactions[msg.sender].push(Transaction(producerName, "", _energy, 0, 0, block.timestamp));
-                break;
-            }
+        (bool found, uint256 index) = panelIndex(msg.sender, _panelId);
+        if (found) {
+            produce(index, _panelId, _energy);
         }
     }
 
     // Function to record energy consumption
     function consumeEnergy(uint256 _panelId, uint256 _energy) public {
         require(users[msg.sender].registered, "User must be logged in to consume energy");
-        for (uint256 i = 0; i < userPanels[msg.sender].length; i++) {
-            if (userPanels[msg.sender][i].id == _panelId) {
-                require(userPanels[msg.sender][i].energyBalance >= _energy, "Not enough energy in the panel");
-                userPanels[msg.sender][i].consumedEnergy += _energy;
-                userPanels[msg.sender][i].energyBalance -= _energy;
-                string memory consumerName = users[msg.sender].username;
-                userTransactions[msg.sender].push(Transaction(consumerName, "", 0, _energy, 0, block.timestamp));
-                break;
+        (bool found, uint256 index) = panelIndex(msg.sender, _panelId);
+        if (found) {
+            consume(index, _panelId, _energy);
+        }
+    }
+
+    // Function to record many meter readings in one transaction: a positive delta is production, a negative one
+    // consumption. Like produceEnergy and consumeEnergy, readings for unknown panel ids are ignored.
+    function recordReadings(uint256[] memory panelIds, int256[] memory deltas) public {
+        require(users[msg.sender].registered, "User must be logged in to record readings");
+        require(panelIds.length == deltas.length, "Panel ids and deltas differ in length");
+
+        for (uint256 i = 0; i < panelIds.length; i++) {
+            (bool found, uint256 index) = panelIndex(msg.sender, panelIds[i]);
+            if (!found || deltas[i] == 0) {
+                continue;
+            }
+            if (deltas[i] > 0) {
+                produce(index, panelIds[i], uint256(deltas[i]));
+            } else {
+                consume(index, panelIds[i], uint256(-deltas[i]));
             }
         }
     }
 
+    function produce(uint256 index, uint256 _panelId, uint256 _energy) internal {
+        Panel storage panel = userPanels[msg.sender][index];
+        require(panel.energyBalance + _energy <= panel.capacity, "Exceeds panel capacity");
+        panel.producedEnergy += _energy;
+        panel.energyBalance += _energy;
+        totalEnergyBalance[msg.sender] += _energy;
+        record(msg.sender, address(0), _energy, 0, 0);
+        emit EnergyProduced(msg.sender, _panelId, _energy, block.timestamp);
+    }
+
+    function consume(uint256 index, uint256 _panelId, uint256 _energy) internal {
+        Panel storage panel = userPanels[msg.sender][index];
+        require(panel.energyBalance >= _energy, "Not enough energy in the panel");
+        panel.consumedEnergy += _energy;
+        panel.energyBalance -= _energy;
+        totalEnergyBalance[msg.sender] -= _energy;
+        record(msg.sender, address(0), 0, _energy, 0);
+        emit EnergyConsumed(msg.sender, _panelId, _energy, block.timestamp);
+    }
+
     // Function to display total energy history
     function displayTotalEnergyHistory() public view returns (uint256 produced, uint256 consumed) {
         require(users[msg.sender].registered, "User must be logged in to view energy history");
@@ -194,6 +331,26 @@ contract EnergyManagement {
         return userTransactions[msg.sender];
     }
 
+    // Function to count the logged-in user's transactions, used to page through displayTransactionsPage
+    function getTransactionCount() public view returns (uint256) {
+        require(users[msg.sender].registered, "User must be logged in to view transactions");
+        return userTransactions[msg.sender].length;
+    }
+
+    // Function to display one page of the logged-in user's transactions
+    function displayTransactionsPage(uint256 offset, uint256 limit) public view returns (Transaction[] memory) {
+        require(users[msg.sender].registered, "User must be logged in to view transactions");
+
+        Transaction[] storage all = userTransactions[msg.sender];
+        uint256 size = pageSize(all.length, offset, limit);
+
+        Transaction[] memory page = new Transaction[](size);
+        for (uint256 i = 0; i < size; i++) {
+            page[i] = all[offset + i];
+        }
+        return page;
+    }
+
     // Function to display all panels
     function displayPanels() public view returns (Panel[] memory) {
         require(users[msg.sender].registered, "User must be logged in to view panels");
@@ -202,7 +359,21 @@ contract EnergyManagement {
 
     // Function to get available energy sales
     function getAvailableEnergySales() public view returns (EnergySale[] memory) {
-        return energySales;
+        return getAvailableEnergySalesPage(0, openSaleIds.length);
+    }
+
+    // Function to count the open energy sales, used to page through getAvailableEnergySalesPage
+    function getSaleCount() public view returns (uint256) {
+        return openSaleIds.length;
+    }
+
+    // Function to get one page of the open energy sales, in getAvailableEnergySales order
+    function getAvailableEnergySalesPage(uint256 offset, uint256 limit) public view returns (EnergySale[] memory) {
+        EnergySale[] memory page = new EnergySale[](pageSize(openSaleIds.length, offset, limit));
+        for (uint256 i = 0; i < page.length; i++) {
+            page[i] = energySales[openSaleIds[offset + i]];
+        }
+        return page;
     }
 
     // Function to allocate purchased energy to specific panels
@@ -210,29 +381,42 @@ contract EnergyManagement {
         require(users[msg.sender].registered, "User must be logged in to allocate energy");
         require(energyAmount > 0, "Energy amount must be greater than 0");
 
-        for (uint256 i = 0; i < userPanels[msg.sender].length; i++) {
-            if (userPanels[msg.sender][i].id == panelId) {
-                require(userPanels[msg.sender][i].energyBalance + energyAmount <= userPanels[msg.sender][i].capacity, "Exceeds panel capacity");
-                userPanels[msg.sender][i].producedEnergy += energyAmount;
-                userPanels[msg.sender][i].energyBalance += energyAmount;
-                return;
-            }
+        allocate(panelId, energyAmount);
+    }
+
+    // Function to allocate purchased energy to several panels in one transaction
+    function allocateEnergyBatch(uint256[] memory panelIds, uint256[] memory energyAmounts) public {
+        require(users[msg.sender].registered, "User must be logged in to allocate energy");
+        require(panelIds.length == energyAmounts.length, "Panel ids and amounts differ in length");
+
+        for (uint256 i = 0; i < panelIds.length; i++) {
+            require(energyAmounts[i] > 0, "Energy amount must be greater than 0");
+            allocate(panelIds[i], energyAmounts[i]);
         }
-        revert("Panel not found");
+    }
+
+    function allocate(uint256 panelId, uint256 energyAmount) internal {
+        (bool found, uint256 index) = panelIndex(msg.sender, panelId);
+        require(found, "Panel not found");
+        Panel storage panel = userPanels[msg.sender][index];
+        require(panel.energyBalance + energyAmount <= panel.capacity, "Exceeds panel capacity");
+        panel.producedEnergy += energyAmount;
+        panel.energyBalance += energyAmount;
+        totalEnergyBalance[msg.sender] += energyAmount;
+        emit EnergyAllocated(msg.sender, panelId, energyAmount);
     }
 
     // Function to reduce energy balance after posting a sale
     function reduceEnergyBalance(uint256 panelId, uint256 amount) public {
         require(users[msg.sender].registered, "User must be logged in to update energy balance");
-        
-        for (uint256 i = 0; i < userPanels[msg.sender].length; i++) {
-            if (userPanels[msg.sender][i].id == panelId) {
-                require(userPanels[msg.sender][i].energyBalance >= amount, "Not enough energy in the panel");
-                userPanels[msg.sender][i].energyBalance -= amount;
-                return;
-            }
-        }
-        revert("Panel not found");
+
+        (bool found, uint256 index) = panelIndex(msg.sender, panelId);
+        require(found, "Panel not found");
+        Panel storage panel = userPanels[msg.sender][index];
+        require(panel.energyBalance >= amount, "Not enough energy in the panel");
+        panel.energyBalance -= amount;
+        totalEnergyBalance[msg.sender] -= amount;
+        emit EnergyBalanceReduced(msg.sender, panelId, amount);
     }
 
     // Function to display all panels for a manager
@@ -261,8 +445,8 @@ contract EnergyManagement {
         return panels;
     }
 
-    // Function to display all transactions for a manager
-    function displayManagedTransactions() public view returns (Transaction[] memory) {
+    // Function to display all transactions for a manager; owners[i] is the managed user transactions[i] belongs to
+    function displayManagedTransactions() public view returns (address[] memory owners, Transaction[] memory transactions) {
         require(users[msg.sender].isManager, "Only a manager can view all transactions");
 
         address[] memory managedUsers = managerToUsers[msg.sender];
@@ -273,17 +457,95 @@ contract EnergyManagement {
             totalTransactions += userTransactions[managedUsers[i]].length;
         }
 
-        Transaction[] memory transactions = new Transaction[](totalTransactions);
+        owners = new address[](totalTransactions);
+        transactions = new Transaction[](totalTransactions);
         uint256 counter = 0;
 
         // Populate the array with transactions from all managed users
         for (uint256 i = 0; i < managedUsers.length; i++) {
             for (uint256 j = 0; j < userTransactions[managedUsers[i]].length; j++) {
+                owners[counter] = managedUsers[i];
                 transactions[counter] = userTransactions[managedUsers[i]][j];
                 counter++;
             }
         }
+    }
+
+    // Number of items a page starting at offset holds when total items exist
+    function pageSize(uint256 total, uint256 offset, uint256 limit) internal pure returns (uint256) {
+        if (offset >= total) {
+            return 0;
+        }
+        return limit < total - offset ? limit : total - offset;
+    }
+
+    // Function to count the panels of all users managed by the caller
+    function getManagedPanelCount() public view returns (uint256 total) {
+        require(users[msg.sender].isManager, "Only a manager can view all panels");
+        address[] storage managedUsers = managerToUsers[msg.sender];
+        for (uint256 i = 0; i < managedUsers.length; i++) {
+            total += userPanels[managedUsers[i]].length;
+        }
+    }
+
+    // Function to display one page of the panels of all users managed by the caller, in displayManagedPanels order
+    function displayManagedPanelsPage(uint256 offset, uint256 limit) public view returns (Panel[] memory) {
+        require(users[msg.sender].isManager, "Only a manager can view all panels");
+
+        address[] storage managedUsers = managerToUsers[msg.sender];
+        Panel[] memory page = new Panel[](pageSize(getManagedPanelCount(), offset, limit));
+        uint256 counter = 0;
+        uint256 skipped = 0;
+
+        // Skip whole users until the offset is reached, then copy only the requested panels
+        for (uint256 i = 0; i < managedUsers.length && counter < page.length; i++) {
+            Panel[] storage panels = userPanels[managedUsers[i]];
+            if (skipped + panels.length <= offset) {
+                skipped += panels.length;
+                continue;
+            }
+            for (uint256 j = offset > skipped ? offset - skipped : 0; j < panels.length && counter < page.length; j++) {
+                page[counter] = panels[j];
+                counter++;
+            }
+            skipped += panels.length;
+        }
+
+        return page;
+    }
+
+    // Function to count the transactions of all users managed by the caller
+    function getManagedTransactionCount() public view returns (uint256 total) {
+        require(users[msg.sender].isManager, "Only a manager can view all transactions");
+        address[] storage managedUsers = managerToUsers[msg.sender];
+        for (uint256 i = 0; i < managedUsers.length; i++) {
+            total += userTransactions[managedUsers[i]].length;
+        }
+    }
 
-        return transactions;
+    // Function to display one page of the transactions of all users managed by the caller, in displayManagedTransactions order
+    function displayManagedTransactionsPage(uint256 offset, uint256 limit) public view returns (address[] memory owners, Transaction[] memory page) {
+        require(users[msg.sender].isManager, "Only a manager can view all transactions");
+
+        address[] storage managedUsers = managerToUsers[msg.sender];
+        page = new Transaction[](pageSize(getManagedTransactionCount(), offset, limit));
+        owners = new address[](page.length);
+        uint256 counter = 0;
+        uint256 skipped = 0;
+
+        // Skip whole users until the offset is reached, then copy only the requested transactions
+        for (uint256 i = 0; i < managedUsers.length && counter < page.length; i++) {
+            Transaction[] storage transactions = userTransactions[managedUsers[i]];
+            if (skipped + transactions.length <= offset) {
+                skipped += transactions.length;
+                continue;
+            }
+            for (uint256 j = offset > skipped ? offset - skipped : 0; j < transactions.length && counter < page.length; j++) {
+                owners[counter] = managedUsers[i];
+                page[counter] = transactions[j];
+                counter++;
+            }
+            skipped += transactions.length;
+        }
     }
 }
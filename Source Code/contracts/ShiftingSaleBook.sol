@@ -0,0 +1,71 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+// The order book EnergyManagement used before sales had stable ids: sales live in an array addressed by position and
+// a filled sale is removed by shifting every later sale down one slot. Only deployed by the gas benchmark in
+// test/EnergyManagement.test.js to compare against the id-keyed book.
+contract ShiftingSaleBook {
+    struct Transaction {
+        string from;
+        string to;
+        uint256 energyProduced;
+        uint256 energyConsumed;
+        uint256 tokensTransferred;
+        uint256 timestamp;
+    }
+
+    struct EnergySale {
+        string sellerName;
+        address sellerAddress;
+        uint256 energy;
+        uint256 price;
+    }
+
+    mapping(address => string) public usernames;
+    mapping(address => Transaction[]) public userTransactions;
+    EnergySale[] public energySales;
+
+    event EnergyPosted(uint256 indexed saleIndex, address indexed seller, uint256 energy, uint256 price);
+    event EnergyBought(uint256 indexed saleIndex, address indexed buyer, address indexed seller, uint256 amount, uint256 totalPrice, uint256 remainingEnergy, uint256 timestamp);
+
+    function register(string memory _username) public {
+        usernames[msg.sender] = _username;
+    }
+
+    function postEnergyForSale(uint256 _energy, uint256 _price) public {
+        energySales.push(EnergySale(usernames[msg.sender], msg.sender, _energy, _price));
+        emit EnergyPosted(energySales.length - 1, msg.sender, _energy, _price);
+    }
+
+    function buyEnergy(uint256 saleIndex, uint256 _amount) public payable {
+        require(saleIndex < energySales.length, "Invalid sale index");
+        EnergySale memory sale = energySales[saleIndex];
+
+        require(_amount <= sale.energy, "Amount exceeds available energy for sale");
+
+        uint256 totalPrice = sale.price * _amount / sale.energy;
+        require(msg.value >= totalPrice, "Insufficient ETH sent");
+
+        payable(sale.sellerAddress).transfer(totalPrice);
+
+        sale.energy -= _amount;
+        if (sale.energy == 0) {
+            for (uint256 i = saleIndex; i < energySales.length - 1; i++) {
+                energySales[i] = energySales[i + 1];
+            }
+            energySales.pop();
+        } else {
+            energySales[saleIndex] = sale;
+        }
+
+        string memory buyerName = usernames[msg.sender];
+        userTransactions[msg.sender].push(Transaction(buyerName, sale.sellerName, 0, _amount, totalPrice, block.timestamp));
+        userTransactions[sale.sellerAddress].push(Transaction(sale.sellerName, buyerName, _amount, 0, totalPrice, block.timestamp));
+
+        emit EnergyBought(saleIndex, msg.sender, sale.sellerAddress, _amount, totalPrice, sale.energy, block.timestamp);
+    }
+
+    function getSaleCount() public view returns (uint256) {
+        return energySales.length;
+    }
+}
@@ -0,0 +1,86 @@
+// SPDX-License-Identifier: MIT
+pragma solidity ^0.8.0;
+
+// The transaction records EnergyManagement kept before they were packed: both usernames as strings and every amount
+// in its own uint256 slot, written by a trade on the same id-keyed sale book EnergyManagement uses. Only deployed by
+// the gas and payload benchmark in test/EnergyManagement.test.js to compare against the packed records.
+contract StringTransactionLog {
+    struct Transaction {
+        string from;
+        string to;
+        uint256 energyProduced;
+        uint256 energyConsumed;
+        uint256 tokensTransferred;
+        uint256 timestamp;
+    }
+
+    struct EnergySale {
+        string sellerName;
+        address sellerAddress;
+        uint256 energy;
+        uint256 price;
+        uint256 id;
+    }
+
+    mapping(address => string) public usernames;
+    mapping(address => Transaction[]) public userTransactions;
+    mapping(uint256 => EnergySale) public energySales;
+    uint256[] private openSaleIds;
+    mapping(uint256 => uint256) private openSaleSlot;
+    uint256 public nextSaleId = 1;
+
+    event EnergyPosted(uint256 indexed saleId, address indexed seller, uint256 energy, uint256 price);
+    event EnergyBought(uint256 indexed saleId, address indexed buyer, address indexed seller, uint256 amount, uint256 totalPrice, uint256 remainingEnergy, uint256 timestamp);
+
+    function register(string memory _username) public {
+        usernames[msg.sender] = _username;
+    }
+
+    function postEnergyForSale(uint256 _energy, uint256 _price) public {
+        uint256 saleId = nextSaleId++;
+        energySales[saleId] = EnergySale(usernames[msg.sender], msg.sender, _energy, _price, saleId);
+        openSaleIds.push(saleId);
+        openSaleSlot[saleId] = openSaleIds.length;
+        emit EnergyPosted(saleId, msg.sender, _energy, _price);
+    }
+
+    function buyEnergy(uint256 saleId, uint256 _amount) public payable {
+        require(openSaleSlot[saleId] != 0, "Invalid sale id");
+        require(_amount <= energySales[saleId].energy, "Amount exceeds available energy for sale");
+        uint256 totalPrice = energySales[saleId].price * _amount / energySales[saleId].energy;
+        require(msg.value >= totalPrice, "Insufficient ETH sent");
+
+        EnergySale memory sale = energySales[saleId];
+        payable(sale.sellerAddress).transfer(totalPrice);
+
+        sale.energy -= _amount;
+        if (sale.energy == 0) {
+            uint256 index = openSaleSlot[saleId] - 1;
+            uint256 lastId = openSaleIds[openSaleIds.length - 1];
+            openSaleIds[index] = lastId;
+            openSaleSlot[lastId] = index + 1;
+            openSaleIds.pop();
+            delete openSaleSlot[saleId];
+            delete energySales[saleId];
+        } else {
+            energySales[saleId].energy = sale.energy;
+            energySales[saleId].price = sale.price - totalPrice;
+        }
+
+        string memory buyerName = usernames[msg.sender];
+        userTransactions[msg.sender].push(Transaction(buyerName, sale.sellerName, 0, _amount, totalPrice, block.timestamp));
+        userTransactions[sale.sellerAddress].push(Transaction(sale.sellerName, buyerName, _amount, 0, totalPrice, block.timestamp));
+
+        emit EnergyBought(saleId, msg.sender, sale.sellerAddress, _amount, totalPrice, sale.energy, block.timestamp);
+    }
+
+    function displayTransactionsPage(uint256 offset, uint256 limit) public view returns (Transaction[] memory) {
+        Transaction[] storage all = userTransactions[msg.sender];
+        uint256 size = offset >= all.length ? 0 : (limit < all.length - offset ? limit : all.length - offset);
+        Transaction[] memory page = new Transaction[](size);
+        for (uint256 i = 0; i < size; i++) {
+            page[i] = all[offset + i];
+        }
+        return page;
+    }
+}
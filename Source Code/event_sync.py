@@ -0,0 +1,80 @@
+import logging
+
+# The contract's events and the row layouts shared by every reader of its state: EventDecoder turns raw eth_getLogs
+# results into events for the chain index (indexer.py) and the live feed (live_updates.py), and expand_record() turns
+# the contract's packed history records into history rows.
+
+CONTRACT_EVENTS = [
+    "UserRegistered",
+    "ManagerAssigned",
+    "PanelAdded",
+    "EnergyPosted",
+    "EnergyBought",
+    "EnergyProduced",
+    "EnergyConsumed",
+    "EnergyAllocated",
+    "EnergyBalanceReduced",
+]
+
+# Row layouts mirror the contract structs so the GUI can index them exactly like call() results
+PANEL_ID, PANEL_CAPACITY, PANEL_LOCATION, PANEL_PRODUCED, PANEL_CONSUMED, PANEL_BALANCE, PANEL_EFFICIENCY, PANEL_OWNER = range(8)
+SALE_SELLER_NAME, SALE_SELLER_ADDRESS, SALE_ENERGY, SALE_PRICE, SALE_ID = range(5)
+
+# Fields of the packed Transaction struct the contract's history views return; history rows are laid out as
+# (from name, to name, produced, consumed, tokens, timestamp), see expand_record()
+RECORD_COUNTERPARTY, RECORD_TIMESTAMP, RECORD_PRODUCED, RECORD_CONSUMED, RECORD_TOKENS = range(5)
+
+# An address with no registered user behind it, also the counterparty of production and consumption records
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+
+
+def event_signature(abi_entry):
+    # Canonical signature used as topic0, e.g. EnergyPosted(uint256,address,uint256,uint256)
+    types = ",".join(canonical_type(item) for item in abi_entry['inputs'])
+    return f"{abi_entry['name']}({types})"
+
+
+def canonical_type(item):
+    if item['type'].startswith('tuple'):
+        inner = ",".join(canonical_type(component) for component in item['components'])
+        return f"({inner}){item['type'][len('tuple'):]}"
+    return item['type']
+
+
+class EventDecoder:
+    # Maps topic0 of the contract's logs to the matching web3 event so raw eth_getLogs results can be decoded
+    def __init__(self, web3, contract):
+        self.events_by_topic = {}
+        for entry in contract.abi:
+            if entry.get('type') == 'event' and entry['name'] in CONTRACT_EVENTS:
+                topic = web3.keccak(text=event_signature(entry)).hex()
+                self.events_by_topic[normalize_topic(topic)] = getattr(contract.events, entry['name'])()
+
+    def decode(self, log):
+        # Returns the decoded event (with 'event' and 'args') or None for logs this client does not know
+        if not log['topics']:
+            return None
+        event = self.events_by_topic.get(normalize_topic(log['topics'][0]))
+        if event is None:
+            return None
+        try:
+            return event.process_log(log)
+        except Exception as e:
+            logging.error(f"Failed to decode log {log.get('transactionHash')}: {e}")
+            return None
+
+
+def expand_record(owner, record, username_of):
+    # A packed Transaction record stored under owner as a history row; username_of(address) is normally cached
+    counterparty = record[RECORD_COUNTERPARTY]
+    receiver = username_of(counterparty) if counterparty != ZERO_ADDRESS else ""
+    return (username_of(owner), receiver, record[RECORD_PRODUCED], record[RECORD_CONSUMED], record[RECORD_TOKENS],
+            record[RECORD_TIMESTAMP])
+
+
+def normalize_topic(topic):
+    # Topics come back as HexBytes from the node and as str from keccak().hex(), with or without the 0x prefix
+    if not isinstance(topic, str):
+        topic = topic.hex()
+    topic = topic.lower()
+    return topic if topic.startswith('0x') else '0x' + topic
@@ -0,0 +1,186 @@
+import csv
+import json
+import os
+
+# Streams the full transaction history or panel list of an account, or of every user a manager manages, from the
+# local chain index to CSV, JSON-lines or Parquet. Rows are read and written one chunk at a time, so memory stays at
+# one chunk however many millions of rows there are and the file grows as the export runs. Used by the manager
+# dashboard's Export button and by `service.py export` (and the service's /export endpoint for CSV and JSON-lines).
+#
+#   export(client, manager, "transactions", "history.csv", is_manager=True,
+#          progress=lambda written, total: print(written, total))
+
+CSV = "csv"
+JSON_LINES = "jsonl"
+PARQUET = "parquet"
+FORMATS = [CSV, JSON_LINES, PARQUET]
+
+# File extension -> format
+EXTENSIONS = {".csv": CSV, ".jsonl": JSON_LINES, ".ndjson": JSON_LINES, ".parquet": PARQUET, ".pq": PARQUET}
+
+TRANSACTIONS = "transactions"
+PANELS = "panels"
+KINDS = [TRANSACTIONS, PANELS]
+
+# Columns of each kind with their Parquet types; token amounts are wei and can overflow int64, so Parquet gets them
+# as decimal strings
+FIELDS = {
+    TRANSACTIONS: [("number", "int64"), ("account", "string"), ("from", "string"), ("to", "string"),
+                   ("produced", "int64"), ("consumed", "int64"), ("tokens", "string"), ("timestamp", "int64"),
+                   ("block_number", "int64")],
+    PANELS: [("panel_id", "int64"), ("capacity", "int64"), ("location", "string"), ("produced", "int64"),
+             ("consumed", "int64"), ("balance", "int64"), ("efficiency", "int64"), ("owner", "string")],
+}
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+class ExportError(Exception):
+    pass
+
+
+class ExportCancelled(ExportError):
+    pass
+
+
+def format_of(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ExportError(f"Cannot tell the format of {path}, use one of {', '.join(EXTENSIONS)}")
+    return EXTENSIONS[extension]
+
+
+class CsvWriter:
+    def __init__(self, stream, fields):
+        self.stream = stream
+        self.writer = csv.writer(stream)
+        self.writer.writerow(name for name, _ in fields)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class JsonLinesWriter:
+    def __init__(self, stream, fields):
+        self.stream = stream
+        self.names = [name for name, _ in fields]
+
+    def write(self, rows):
+        self.stream.write("".join(json.dumps(dict(zip(self.names, row))) + "\n" for row in rows))
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    # One row group per chunk
+    def __init__(self, path, fields):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ExportError("Parquet export needs the pyarrow package")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(name, pyarrow.type_for_alias(kind)) for name, kind in fields])
+        self.strings = [kind == "string" for _, kind in fields]
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        columns = [[str(value) for value in column] if string else list(column)
+                   for column, string in zip(zip(*rows), self.strings)]
+        self.writer.write_table(self.pyarrow.Table.from_arrays(
+            [self.pyarrow.array(column, field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def text_writer(fmt, stream, kind):
+    # A CSV or JSON-lines writer on an open text stream, e.g. an HTTP response
+    if fmt == CSV:
+        return CsvWriter(stream, FIELDS[kind])
+    if fmt == JSON_LINES:
+        return JsonLinesWriter(stream, FIELDS[kind])
+    raise ExportError(f"Cannot stream {fmt}, use {CSV} or {JSON_LINES}")
+
+
+def read_chunks(client, account, kind, is_manager=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Returns (total rows, iterator over chunks of rows laid out like FIELDS[kind])
+    if kind not in KINDS:
+        raise ExportError(f"Unknown export {kind}, expected one of {', '.join(KINDS)}")
+    client.sync()
+    indexer = client.indexer
+    accounts = client.visible_accounts(account, is_manager)
+    if kind == PANELS:
+        return indexer.count_panels(accounts), checked(indexer, indexer.iter_panels(accounts, chunk_size))
+    chunks = checked(indexer, indexer.iter_transactions(accounts, chunk_size))
+    return indexer.count_transactions(accounts), numbered(chunks)
+
+
+def checked(indexer, chunks):
+    # A reorg rolls the index back and rebuilds it; rows read before and after would not belong together
+    generation = indexer.generation
+    for chunk in chunks:
+        if indexer.generation != generation:
+            raise ExportError("The chain index was rebuilt during the export, run it again")
+        yield chunk
+
+
+def numbered(chunks):
+    # Transactions are numbered like in the history views
+    number = 0
+    for chunk in chunks:
+        yield [(number + i,) + row for i, row in enumerate(chunk)]
+        number += len(chunk)
+
+
+def write_chunks(writer, chunks, total, progress=None, cancel=None):
+    # Returns the rows written. progress(written, total) is called after every chunk; setting the cancel event
+    # stops the export before the next one.
+    written = 0
+    for chunk in chunks:
+        if cancel is not None and cancel.is_set():
+            raise ExportCancelled("Export cancelled")
+        writer.write(chunk)
+        written += len(chunk)
+        if progress is not None:
+            progress(written, max(total, written))
+    writer.close()
+    return written
+
+
+def export(client, account, kind, path, fmt=None, is_manager=False, chunk_size=DEFAULT_CHUNK_SIZE, progress=None,
+           cancel=None):
+    # Writes every transaction or panel visible to account to path; the format defaults to the file's extension.
+    # A failed or cancelled export removes its partly written file.
+    fmt = fmt or format_of(path)
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format {fmt}, expected one of {', '.join(FORMATS)}")
+    total, chunks = read_chunks(client, account, kind, is_manager, chunk_size)
+    stream = None
+    if fmt == PARQUET:
+        writer = ParquetWriter(path, FIELDS[kind])
+    else:
+        stream = open(path, 'w', newline='', encoding='utf-8')
+        writer = text_writer(fmt, stream, kind)
+    try:
+        return write_chunks(writer, chunks, total, progress, cancel)
+    except BaseException:
+        if stream is not None:
+            stream.close()
+        else:
+            try:
+                writer.close()
+            except Exception:
+                pass  # Already failing; the file is removed either way
+        os.remove(path)
+        raise
+    finally:
+        if stream is not None:
+            stream.close()
@@ -0,0 +1,512 @@
+import argparse
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from batch_reads import BatchReader
+from event_sync import EventDecoder
+
+# Local SQLite index of the EnergyManagement contract. Every contract event is stored once in the events table and
+# applied to indexed users/panels/transactions/sales tables, so the GUI can read history, offers and the manager
+# dashboard from disk in milliseconds and a restart resumes from the last processed block.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    block_number INTEGER PRIMARY KEY,
+    block_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    block_hash TEXT NOT NULL,
+    name TEXT NOT NULL,
+    args TEXT NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE TABLE IF NOT EXISTS users (
+    address TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    is_manager INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS users_by_username ON users (username);
+CREATE TABLE IF NOT EXISTS managers (
+    manager TEXT NOT NULL,
+    user TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (manager, position)
+);
+CREATE TABLE IF NOT EXISTS panels (
+    owner TEXT NOT NULL,
+    panel_id INTEGER NOT NULL,
+    capacity INTEGER NOT NULL,
+    location TEXT NOT NULL,
+    produced INTEGER NOT NULL,
+    consumed INTEGER NOT NULL,
+    balance INTEGER NOT NULL,
+    efficiency INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS panels_by_owner ON panels (owner, panel_id);
+CREATE TABLE IF NOT EXISTS transactions (
+    account TEXT NOT NULL,
+    from_address TEXT NOT NULL,
+    to_address TEXT,
+    produced INTEGER NOT NULL,
+    consumed INTEGER NOT NULL,
+    tokens TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    panel_id INTEGER
+);
+CREATE INDEX IF NOT EXISTS transactions_by_account ON transactions (account, timestamp);
+CREATE TABLE IF NOT EXISTS sales (
+    sale_id INTEGER PRIMARY KEY,
+    seller TEXT NOT NULL,
+    energy INTEGER NOT NULL,
+    price TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sales_by_seller ON sales (seller);
+"""
+
+# Tables rebuilt from the events table after a reorg
+DERIVED_TABLES = ["users", "managers", "panels", "transactions", "sales"]
+
+# Bumped whenever a table layout changes; an index written with another layout is rebuilt from scratch
+SCHEMA_VERSION = "3"
+
+# How many checkpoint hashes to keep for finding the common ancestor after a reorg
+CHECKPOINT_HISTORY = 256
+
+
+class ChainIndexer:
+    def __init__(self, web3, contract, db_path="lumin_index.db", start_block=0, batch_size=2000, confirmations=0,
+                 session=None):
+        self.web3 = web3
+        self.contract = contract
+        self.session = session  # requests session for batched reads, shared with the rest of the client
+        self.batch_size = batch_size
+        self.confirmations = confirmations
+        self.decoder = EventDecoder(web3, contract)
+        self.lock = threading.RLock()
+        self.head = None  # Chain head seen by the last sync
+        self.generation = 0  # Bumped whenever indexed rows are rewritten, so incremental readers start over
+        self.sale_changes = set()  # Ids of the sales posted, filled or changed since take_sale_changes()
+
+        # One connection shared by the GUI's worker threads, serialised through self.lock
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        if self.get_meta("schema_version") != SCHEMA_VERSION:
+            for table in ["meta", "checkpoints", "events"] + DERIVED_TABLES:
+                self.db.execute(f"DROP TABLE IF EXISTS {table}")
+            self.db.executescript(SCHEMA)
+            self.set_meta("schema_version", SCHEMA_VERSION)
+            self.db.commit()
+
+        # An index only ever belongs to one deployment; starting over is cheaper than mixing two contracts
+        if self.get_meta("contract") not in (None, contract.address):
+            logging.error(f"Index {db_path} belongs to another contract, rebuilding it")
+            self.reset()
+        if self.get_meta("contract") is None:
+            self.set_meta("contract", contract.address)
+            self.set_meta("schema_version", SCHEMA_VERSION)
+            self.set_meta("start_block", str(start_block))
+            self.set_meta("checkpoint", str(start_block - 1))
+            self.db.commit()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+    def get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def checkpoint(self):
+        return int(self.get_meta("checkpoint"))
+
+    def reset(self):
+        with self.lock:
+            for table in ["meta", "checkpoints", "events"] + DERIVED_TABLES:
+                self.db.execute(f"DELETE FROM {table}")
+            self.db.commit()
+            self.generation += 1
+
+    def sync(self, batch=None):
+        # Index every block up to the head (minus confirmations); returns the number of events stored. The head, the
+        # reorg check and the first range of logs go out as one JSON-RPC batch, together with any reads the caller
+        # already queued on batch, so an up-to-date index costs a single round-trip.
+        with self.lock:
+            checkpoint = self.checkpoint
+            stored = self.db.execute("SELECT block_hash FROM checkpoints WHERE block_number = ?",
+                                     (checkpoint,)).fetchone()
+            batch = batch if batch is not None else BatchReader(self.web3, self.session)
+            latest = batch.get_block('latest')
+            current = batch.get_block(checkpoint) if stored else None
+            first_end = checkpoint + self.batch_size
+            logs = batch.get_logs({'address': self.contract.address, 'fromBlock': checkpoint + 1, 'toBlock': first_end})
+            batch.execute()
+
+            if current is not None and (current.result is None or to_hex(current.result['hash']) != stored[0]):
+                self.handle_reorg()
+                self.head = self.web3.eth.block_number
+                return self.index_range(self.checkpoint, self.head - self.confirmations)
+
+            self.head = latest.result['number']
+            head = self.head - self.confirmations
+            end = min(first_end, head)
+            applied = 0
+            # A node may reject a first range that reaches past its head, as eth-tester does; index_range() then reads
+            # it again without the blocks that do not exist yet
+            if end > checkpoint and logs.error is None:
+                if end == latest.result['number']:
+                    block_hash = latest.result['hash']
+                else:
+                    block_hash = self.web3.eth.get_block(end)['hash']
+                applied = self.store_range([log for log in logs.result if log['blockNumber'] <= end], end, block_hash)
+                checkpoint = end
+            return applied + self.index_range(checkpoint, head)
+
+    def index_range(self, checkpoint, head):
+        applied = 0
+        while checkpoint < head:
+            start = checkpoint + 1
+            end = min(start + self.batch_size - 1, head)
+            logs = self.web3.eth.get_logs({'address': self.contract.address, 'fromBlock': start, 'toBlock': end})
+            block = self.web3.eth.get_block(end)
+            applied += self.store_range(logs, end, block['hash'])
+            checkpoint = end
+        return applied
+
+    def store_range(self, logs, end, block_hash):
+        # Each batch is committed together with its checkpoint so an interrupted sync resumes cleanly
+        applied = 0
+        with self.db:
+            for log in logs:
+                if self.store_log(log):
+                    applied += 1
+            self.set_meta("checkpoint", str(end))
+            self.db.execute("INSERT OR REPLACE INTO checkpoints (block_number, block_hash) VALUES (?, ?)",
+                            (end, to_hex(block_hash)))
+            self.db.execute("DELETE FROM checkpoints WHERE block_number < ?", (end - CHECKPOINT_HISTORY,))
+        return applied
+
+    def handle_reorg(self):
+        # Compare stored checkpoint hashes with the chain, newest first, and roll back to the last one that matches
+        rows = self.db.execute("SELECT block_number, block_hash FROM checkpoints ORDER BY block_number DESC").fetchall()
+        head = self.web3.eth.block_number if rows else 0
+        for i, (block_number, block_hash) in enumerate(rows):
+            block = self.web3.eth.get_block(block_number) if block_number <= head else None
+            if block is not None and to_hex(block['hash']) == block_hash:
+                if i > 0:
+                    logging.error(f"Chain reorganisation detected, rolling the index back to block {block_number}")
+                    self.rollback(block_number)
+                return
+        if rows:
+            logging.error("Chain reorganisation deeper than the stored checkpoints, rebuilding the index")
+            self.rollback(int(self.get_meta("start_block")) - 1)
+
+    def rollback(self, block_number):
+        with self.db:
+            self.db.execute("DELETE FROM events WHERE block_number > ?", (block_number,))
+            self.db.execute("DELETE FROM checkpoints WHERE block_number > ?", (block_number,))
+            self.set_meta("checkpoint", str(block_number))
+            for table in DERIVED_TABLES:
+                self.db.execute(f"DELETE FROM {table}")
+            events = self.db.execute("SELECT block_number, name, args FROM events ORDER BY block_number, log_index")
+            for event_block, name, args in events.fetchall():
+                self.apply(name, json.loads(args), event_block)
+            self.generation += 1
+
+    def store_log(self, log):
+        decoded = self.decoder.decode(log)
+        if decoded is None:
+            return False
+        args = {key: value for key, value in decoded['args'].items()}
+        self.db.execute("INSERT OR REPLACE INTO events (block_number, log_index, block_hash, name, args) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (log['blockNumber'], log['logIndex'], to_hex(log['blockHash']), decoded['event'],
+                         json.dumps(args)))
+        self.apply(decoded['event'], args, log['blockNumber'])
+        return True
+
+    def apply(self, name, args, block_number):
+        db = self.db
+        if name == "UserRegistered":
+            db.execute("INSERT OR REPLACE INTO users (address, username, is_manager) VALUES (?, ?, ?)",
+                       (args['user'], args['username'], int(args['isManager'])))
+
+        elif name == "ManagerAssigned":
+            db.execute("DELETE FROM managers WHERE manager = ?", (args['manager'],))
+            db.executemany("INSERT INTO managers (manager, user, position) VALUES (?, ?, ?)",
+                           [(args['manager'], user, i) for i, user in enumerate(args['users'])])
+
+        elif name == "PanelAdded":
+            produced = args['producedEnergy']
+            consumed = args['consumedEnergy']
+            db.execute("INSERT INTO panels (owner, panel_id, capacity, location, produced, consumed, balance, efficiency) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                       (args['owner'], args['panelId'], args['capacity'], args['location'], produced, consumed,
+                        produced - consumed if produced > consumed else 0, args['efficiency']))
+
+        elif name == "EnergyPosted":
+            self.sale_changes.add(args['saleId'])
+            db.execute("INSERT OR REPLACE INTO sales (sale_id, seller, energy, price) VALUES (?, ?, ?, ?)",
+                       (args['saleId'], args['seller'], args['energy'], str(args['price'])))
+
+        elif name == "EnergyBought":
+            sale_id = args['saleId']
+            self.sale_changes.add(sale_id)
+            if args['remainingEnergy'] == 0:
+                db.execute("DELETE FROM sales WHERE sale_id = ?", (sale_id,))
+            else:
+                # The price left is for the energy left
+                row = db.execute("SELECT price FROM sales WHERE sale_id = ?", (sale_id,)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE sales SET energy = ?, price = ? WHERE sale_id = ?",
+                               (args['remainingEnergy'], str(int(row[0]) - args['totalPrice']), sale_id))
+            db.executemany("INSERT INTO transactions (account, from_address, to_address, produced, consumed, tokens, "
+                           "timestamp, block_number) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           [(args['buyer'], args['buyer'], args['seller'], 0, args['amount'], str(args['totalPrice']),
+                             args['timestamp'], block_number),
+                            (args['seller'], args['seller'], args['buyer'], args['amount'], 0, str(args['totalPrice']),
+                             args['timestamp'], block_number)])
+
+        elif name in ("EnergyProduced", "EnergyConsumed", "EnergyAllocated", "EnergyBalanceReduced"):
+            energy = args['amount'] if name == "EnergyBalanceReduced" else args['energy']
+            if name in ("EnergyProduced", "EnergyAllocated"):
+                update, params = "produced = produced + ?, balance = balance + ?", (energy, energy)
+            elif name == "EnergyConsumed":
+                update, params = "consumed = consumed + ?, balance = balance - ?", (energy, energy)
+            else:
+                update, params = "balance = balance - ?", (energy,)
+            # The contract updates the first panel with a matching id
+            db.execute(f"UPDATE panels SET {update} WHERE rowid = "
+                       "(SELECT rowid FROM panels WHERE owner = ? AND panel_id = ? ORDER BY rowid LIMIT 1)",
+                       params + (args['owner'], args['panelId']))
+
+            if name in ("EnergyProduced", "EnergyConsumed"):
+                produced, consumed = (energy, 0) if name == "EnergyProduced" else (0, energy)
+                db.execute("INSERT INTO transactions (account, from_address, to_address, produced, consumed, tokens, "
+                           "timestamp, block_number, panel_id) VALUES (?, ?, NULL, ?, ?, '0', ?, ?, ?)",
+                           (args['owner'], args['owner'], produced, consumed, args['timestamp'], block_number,
+                            args['panelId']))
+
+    # Read side: rows come back laid out like the contract structs so the GUI can use them like call() results
+
+    def get_user(self, address):
+        with self.lock:
+            return self.db.execute("SELECT username, is_manager FROM users WHERE address = ?", (address,)).fetchone()
+
+    def get_managed_users(self, manager):
+        with self.lock:
+            rows = self.db.execute("SELECT user FROM managers WHERE manager = ? ORDER BY position", (manager,))
+            return [row[0] for row in rows.fetchall()]
+
+    def get_sales(self):
+        # Open sales in posting order
+        with self.lock:
+            rows = self.db.execute("SELECT COALESCE(u.username, ''), s.seller, s.energy, s.price, s.sale_id FROM sales s "
+                                   "LEFT JOIN users u ON u.address = s.seller ORDER BY s.sale_id").fetchall()
+        return [(name, seller, energy, int(price), sale_id) for name, seller, energy, price, sale_id in rows]
+
+    def get_sale(self, sale_id):
+        # One open sale by id, or None once it has been filled
+        with self.lock:
+            row = self.db.execute("SELECT COALESCE(u.username, ''), s.seller, s.energy, s.price, s.sale_id FROM sales s "
+                                  "LEFT JOIN users u ON u.address = s.seller WHERE s.sale_id = ?", (sale_id,)).fetchone()
+        if row is None:
+            return None
+        name, seller, energy, price, sale_id = row
+        return name, seller, energy, int(price), sale_id
+
+    def take_sale_changes(self):
+        # Ids of the sales that changed since the last call, for readers keeping their own copy of the open sales
+        with self.lock:
+            changes, self.sale_changes = self.sale_changes, set()
+        return changes
+
+    def count_panels(self, owners):
+        owners = list(owners)
+        if not owners:
+            return 0
+        with self.lock:
+            placeholders = ",".join("?" * len(owners))
+            return self.db.execute(f"SELECT COUNT(*) FROM panels WHERE owner IN ({placeholders})", owners).fetchone()[0]
+
+    def get_panels(self, owners, offset=0, limit=-1):
+        # A negative limit returns every panel from offset on
+        owners = list(owners)
+        if not owners:
+            return []
+        with self.lock:
+            placeholders = ",".join("?" * len(owners))
+            rows = self.db.execute(f"SELECT panel_id, capacity, location, produced, consumed, balance, efficiency, owner "
+                                   f"FROM panels WHERE owner IN ({placeholders}) ORDER BY rowid LIMIT ? OFFSET ?",
+                                   owners + [limit, offset]).fetchall()
+        return [tuple(row) for row in rows]
+
+    def get_panel(self, owner, panel_id):
+        # The first panel of owner with that id, the one the contract updates, or None
+        with self.lock:
+            row = self.db.execute("SELECT panel_id, capacity, location, produced, consumed, balance, efficiency, owner "
+                                  "FROM panels WHERE owner = ? AND panel_id = ? ORDER BY rowid LIMIT 1",
+                                  (owner, panel_id)).fetchone()
+        return tuple(row) if row is not None else None
+
+    # Transactions of several accounts are listed account by account, in the order the accounts are given, and in
+    # the order they were recorded within each account. That is how displayManagedTransactions lists a manager's
+    # users (get_managed_users() order), so row numbers match the contract's indices.
+
+    def count_transactions(self, accounts):
+        accounts = list(accounts)
+        if not accounts:
+            return 0
+        with self.lock:
+            return self.db.execute(f"{listed(accounts)} SELECT COUNT(*) FROM listed l "
+                                   "JOIN transactions x ON x.account = l.account",
+                                   listed_params(accounts)).fetchone()[0]
+
+    def get_transactions(self, accounts, offset=0, limit=-1):
+        # A negative limit returns every transaction from offset on
+        accounts = list(accounts)
+        if not accounts:
+            return []
+        with self.lock:
+            rows = self.db.execute(f"{listed(accounts)} SELECT COALESCE(f.username, ''), COALESCE(t.username, ''), "
+                                   "x.produced, x.consumed, x.tokens, x.timestamp FROM listed l "
+                                   "JOIN transactions x ON x.account = l.account "
+                                   "LEFT JOIN users f ON f.address = x.from_address "
+                                   "LEFT JOIN users t ON t.address = x.to_address "
+                                   "ORDER BY l.position, x.rowid LIMIT ? OFFSET ?",
+                                   listed_params(accounts) + [limit, offset]).fetchall()
+        return [(sender, receiver, produced, consumed, int(tokens), timestamp)
+                for sender, receiver, produced, consumed, tokens, timestamp in rows]
+
+    # Chunked reads for exports: keyset pagination on rowid (on account position and rowid for transactions), so
+    # every chunk costs the same however deep the export is, and the lock is only held while a chunk is read
+
+    def iter_transactions(self, accounts, chunk_size=5000):
+        # Lists of (account, from name, to name, produced, consumed, tokens, timestamp, block number)
+        accounts = list(accounts)
+        if not accounts:
+            return
+        last_position, last_rowid = 0, 0
+        while True:
+            with self.lock:
+                rows = self.db.execute(f"{listed(accounts)} SELECT l.position, x.rowid, x.account, "
+                                       "COALESCE(f.username, ''), COALESCE(t.username, ''), x.produced, x.consumed, "
+                                       "x.tokens, x.timestamp, x.block_number FROM listed l "
+                                       "JOIN transactions x ON x.account = l.account "
+                                       "LEFT JOIN users f ON f.address = x.from_address "
+                                       "LEFT JOIN users t ON t.address = x.to_address "
+                                       "WHERE (l.position, x.rowid) > (?, ?) ORDER BY l.position, x.rowid LIMIT ?",
+                                       listed_params(accounts) + [last_position, last_rowid, chunk_size]).fetchall()
+            if not rows:
+                return
+            last_position, last_rowid = rows[-1][:2]
+            yield [(account, sender, receiver, produced, consumed, int(tokens), timestamp, block_number)
+                   for _, _, account, sender, receiver, produced, consumed, tokens, timestamp, block_number in rows]
+
+    def iter_panels(self, owners, chunk_size=5000):
+        # Lists of panels laid out like get_panels()
+        owners = list(owners)
+        if not owners:
+            return
+        placeholders = ",".join("?" * len(owners))
+        last_rowid = 0
+        while True:
+            with self.lock:
+                rows = self.db.execute("SELECT rowid, panel_id, capacity, location, produced, consumed, balance, "
+                                       f"efficiency, owner FROM panels WHERE owner IN ({placeholders}) AND rowid > ? "
+                                       "ORDER BY rowid LIMIT ?", owners + [last_rowid, chunk_size]).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield [tuple(row[1:]) for row in rows]
+
+    # Column reads for the analytics engine: every account at once, in insertion order
+
+    def get_transaction_columns(self, after_rowid=0):
+        # (rowid, account, panel_id, produced, consumed, tokens, timestamp, is_trade) of the rows added after
+        # after_rowid; panel_id is None for trades, is_trade is 0 for metered production and consumption
+        with self.lock:
+            rows = self.db.execute("SELECT rowid, account, panel_id, produced, consumed, tokens, timestamp, "
+                                   "to_address IS NOT NULL FROM transactions WHERE rowid > ? ORDER BY rowid",
+                                   (after_rowid,)).fetchall()
+        return [(rowid, account, panel_id, produced, consumed, int(tokens), timestamp, is_trade)
+                for rowid, account, panel_id, produced, consumed, tokens, timestamp, is_trade in rows]
+
+    def get_panel_columns(self):
+        # (owner, panel_id, capacity, produced, consumed, efficiency) of every panel
+        with self.lock:
+            rows = self.db.execute("SELECT owner, panel_id, capacity, produced, consumed, efficiency FROM panels "
+                                   "ORDER BY rowid").fetchall()
+        return [tuple(row) for row in rows]
+
+    def get_manager_assignments(self):
+        # (manager, user) for every managed user
+        with self.lock:
+            rows = self.db.execute("SELECT manager, user FROM managers ORDER BY manager, position").fetchall()
+        return [tuple(row) for row in rows]
+
+
+def listed(accounts):
+    # A "listed" table of (account, position) for the accounts in the order given, see listed_params(). An account
+    # listed twice, as a manager's users can be, has its transactions listed twice like on chain.
+    return "WITH listed (account, position) AS (VALUES " + ",".join(["(?, ?)"] * len(accounts)) + ")"
+
+
+def listed_params(accounts):
+    return [value for position, account in enumerate(accounts) for value in (account, position)]
+
+
+def to_hex(value):
+    if isinstance(value, str):
+        return value.lower()
+    return '0x' + bytes(value).hex()
+
+
+def main():
+    from web3 import Web3
+
+    parser = argparse.ArgumentParser(description="Index the EnergyManagement contract into a local SQLite database")
+    parser.add_argument("--rpc", default="http://127.0.0.1:8545", help="JSON-RPC endpoint of the node")
+    parser.add_argument("--address", required=True, help="Deployed EnergyManagement contract address")
+    parser.add_argument("--abi", default="build/contracts/EnergyManagement.json", help="Truffle artifact with the ABI")
+    parser.add_argument("--db", default="lumin_index.db", help="SQLite database file")
+    parser.add_argument("--start-block", type=int, default=0, help="Block the contract was deployed in")
+    parser.add_argument("--confirmations", type=int, default=0, help="Blocks to stay behind the head")
+    parser.add_argument("--follow", action="store_true", help="Keep indexing new blocks")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between syncs when following")
+    args = parser.parse_args()
+
+    with open(args.abi, 'r') as abi_file:
+        abi = json.load(abi_file)['abi']
+    web3 = Web3(Web3.HTTPProvider(args.rpc))
+    contract = web3.eth.contract(address=args.address, abi=abi)
+    indexer = ChainIndexer(web3, contract, args.db, start_block=args.start_block, confirmations=args.confirmations)
+
+    try:
+        while True:
+            applied = indexer.sync()
+            print(f"Indexed {applied} events up to block {indexer.checkpoint}")
+            if not args.follow:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        indexer.close()
+
+
+if __name__ == "__main__":
+    main()
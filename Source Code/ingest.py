@@ -0,0 +1,335 @@
+import argparse
+import collections
+import csv
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+
+import requests
+from urllib3.exceptions import NewConnectionError
+
+from provider_pool import ProviderPoolError
+from tx_pipeline import TransactionPipeline, TransactionFailed, TransactionTimeout
+
+# Headless ingestion of panel meter readings. Readings are streamed from CSV or JSON-lines files (or stdin), summed
+# per panel over a time window and sent as recordReadings(panelIds, deltas) transactions, several in flight at once.
+# Bounded queues between the stages slow the reader down when the chain cannot keep up, a batch the node never
+# received is sent again with backoff, one that is not mined in time is waited for rather than sent twice, and a batch
+# that reverts is split until the reading at fault is found and dropped.
+#
+#   python ingest.py --address 0x... --account 0x... readings.csv more.jsonl
+#   tail -f meter.jsonl | python ingest.py --address 0x... --account 0x... --format jsonl
+#
+# A reading has a panel_id and either a signed delta (kWh, positive for production) or produced/consumed columns,
+# plus an optional unix timestamp; without one the time it was read is used.
+
+
+class Batch:
+    def __init__(self, entries, attempts=0):
+        self.entries = entries  # (panel id, delta in kWh, number of readings summed into it)
+        self.attempts = attempts
+        self.not_before = 0.0
+
+    @property
+    def readings(self):
+        return sum(count for _, _, count in self.entries)
+
+    def split(self):
+        middle = len(self.entries) // 2
+        return Batch(self.entries[:middle], self.attempts), Batch(self.entries[middle:], self.attempts)
+
+
+def parse_reading(record):
+    panel_id = int(record['panel_id'])
+    if record.get('delta') not in (None, ''):
+        delta = float(record['delta'])
+    else:
+        delta = float(record.get('produced') or 0) - float(record.get('consumed') or 0)
+    timestamp = float(record['timestamp']) if record.get('timestamp') not in (None, '') else time.time()
+    return panel_id, delta, timestamp
+
+
+def read_records(source, fmt):
+    stream = sys.stdin if source == '-' else open(source, 'r', newline='')
+    try:
+        if fmt == 'csv':
+            yield from csv.DictReader(stream)
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def source_format(source, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if source.lower().endswith('.csv') else 'jsonl'
+
+
+class WindowAggregator:
+    # Sums deltas per panel until the window closes or max_panels panels are waiting. Contract amounts are whole kWh,
+    # so the fraction left after rounding is carried into the panel's next window instead of being lost.
+    def __init__(self, window, max_panels):
+        self.window = window
+        self.max_panels = max_panels
+        self.window_start = None
+        self.totals = collections.OrderedDict()  # panel id -> [delta, readings]
+        self.carry = {}
+
+    def add(self, panel_id, delta, timestamp):
+        batches = []
+        if self.window_start is None:
+            self.window_start = timestamp
+        elif timestamp >= self.window_start + self.window:
+            batches.append(self.flush())
+            self.window_start = timestamp
+
+        total = self.totals.setdefault(panel_id, [0.0, 0])
+        total[0] += delta
+        total[1] += 1
+        if len(self.totals) >= self.max_panels:
+            batches.append(self.flush())
+        return [batch for batch in batches if batch is not None]
+
+    def flush(self):
+        entries = []
+        for panel_id, (delta, count) in self.totals.items():
+            exact = delta + self.carry.get(panel_id, 0.0)
+            whole = int(round(exact))
+            self.carry[panel_id] = exact - whole
+            if whole != 0:
+                entries.append((panel_id, whole, count))
+        self.totals.clear()
+        return Batch(entries) if entries else None
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.read = 0
+        self.malformed = 0
+        self.recorded = 0
+        self.rejected = 0
+        self.transactions = 0
+        self.retries = 0
+
+    def add(self, **counts):
+        with self.lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def report(self):
+        with self.lock:
+            elapsed = max(time.monotonic() - self.started, 1e-9)
+            return (f"read {self.read} ({self.read / elapsed:.1f}/s), recorded {self.recorded} "
+                    f"({self.recorded / elapsed:.1f}/s) in {self.transactions} transactions, "
+                    f"rejected {self.rejected}, malformed {self.malformed}, retries {self.retries}")
+
+
+class Submitter:
+    # Sends batches through the pipeline with at most max_in_flight transactions waiting for receipts
+    def __init__(self, contract, pipeline, account, stats, max_in_flight=4, retries=5, backoff=1.0):
+        self.contract = contract
+        self.pipeline = pipeline
+        self.account = account
+        self.stats = stats
+        self.retries = retries
+        self.backoff = backoff
+        self.slots = threading.Semaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.retry_batches = collections.deque()
+
+    def run(self, batches):
+        # batches is a bounded queue ending with None; returns once every batch has settled
+        finished = False
+        while True:
+            batch = self.next_retry()
+            if batch is None and not finished:
+                try:
+                    batch = batches.get(timeout=0.2)
+                except queue.Empty:
+                    continue
+                if batch is None:
+                    finished = True
+                    continue
+            if batch is None:
+                with self.lock:
+                    if self.in_flight == 0 and not self.retry_batches:
+                        return
+                time.sleep(0.2)
+                continue
+            self.send(batch)
+
+    def next_retry(self):
+        with self.lock:
+            if self.retry_batches and self.retry_batches[0].not_before <= time.monotonic():
+                return self.retry_batches.popleft()
+        return None
+
+    def send(self, batch):
+        self.slots.acquire()
+        with self.lock:
+            self.in_flight += 1
+        panel_ids = [panel_id for panel_id, _, _ in batch.entries]
+        deltas = [delta for _, delta, _ in batch.entries]
+        try:
+            future = self.pipeline.send(self.contract.functions.recordReadings(panel_ids, deltas), {'from': self.account})
+        except Exception as e:
+            self.settle(batch, e, sent=False)
+            return
+        self.stats.add(transactions=1)
+        self.watch(batch, future)
+
+    def watch(self, batch, future):
+        future.add_done_callback(lambda done: self.settle(batch, done.exception(), sent=True))
+
+    def settle(self, batch, error, sent):
+        # sent is False when pipeline.send raised, True once the node has returned a transaction hash
+        if error is None:
+            self.stats.add(recorded=batch.readings)
+        elif is_revert(error):
+            # Some reading in the batch breaks a contract rule (e.g. exceeds the panel's capacity): narrow it down
+            if len(batch.entries) > 1:
+                with self.lock:
+                    self.retry_batches.extend(batch.split())
+            else:
+                panel_id, delta, count = batch.entries[0]
+                logging.error(f"Dropping {count} readings for panel {panel_id} (delta {delta}): {error}")
+                self.stats.add(rejected=count)
+        elif isinstance(error, TransactionTimeout) and batch.attempts < self.retries:
+            # The transaction may still be mined, and a new one for the same batch would record its readings twice:
+            # keep waiting for the original. Later nonces are asked from the node again in case it was dropped.
+            batch.attempts += 1
+            logging.error(f"Still waiting for a batch of {batch.readings} readings (attempt {batch.attempts}): {error}")
+            self.stats.add(retries=1)
+            self.pipeline.reset(self.account)
+            self.watch(batch, self.pipeline.track(error.tx_hash, "recordReadings"))
+            return  # Still in flight
+        elif not sent and never_sent(error) and batch.attempts < self.retries:
+            batch.attempts += 1
+            batch.not_before = time.monotonic() + self.backoff * 2 ** (batch.attempts - 1)
+            logging.error(f"Retrying a batch of {batch.readings} readings (attempt {batch.attempts}): {error}")
+            self.stats.add(retries=1)
+            with self.lock:
+                self.retry_batches.append(batch)
+        else:
+            unknown = "" if not sent and never_sent(error) else " (it may still be recorded)"
+            logging.error(f"Giving up on a batch of {batch.readings} readings{unknown}: {error}")
+            self.stats.add(rejected=batch.readings)
+        with self.lock:
+            self.in_flight -= 1
+        self.slots.release()
+
+
+def is_revert(error):
+    from web3.exceptions import ContractLogicError
+    return isinstance(error, (ContractLogicError, TransactionFailed))
+
+
+def never_sent(error):
+    # Whether a failed send certainly did not reach the node, so the batch can be sent again: the connection was never
+    # made, or the node answered with a JSON-RPC error (web3 raises those as ValueError). A connection that broke after
+    # the request went out may have delivered the transaction.
+    if isinstance(error, (requests.ConnectTimeout, ProviderPoolError)):
+        return True  # A ProviderPool only gives up on a transaction after connect timeouts
+    if isinstance(error, requests.ConnectionError):
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    return isinstance(error, ValueError)
+
+
+def read_sources(sources, fmt, readings, stats):
+    for source in sources:
+        try:
+            for record in read_records(source, source_format(source, fmt)):
+                try:
+                    reading = parse_reading(record)
+                except Exception as e:
+                    logging.error(f"Skipping malformed reading {record!r} from {source}: {e}")
+                    stats.add(malformed=1)
+                    continue
+                readings.put(reading)  # Blocks while the aggregator is behind
+                stats.add(read=1)
+        except Exception as e:
+            logging.error(f"Error reading {source}: {e}")
+    readings.put(None)
+
+
+def aggregate(readings, batches, aggregator):
+    # Windows also close after a quiet period, so a slow stdin stream is still submitted
+    while True:
+        try:
+            reading = readings.get(timeout=aggregator.window)
+        except queue.Empty:
+            batch = aggregator.flush()
+            if batch is not None:
+                batches.put(batch)
+            continue
+        if reading is None:
+            break
+        for batch in aggregator.add(*reading):
+            batches.put(batch)  # Blocks while the submitter is behind
+    batch = aggregator.flush()
+    if batch is not None:
+        batches.put(batch)
+    batches.put(None)
+
+
+def main():
+    from web3 import Web3
+
+    parser = argparse.ArgumentParser(description="Stream panel meter readings into the EnergyManagement contract")
+    parser.add_argument("sources", nargs="*", default=["-"], help="CSV or JSON-lines files, - for stdin")
+    parser.add_argument("--rpc", default="http://127.0.0.1:8545", help="JSON-RPC endpoint of the node")
+    parser.add_argument("--address", required=True, help="Deployed EnergyManagement contract address")
+    parser.add_argument("--abi", default="build/contracts/EnergyManagement.json", help="Truffle artifact with the ABI")
+    parser.add_argument("--account", required=True, help="Unlocked account that owns the panels")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format (default: from the file extension)")
+    parser.add_argument("--window", type=float, default=60.0, help="Seconds of readings summed per panel")
+    parser.add_argument("--batch-size", type=int, default=50, help="Most panels per transaction")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="Most transactions waiting to be mined")
+    parser.add_argument("--queue-size", type=int, default=16, help="Batches buffered before reading pauses")
+    parser.add_argument("--retries", type=int, default=5, help="Retries of a batch after a network error")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between throughput reports")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    with open(args.abi, 'r') as abi_file:
+        abi = json.load(abi_file)['abi']
+    web3 = Web3(Web3.HTTPProvider(args.rpc))
+    contract = web3.eth.contract(address=args.address, abi=abi)
+    account = Web3.to_checksum_address(args.account)
+
+    stats = Stats()
+    readings = queue.Queue(maxsize=args.batch_size * args.queue_size)
+    batches = queue.Queue(maxsize=args.queue_size)
+    submitter = Submitter(contract, TransactionPipeline(web3), account, stats, args.max_in_flight, args.retries)
+
+    threading.Thread(target=read_sources, args=(args.sources, args.format, readings, stats), daemon=True).start()
+    threading.Thread(target=aggregate, args=(readings, batches, WindowAggregator(args.window, args.batch_size)),
+                     daemon=True).start()
+
+    def report():
+        while True:
+            time.sleep(args.report_interval)
+            print(stats.report(), flush=True)
+    threading.Thread(target=report, daemon=True).start()
+
+    try:
+        submitter.run(batches)
+    except KeyboardInterrupt:
+        pass
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
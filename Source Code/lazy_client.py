@@ -0,0 +1,37 @@
+import logging
+import threading
+
+# Stand-in for a LuminClient that is only created on first use. Importing web3, reading the ABI, connecting to the
+# node and opening the chain index all wait until then, so the GUI can show its first window straight away; warm_up()
+# starts the connection in the background while the user is still typing their password. Every attribute is looked
+# up on the real client, so code holding a LazyClient uses it like a LuminClient.
+#
+#   client = LazyClient(lambda: LuminClient.connect(rpc_urls, contract_address, abi_file_path))
+#   client.warm_up()
+#   client.login(username, password)  # Waits for the connection if warm_up() has not finished
+
+
+class LazyClient:
+    def __init__(self, connect):
+        self.connect = connect  # Returns a LuminClient; may raise, e.g. ClientError when the node is unreachable
+        self.client = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        # A failed connection is not remembered, the next use tries again
+        with self.lock:
+            if self.client is None:
+                self.client = self.connect()
+            return self.client
+
+    def warm_up(self):
+        def run():
+            try:
+                self.get()
+            except Exception as e:
+                logging.error(f"Connecting in the background failed, retrying on first use: {e}")
+        threading.Thread(target=run, name="connect", daemon=True).start()
+
+    def __getattr__(self, name):
+        # Only called for attributes the LazyClient itself does not have
+        return getattr(self.get(), name)
@@ -0,0 +1,159 @@
+import json
+import logging
+import threading
+
+from batch_reads import format_log, to_int
+from event_sync import EventDecoder
+
+# Follows the contract's logs as blocks are mined and reports which sales, panels and accounts they touched, so the
+# GUI can re-read and redraw only those rows instead of waiting for a manual refresh. Over a WebSocket endpoint it
+# subscribes to newHeads and the contract's logs (eth_subscribe); without one, or when the subscription cannot be
+# set up, it polls an eth_newFilter log filter over HTTP. Logs arriving close together, such as everything mined in
+# one block, are reported as one BlockChanges.
+
+
+class BlockChanges:
+    # Rows touched by the logs of one or more blocks; the values themselves are re-read from the index
+    def __init__(self):
+        self.head = None  # Highest block the changes were seen in
+        self.sale_ids = set()
+        self.panels = set()  # (owner, panel id)
+        self.accounts = set()  # Accounts with new transaction records
+        self.users = set()  # Registered users and managers whose user list changed
+
+    def __bool__(self):
+        return bool(self.sale_ids or self.panels or self.accounts or self.users)
+
+    def add_block(self, number):
+        if self.head is None or number > self.head:
+            self.head = number
+
+    def add_event(self, name, args, block_number):
+        self.add_block(block_number)
+        if name == "UserRegistered":
+            self.users.add(args['user'])
+        elif name == "ManagerAssigned":
+            self.users.add(args['manager'])
+        elif name == "EnergyPosted":
+            self.sale_ids.add(args['saleId'])
+        elif name == "EnergyBought":
+            self.sale_ids.add(args['saleId'])
+            self.accounts.update((args['buyer'], args['seller']))
+        elif name in ("PanelAdded", "EnergyAllocated", "EnergyBalanceReduced"):
+            self.panels.add((args['owner'], args['panelId']))
+        elif name in ("EnergyProduced", "EnergyConsumed"):
+            self.panels.add((args['owner'], args['panelId']))
+            self.accounts.add(args['owner'])
+
+    def merge(self, other):
+        if other.head is not None:
+            self.add_block(other.head)
+        self.sale_ids |= other.sale_ids
+        self.panels |= other.panels
+        self.accounts |= other.accounts
+        self.users |= other.users
+
+
+class LiveFeed:
+    # on_changes(BlockChanges) is called from the feed's own thread
+    def __init__(self, web3, contract, on_changes, ws_url=None, poll_interval=1.0, debounce=0.25, retry_delay=5.0):
+        self.web3 = web3
+        self.contract = contract
+        self.on_changes = on_changes
+        self.ws_url = ws_url
+        self.poll_interval = poll_interval
+        self.debounce = debounce  # Quiet time after a log before the batch is reported
+        self.retry_delay = retry_delay
+        self.decoder = EventDecoder(web3, contract)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="live-feed", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        # The thread notices within one poll interval or debounce period
+        self.stopped.set()
+
+    def run(self):
+        use_websocket = self.ws_url is not None
+        while not self.stopped.is_set():
+            try:
+                if use_websocket:
+                    self.follow_subscription()
+                else:
+                    self.follow_filter()
+            except ImportError:
+                logging.error("The websockets package is not installed, polling a log filter instead")
+                use_websocket = False
+            except Exception as e:
+                if use_websocket:
+                    logging.error(f"Log subscription on {self.ws_url} failed, polling a log filter instead: {e}")
+                    use_websocket = False
+                else:
+                    logging.error(f"Error polling the log filter: {e}")
+                    self.stopped.wait(self.retry_delay)
+
+    def report(self, changes):
+        if not changes:
+            return
+        try:
+            self.on_changes(changes)
+        except Exception as e:
+            logging.error(f"Error handling changes up to block {changes.head}: {e}")
+
+    def add_log(self, changes, log):
+        decoded = self.decoder.decode(log)
+        if decoded is not None:
+            changes.add_event(decoded['event'], decoded['args'], log['blockNumber'])
+
+    def follow_subscription(self):
+        from websockets.sync.client import connect
+
+        with connect(self.ws_url) as ws:
+            subscribe = [["newHeads"], ["logs", {'address': self.contract.address}]]
+            for request_id, params in enumerate(subscribe):
+                ws.send(json.dumps({'jsonrpc': '2.0', 'id': request_id, 'method': 'eth_subscribe', 'params': params}))
+
+            changes = BlockChanges()
+            while not self.stopped.is_set():
+                try:
+                    message = json.loads(ws.recv(timeout=self.debounce))
+                except TimeoutError:
+                    self.report(changes)
+                    changes = BlockChanges()
+                    continue
+                if message.get('error') is not None:
+                    raise ConnectionError(f"Subscription rejected: {message['error']}")
+                if message.get('method') != 'eth_subscription':
+                    continue  # Subscription ids answering the requests above
+                result = message['params']['result']
+                if 'topics' in result:
+                    # Logs removed by a reorganisation are reported too; the index sync rolls them back
+                    self.add_log(changes, format_log(result))
+                else:
+                    # A new head means the logs of the blocks before it are complete
+                    number = to_int(result['number'])
+                    if changes and number > changes.head:
+                        self.report(changes)
+                        changes = BlockChanges()
+                    changes.add_block(number)
+
+    def follow_filter(self):
+        log_filter = self.web3.eth.filter({'address': self.contract.address})
+        try:
+            while not self.stopped.is_set():
+                # Everything mined since the last poll is reported together
+                changes = BlockChanges()
+                for log in log_filter.get_new_entries():
+                    self.add_log(changes, log)
+                self.report(changes)
+                self.stopped.wait(self.poll_interval)
+        finally:
+            try:
+                self.web3.eth.uninstall_filter(log_filter.filter_id)
+            except Exception:
+                pass  # The node may have dropped the filter already
@@ -0,0 +1,75 @@
+import math
+from fractions import Fraction
+
+from event_sync import SALE_SELLER_ADDRESS, SALE_ENERGY, SALE_PRICE, SALE_ID
+
+# Plans "buy N kWh as cheaply as possible" orders against the open sales. The plan walks the book from the lowest price
+# per kWh up, filling the last sale partially if needed, and is settled in one matchOrder transaction that re-checks
+# every sale on chain. A few extra candidates are passed along so the order still fills if another buyer takes one
+# of the planned sales first.
+
+SPARE_CANDIDATES = 10
+
+
+def unit_price(sale):
+    # Exact wei per kWh; sale prices are for the whole remaining energy. Older deployments accepted sales of 0 kWh,
+    # which cannot be bought and are priced above everything else.
+    if sale[SALE_ENERGY] <= 0:
+        return math.inf
+    return Fraction(sale[SALE_PRICE], sale[SALE_ENERGY])
+
+
+class OrderPlan:
+    def __init__(self, amount, fills, spares, max_unit_price):
+        self.amount = amount
+        self.fills = fills  # (sale, kWh taken, wei) in fill order
+        self.spares = spares  # Sales tried on chain after the planned ones
+        self.max_unit_price = max_unit_price  # Limit in wei per kWh, or None
+
+    @property
+    def filled(self):
+        return sum(take for _, take, _ in self.fills)
+
+    @property
+    def cost(self):
+        return sum(cost for _, _, cost in self.fills)
+
+    @property
+    def sale_ids(self):
+        return [sale[SALE_ID] for sale, _, _ in self.fills] + [sale[SALE_ID] for sale in self.spares]
+
+    @property
+    def limit(self):
+        # Limit sent to the contract: the buyer's, or the highest price per kWh in the plan so the order never fills
+        # at prices the buyer was not shown
+        if self.max_unit_price is not None:
+            return self.max_unit_price
+        return max((math.ceil(unit_price(sale)) for sale, _, _ in self.fills), default=0)
+
+    @property
+    def value(self):
+        # ETH sent with the order, enough for the planned amount at the limit; matchOrder refunds what it does not spend
+        return self.limit * self.filled
+
+    def contract_call(self, contract):
+        return contract.functions.matchOrder(self.sale_ids, self.filled, self.limit)
+
+
+def plan_order(sales, amount, buyer, max_unit_price=None):
+    # sales are rows laid out like the EnergySale struct; the buyer's own sales are never matched
+    candidates = [sale for sale in sales
+                  if sale[SALE_SELLER_ADDRESS] != buyer and sale[SALE_ENERGY] > 0
+                  and (max_unit_price is None or unit_price(sale) <= max_unit_price)]
+    candidates.sort(key=lambda sale: (unit_price(sale), sale[SALE_ID]))
+
+    fills = []
+    remaining = amount
+    for sale in candidates:
+        if remaining <= 0:
+            break
+        take = min(remaining, sale[SALE_ENERGY])
+        fills.append((sale, take, sale[SALE_PRICE] * take // sale[SALE_ENERGY]))
+        remaining -= take
+
+    spares = candidates[len(fills):len(fills) + SPARE_CANDIDATES]
+    return OrderPlan(amount, fills, spares, max_unit_price)
@@ -0,0 +1,253 @@
+import logging
+import time
+from PyQt5.QtCore import Qt, QAbstractListModel, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import QListView, QTableView
+
+from metrics import metrics
+
+# Models for the history table and the manager dashboard lists. Rows are fetched one page at a time through the
+# window's TaskRunner when the view scrolls towards the end (canFetchMore/fetchMore), so opening a view with a huge
+# history only loads the first page. The Timed views record how long each repaint takes, and the models how long
+# their formatters (from_wei conversions, string building) take per row or cell.
+
+DEFAULT_PAGE_SIZE = 200
+
+
+class PageLoader:
+    # Shared paging state: fetch_page(offset, limit) runs on the worker pool and returns a list of rows
+    def __init__(self, model, tasks, key, page_size):
+        self.model = model
+        self.tasks = tasks
+        self.key = key
+        self.page_size = page_size
+        self.rows = []  # Raw row tuples as returned by the source; display text is only built in data()
+        self.total = 0
+        self.fetch_page = None
+        self.message = None  # Single status line shown instead of rows, e.g. "Failed to load panels"
+        self.base = 0  # Number of the first row, so search results keep their position in the full list
+        self.numbers = None  # Row numbers of non-contiguous search results, used instead of base
+
+    def reset(self, total, fetch_page, rows, message=None, base=0, numbers=None):
+        # Drop any page still being fetched for the previous source
+        self.tasks.cancel(self.key)
+        self.rows = list(rows)
+        self.total = total
+        self.fetch_page = fetch_page
+        self.message = message
+        self.base = base
+        self.numbers = list(numbers) if numbers is not None else None
+
+    def number(self, row):
+        if self.numbers is not None:
+            return self.numbers[row]
+        return self.base + row
+
+    def can_fetch_more(self):
+        return self.fetch_page is not None and len(self.rows) < self.total and not self.tasks.is_running(self.key)
+
+    def fetch_more(self):
+        if not self.can_fetch_more():
+            return
+        offset = len(self.rows)
+        fetch_page = self.fetch_page
+        self.tasks.submit(self.key, fetch_page, offset, self.page_size,
+                          on_success=lambda rows: self.append(fetch_page, offset, rows),
+                          on_error=lambda e: logging.error(f"Error fetching page {offset} of {self.key}: {e}"))
+
+    def grow(self, total):
+        # The source has gained rows since it was loaded; fetch them straight away if the view had reached the end
+        if self.fetch_page is None or self.message is not None or total <= self.total:
+            return
+        loaded_all = len(self.rows) >= self.total
+        self.total = total
+        if loaded_all:
+            self.fetch_more()
+
+    def find(self, match):
+        # Position of the first loaded row match(row) accepts, or None
+        if self.message is not None:
+            return None
+        return next((position for position, row in enumerate(self.rows) if match(row)), None)
+
+    def append(self, fetch_page, offset, rows):
+        # Ignore pages that belong to a source the model has since been reset away from
+        if fetch_page is not self.fetch_page or offset != len(self.rows) or not rows:
+            return
+        first = len(self.rows)
+        self.model.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self.rows.extend(rows)
+        self.model.endInsertRows()
+
+
+class PagedListModel(QAbstractListModel):
+    # formatter(row_number, row) builds the display text of one row, only when the view asks for it
+    def __init__(self, tasks, key, formatter, page_size=DEFAULT_PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.loader = PageLoader(self, tasks, key, page_size)
+        self.formatter = formatter
+        self.font = QFont("Arial", 11)
+
+    def load(self, total, fetch_page, first_rows=()):
+        # Switch to a new source: total rows available and a function returning any page of them
+        self.beginResetModel()
+        self.loader.reset(total, fetch_page, first_rows)
+        self.endResetModel()
+
+    def set_rows(self, rows, base=0, numbers=None):
+        # Show a fixed set of rows, such as search results
+        self.beginResetModel()
+        self.loader.reset(len(rows), None, rows, base=base, numbers=numbers)
+        self.endResetModel()
+
+    def set_message(self, text):
+        self.beginResetModel()
+        self.loader.reset(0, None, (), text)
+        self.endResetModel()
+
+    def grow(self, total):
+        self.loader.grow(total)
+
+    def update_row(self, match, row):
+        # Replace the first row match accepts; returns False when no loaded row matches
+        position = self.loader.find(match)
+        if position is None:
+            return False
+        self.update_row_at(position, row)
+        return True
+
+    def update_row_at(self, position, row):
+        self.loader.rows[position] = row
+        self.dataChanged.emit(self.index(position), self.index(position))
+
+    def remove_row(self, match):
+        position = self.loader.find(match)
+        if position is not None:
+            self.remove_row_at(position)
+
+    def remove_row_at(self, position):
+        self.beginRemoveRows(QModelIndex(), position, position)
+        del self.loader.rows[position]
+        if self.loader.numbers is not None:
+            del self.loader.numbers[position]
+        self.loader.total -= 1
+        self.endRemoveRows()
+
+    def add_row(self, row):
+        self.insert_row(len(self.loader.rows), row)
+
+    def insert_row(self, position, row):
+        # Only for fixed lists like the offers; a paged source brings new rows in through grow() and search results
+        # are not extended
+        loader = self.loader
+        if loader.fetch_page is not None or loader.message is not None or loader.numbers is not None:
+            return
+        self.beginInsertRows(QModelIndex(), position, position)
+        loader.rows.insert(position, row)
+        loader.total += 1
+        self.endInsertRows()
+
+    def row_data(self, row):
+        # Raw row behind a view row, or None for no selection or the status message
+        if self.loader.message is not None or not 0 <= row < len(self.loader.rows):
+            return None
+        return self.loader.rows[row]
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self.loader.message is not None:
+            return 1
+        return len(self.loader.rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            if self.loader.message is not None:
+                return self.loader.message
+            start = time.perf_counter()
+            text = self.formatter(self.loader.number(index.row()), self.loader.rows[index.row()])
+            metrics.observe("lumin_ui_format_seconds", time.perf_counter() - start, view=self.loader.key)
+            return text
+        if role == Qt.FontRole:
+            return self.font
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loader.can_fetch_more()
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not parent.isValid():
+            self.loader.fetch_more()
+
+
+class PagedTableModel(QAbstractTableModel):
+    # formatter(row_number, row, column) builds the text of one cell, only when the view asks for it
+    def __init__(self, tasks, key, headers, formatter, page_size=DEFAULT_PAGE_SIZE, parent=None):
+        super().__init__(parent)
+        self.loader = PageLoader(self, tasks, key, page_size)
+        self.headers = headers
+        self.formatter = formatter
+        self.font = QFont("Arial", 11)
+
+    def load(self, total, fetch_page, first_rows=()):
+        self.beginResetModel()
+        self.loader.reset(total, fetch_page, first_rows)
+        self.endResetModel()
+
+    def grow(self, total):
+        self.loader.grow(total)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.loader.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.DisplayRole:
+            start = time.perf_counter()
+            text = self.formatter(index.row(), self.loader.rows[index.row()], index.column())
+            metrics.observe("lumin_ui_format_seconds", time.perf_counter() - start, view=self.loader.key)
+            return text
+        if role == Qt.FontRole:
+            return self.font
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.headers[section]
+        if role == Qt.FontRole:
+            return self.font
+        return super().headerData(section, orientation, role)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loader.can_fetch_more()
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not parent.isValid():
+            self.loader.fetch_more()
+
+
+class TimedListView(QListView):
+    # A QListView that records the time of every repaint under its name
+    def __init__(self, name, parent=None):
+        super().__init__(parent)
+        self.name = name
+
+    def paintEvent(self, event):
+        with metrics.timed("lumin_ui_paint_seconds", view=self.name):
+            super().paintEvent(event)
+
+
+class TimedTableView(QTableView):
+    def __init__(self, name, parent=None):
+        super().__init__(parent)
+        self.name = name
+
+    def paintEvent(self, event):
+        with metrics.timed("lumin_ui_paint_seconds", view=self.name):
+            super().paintEvent(event)
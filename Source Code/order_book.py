@@ -0,0 +1,149 @@
+import bisect
+import math
+from fractions import Fraction
+
+from event_sync import SALE_SELLER_ADDRESS, SALE_ENERGY, SALE_ID
+from matching import unit_price
+from search_index import parse_range, parse_terms
+
+# The open sales, kept sorted by posting order, by price per kWh and by amount, and grouped by seller. A new, partly
+# filled or filled sale is moved in place with a few bisections instead of the whole list being fetched and sorted
+# again, so the offers view can switch its order, filter ("at least 100 kWh under 0.01 ETH/kWh") and show the top of
+# the book without asking the node. Prices are compared per kWh (matching.unit_price): a sale's price is for all of
+# its energy, so ordering by that total put a large cheap offer behind a small expensive one.
+#
+#   book = OrderBook(client.offers())
+#   book.apply(sale_id, sale)  # sale is None once filled
+#   book.query(min_energy=100, max_unit_price=web3.to_wei(0.01, 'ether'), order=UNIT_PRICE)
+#   book.query(order=UNIT_PRICE, **parse_filter("amount:100.. price:..0.01"))
+
+POSTED = "posted"
+UNIT_PRICE = "unit_price"
+AMOUNT = "amount"
+ORDERS = [POSTED, UNIT_PRICE, AMOUNT]
+
+WEI_PER_ETH = 10 ** 18
+
+
+def order_key(order, sale):
+    # Sort key of a sale in one of ORDERS; the sale id comes last so equal prices or amounts keep posting order
+    if order == UNIT_PRICE:
+        return unit_price(sale), sale[SALE_ID]
+    if order == AMOUNT:
+        return sale[SALE_ENERGY], sale[SALE_ID]
+    return (sale[SALE_ID],)
+
+
+def eth_per_kwh(sale):
+    return float(unit_price(sale) / WEI_PER_ETH)
+
+
+def parse_filter(text):
+    # Offer filter as typed by the user -> query() keywords: "amount:100.." in kWh and "price:..0.01" in ETH per kWh,
+    # ranges written like the search fields'. Raises ValueError for anything else.
+    bounds = {}
+    for field, value in parse_terms(text):
+        if field == "amount":
+            bounds['min_energy'], bounds['max_energy'] = parse_range(value)
+        elif field == "price":
+            low, high = value.split("..", 1) if ".." in value else (value, value)
+            bounds['min_unit_price'] = Fraction(low) * WEI_PER_ETH if low else None
+            bounds['max_unit_price'] = Fraction(high) * WEI_PER_ETH if high else None
+        else:
+            raise ValueError(f"unknown filter {value if field is None else field + ':'}, use amount: or price:")
+    return bounds
+
+
+class OrderBook:
+    # sales are rows laid out like the EnergySale struct
+    def __init__(self, sales=()):
+        # Sales of 0 kWh, which older deployments accepted, cannot be bought and are left out
+        self.sales = {sale[SALE_ID]: sale for sale in sales if sale[SALE_ENERGY] > 0}
+        self.keys = {order: sorted(order_key(order, sale) for sale in self.sales.values()) for order in ORDERS}
+        self.by_seller = {}  # seller address -> ids of their open sales
+        for sale_id, sale in self.sales.items():
+            self.by_seller.setdefault(sale[SALE_SELLER_ADDRESS], set()).add(sale_id)
+
+    def __len__(self):
+        return len(self.sales)
+
+    def get(self, sale_id):
+        return self.sales.get(sale_id)
+
+    def apply(self, sale_id, sale):
+        # Add, update or, when sale is None or empty, remove one sale
+        if sale is not None and sale[SALE_ENERGY] <= 0:
+            sale = None
+        old = self.sales.pop(sale_id, None)
+        if old is not None:
+            for order, keys in self.keys.items():
+                del keys[bisect.bisect_left(keys, order_key(order, old))]
+            seller_sales = self.by_seller[old[SALE_SELLER_ADDRESS]]
+            seller_sales.discard(sale_id)
+            if not seller_sales:
+                del self.by_seller[old[SALE_SELLER_ADDRESS]]
+        if sale is not None:
+            self.sales[sale_id] = sale
+            for order, keys in self.keys.items():
+                bisect.insort(keys, order_key(order, sale))
+            self.by_seller.setdefault(sale[SALE_SELLER_ADDRESS], set()).add(sale_id)
+
+    def position(self, sale_id, order=POSTED, descending=False):
+        # Row of the sale in ordered(order, descending), or None when it is not in the book
+        sale = self.sales.get(sale_id)
+        if sale is None:
+            return None
+        position = bisect.bisect_left(self.keys[order], order_key(order, sale))
+        return len(self.sales) - 1 - position if descending else position
+
+    def ordered(self, order=POSTED, descending=False):
+        # Every open sale; descending also puts later sales before earlier ones at the same price or amount
+        keys = reversed(self.keys[order]) if descending else self.keys[order]
+        return [self.sales[key[-1]] for key in keys]
+
+    def best(self, exclude_seller=None):
+        # Top of the book: the cheapest sale per kWh that is not exclude_seller's own, or None
+        for key in self.keys[UNIT_PRICE]:
+            sale = self.sales[key[-1]]
+            if sale[SALE_SELLER_ADDRESS] != exclude_seller:
+                return sale
+        return None
+
+    def span(self, order, low, high):
+        # Start and end of the keys of an order whose value lies within low..high (inclusive, None for open)
+        keys = self.keys[order]
+        start = 0 if low is None else bisect.bisect_left(keys, (low,))
+        end = len(keys) if high is None else bisect.bisect_right(keys, (high, math.inf))
+        return max(end - start, 0), order, start, end
+
+    def query(self, min_energy=None, max_energy=None, min_unit_price=None, max_unit_price=None, seller=None,
+              exclude_seller=None, order=POSTED, descending=False):
+        # Sales within the bounds, in the given order; energy is in kWh and unit prices in wei per kWh. Both bounds
+        # are bisections and only the narrower of the two ranges, or the seller's own sales, is scanned.
+        if seller is not None:
+            scanned = None
+            candidates = [self.sales[sale_id] for sale_id in self.by_seller.get(seller, ())]
+        else:
+            _, scanned, start, end = min(self.span(UNIT_PRICE, min_unit_price, max_unit_price),
+                                         self.span(AMOUNT, min_energy, max_energy))
+            candidates = [self.sales[key[-1]] for key in self.keys[scanned][start:end]]
+
+        matches = []
+        for sale in candidates:
+            energy = sale[SALE_ENERGY]
+            if (min_energy is not None and energy < min_energy) or (max_energy is not None and energy > max_energy):
+                continue
+            if min_unit_price is not None or max_unit_price is not None:
+                price = unit_price(sale)
+                if (min_unit_price is not None and price < min_unit_price) or \
+                        (max_unit_price is not None and price > max_unit_price):
+                    continue
+            if exclude_seller is not None and sale[SALE_SELLER_ADDRESS] == exclude_seller:
+                continue
+            matches.append(sale)
+
+        if scanned != order:
+            matches.sort(key=lambda sale: order_key(order, sale), reverse=descending)
+        elif descending:
+            matches.reverse()
+        return matches
@@ -0,0 +1,216 @@
+import itertools
+import json
+import threading
+import time
+
+import requests
+from web3.providers.base import JSONBaseProvider
+
+from metrics import metrics, SIZE_BUCKETS
+
+# Web3 provider that spreads JSON-RPC requests over several nodes. Every endpoint keeps its own persistent HTTP
+# session and a circuit breaker: after a few failures in a row it is skipped for a cool-down that doubles each time
+# it trips again, then gets one trial request. Reads go round-robin or to the endpoint with the lowest recent
+# latency, and a failed read is retried on the next endpoint after an exponential backoff. Transactions and nonce
+# reads stay on one endpoint per account, and filters on one endpoint overall, since nonces of pending transactions
+# and filter ids are only known to the node that saw them; a pin moves only when its endpoint's breaker opens.
+
+ROUND_ROBIN = "round-robin"
+LEAST_LATENCY = "latency"
+ROUTINGS = [ROUND_ROBIN, LEAST_LATENCY]
+
+WRITE_METHODS = {"eth_sendTransaction", "eth_sendRawTransaction"}
+FILTER_METHODS = {"eth_newFilter", "eth_newBlockFilter", "eth_newPendingTransactionFilter", "eth_getFilterChanges",
+                  "eth_getFilterLogs", "eth_uninstallFilter"}
+
+# Weight of the newest request in an endpoint's moving average latency
+LATENCY_WEIGHT = 0.2
+
+
+class ProviderPoolError(Exception):
+    pass
+
+
+class Endpoint:
+    def __init__(self, url, timeout=10, pool_size=10, failure_threshold=3, cooldown=5.0, max_cooldown=120.0):
+        self.url = url
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.trips = 0  # Times the breaker opened without a success in between
+        self.open_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.latency = None  # Moving average of successful request times in seconds
+        self.last_error = None
+
+    def available(self, now):
+        return self.open_until <= now
+
+    def post(self, payload, method):
+        # The payload is encoded here so its size can be recorded along with the response's
+        data = json.dumps(payload).encode()
+        metrics.observe("lumin_rpc_request_bytes", len(data), SIZE_BUCKETS, method=method)
+        start = time.monotonic()
+        try:
+            with metrics.timed("lumin_rpc_seconds", method=method, endpoint=self.url):
+                response = self.session.post(self.url, data=data, headers={'Content-Type': 'application/json'},
+                                             timeout=self.timeout)
+                response.raise_for_status()
+                body = response.json()
+        except Exception as e:
+            metrics.inc("lumin_rpc_errors_total", method=method, endpoint=self.url)
+            self.record_failure(e)
+            raise
+        metrics.observe("lumin_rpc_response_bytes", len(response.content), SIZE_BUCKETS, method=method)
+        self.record_success(time.monotonic() - start)
+        return body
+
+    def record_success(self, elapsed):
+        with self.lock:
+            self.requests += 1
+            self.consecutive_failures = 0
+            self.trips = 0
+            self.open_until = 0.0
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += LATENCY_WEIGHT * (elapsed - self.latency)
+
+    def record_failure(self, error):
+        with self.lock:
+            self.requests += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = str(error)
+            # Once tripped, the count stays at the threshold so a failed trial request opens the breaker again
+            if self.consecutive_failures >= self.failure_threshold:
+                self.trips += 1
+                self.open_until = time.monotonic() + min(self.cooldown * 2 ** (self.trips - 1), self.max_cooldown)
+
+    def stats(self):
+        with self.lock:
+            if self.open_until > time.monotonic():
+                state = "open"
+            elif self.trips:
+                state = "half-open"
+            else:
+                state = "closed"
+            return {
+                'url': self.url,
+                'state': state,
+                'requests': self.requests,
+                'failures': self.failures,
+                'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+                'last_error': self.last_error,
+            }
+
+
+class ProviderPool(JSONBaseProvider):
+    def __init__(self, urls, routing=ROUND_ROBIN, timeout=10, retries=3, backoff=0.25, max_backoff=4.0, pool_size=10,
+                 failure_threshold=3, cooldown=5.0, max_cooldown=120.0):
+        super().__init__()
+        if not urls:
+            raise ValueError("A provider pool needs at least one endpoint")
+        if routing not in ROUTINGS:
+            raise ValueError(f"Unknown routing {routing}, expected one of {', '.join(ROUTINGS)}")
+        self.endpoints = [Endpoint(url, timeout, pool_size, failure_threshold, cooldown, max_cooldown) for url in urls]
+        self.routing = routing
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.turn = itertools.count()
+        self.pins = {}  # account or "filters" -> endpoint
+        self.ids = itertools.count()
+
+    def __str__(self):
+        return f"ProviderPool({', '.join(endpoint.url for endpoint in self.endpoints)})"
+
+    def is_connected(self, show_traceback=False):
+        try:
+            return 'result' in self.make_request("web3_clientVersion", [])
+        except Exception:
+            if show_traceback:
+                raise
+            return False
+
+    def make_request(self, method, params):
+        payload = {'jsonrpc': '2.0', 'id': next(self.ids), 'method': method, 'params': params}
+        return self.send(method, payload, pin_key(method, params))
+
+    def send_batch(self, payload):
+        # A list of JSON-RPC reads sent together to one endpoint, as BatchReader does
+        for request in payload:
+            metrics.inc("lumin_rpc_batched_requests_total", method=request['method'])
+        metrics.observe("lumin_rpc_batch_size", len(payload), SIZE_BUCKETS)
+        return self.send("batch", payload, None)
+
+    def send(self, method, payload, pin):
+        candidates = self.candidates(pin)
+        write = method in WRITE_METHODS
+        errors = []
+        for attempt in range(self.retries + 1):
+            if attempt:
+                metrics.inc("lumin_rpc_retries_total", method=method)
+                time.sleep(min(self.backoff * 2 ** (attempt - 1), self.max_backoff))
+            # A transaction stays on its pinned endpoint, the only node that knows the account and its nonces
+            endpoint = candidates[0] if write else candidates[attempt % len(candidates)]
+            try:
+                return endpoint.post(payload, method)
+            except requests.ConnectTimeout as e:
+                # The connection was never made, so nothing was sent
+                errors.append(f"{endpoint.url}: {e}")
+            except Exception as e:
+                if write:
+                    # The node may have accepted the transaction before failing, even when the connection was reset
+                    # afterwards; sending it again could send it twice
+                    raise
+                errors.append(f"{endpoint.url}: {e}")
+        raise ProviderPoolError(f"{method} failed on every endpoint tried: {'; '.join(errors)}")
+
+    def candidates(self, pin=None):
+        # Endpoints in the order to try them; the pinned endpoint comes first for account and filter requests
+        now = time.monotonic()
+        available = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+        if not available:
+            # Every breaker is open: try the endpoints closest to their trial request rather than failing outright
+            available = sorted(self.endpoints, key=lambda endpoint: endpoint.open_until)
+        if self.routing == LEAST_LATENCY:
+            # Endpoints without a measurement yet are tried first so every one gets measured
+            ordered = sorted(available, key=lambda endpoint: endpoint.latency or 0.0)
+        else:
+            start = next(self.turn) % len(available)
+            ordered = available[start:] + available[:start]
+
+        if pin is None:
+            return ordered
+        with self.lock:
+            pinned = self.pins.get(pin)
+            if pinned is None or pinned not in available:
+                pinned = self.pins[pin] = ordered[0]
+        return [pinned] + [endpoint for endpoint in ordered if endpoint is not pinned]
+
+    def stats(self):
+        # Health and latency of every endpoint, e.g. for the service's /providers endpoint
+        return [endpoint.stats() for endpoint in self.endpoints]
+
+
+def pin_key(method, params):
+    if method in FILTER_METHODS:
+        return "filters"
+    if method == "eth_sendTransaction" and params and isinstance(params[0], dict):
+        return str(params[0].get('from', '')).lower()
+    if method == "eth_getTransactionCount" and params:
+        return str(params[0]).lower()
+    if method == "eth_sendRawTransaction":
+        return "raw"  # The sender is inside the signed payload; one endpoint keeps their nonces in order
+    return None
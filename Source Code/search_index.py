@@ -0,0 +1,122 @@
+import bisect
+
+# In-memory indexes over the manager dashboard's panels and transactions, rebuilt from the local chain index on every
+# refresh. Lookups are bisections over sorted keys, so the search fields can filter on every keystroke without
+# touching the node or the database.
+#
+# Panel queries:        12  (id prefix)   loc:riyadh   owner:sara   sara   (location or owner prefix)
+# Transaction queries:  #12  or  12  (row number)   sara  (counterparty prefix)   time:1700000000..1700086400
+#                       amount:10..50   amount:10..   amount:..50
+# Several terms narrow the result down, e.g. "sara amount:10.."
+
+PREFIX_END = "\uffff"  # Sorts after any character a key can contain
+
+
+class SortedKeys:
+    # (key, position) pairs kept sorted so prefix and range lookups are two bisections
+    def __init__(self, pairs):
+        self.pairs = sorted(pairs)
+        self.keys = [key for key, _ in self.pairs]
+
+    def prefix(self, text):
+        start = bisect.bisect_left(self.keys, text)
+        end = bisect.bisect_left(self.keys, text + PREFIX_END)
+        return {position for _, position in self.pairs[start:end]}
+
+    def range(self, low=None, high=None):
+        start = 0 if low is None else bisect.bisect_left(self.keys, low)
+        end = len(self.keys) if high is None else bisect.bisect_right(self.keys, high)
+        return {position for _, position in self.pairs[start:end]}
+
+
+def parse_terms(text):
+    # "loc:riyadh sara" -> [("loc", "riyadh"), (None, "sara")]
+    terms = []
+    for word in text.lower().split():
+        field, separator, value = word.partition(":")
+        terms.append((field, value) if separator else (None, word))
+    return terms
+
+
+def parse_range(value):
+    # "10..50", "10..", "..50" or a single number; raises ValueError for anything else. An empty value (the user has
+    # only typed "amount:" so far) matches everything.
+    if not value:
+        return None, None
+    if ".." in value:
+        low, high = value.split("..", 1)
+        return (int(low) if low else None), (int(high) if high else None)
+    number = int(value)
+    return number, number
+
+
+def intersect(matches):
+    result = None
+    for positions in matches:
+        result = positions if result is None else result & positions
+    return sorted(result) if result is not None else []
+
+
+class PanelIndex:
+    # panels are rows laid out like the Panel struct; usernames maps owner address -> username
+    def __init__(self, panels, usernames):
+        self.panels = list(panels)
+        self.ids = SortedKeys((str(panel[0]), i) for i, panel in enumerate(self.panels))
+        self.locations = SortedKeys((panel[2].lower(), i) for i, panel in enumerate(self.panels))
+        owner_keys = []
+        for i, panel in enumerate(self.panels):
+            owner_keys.append((panel[7].lower(), i))
+            owner_keys.append((usernames.get(panel[7], "").lower(), i))
+        self.owners = SortedKeys(owner_keys)
+
+    def search(self, text):
+        # Returns the matching panels in list order
+        matches = []
+        for field, value in parse_terms(text):
+            if field == "id" or (field is None and value.isdigit()):
+                matches.append(self.ids.prefix(value))
+            elif field in ("loc", "location"):
+                matches.append(self.locations.prefix(value))
+            elif field == "owner":
+                matches.append(self.owners.prefix(value))
+            elif field is None:
+                matches.append(self.locations.prefix(value) | self.owners.prefix(value))
+            else:
+                raise ValueError(f"Unknown panel search field '{field}'")
+        return [self.panels[i] for i in intersect(matches)]
+
+
+class TransactionIndex:
+    # transactions are rows laid out like the Transaction struct, in the same order as the dashboard list
+    def __init__(self, transactions):
+        self.transactions = list(transactions)
+        name_keys = []
+        for i, tx in enumerate(self.transactions):
+            name_keys.append((tx[0].lower(), i))
+            if tx[1]:
+                name_keys.append((tx[1].lower(), i))
+        self.names = SortedKeys(name_keys)
+        self.times = SortedKeys((tx[5], i) for i, tx in enumerate(self.transactions))
+        self.amounts = SortedKeys((tx[2] if tx[2] > 0 else tx[3], i) for i, tx in enumerate(self.transactions))
+
+    def search(self, text):
+        # Returns (row numbers, transactions) so results keep their Transaction ID from the full list
+        terms = parse_terms(text)
+        if len(terms) == 1 and terms[0][0] is None and terms[0][1].lstrip("#").isdigit():
+            index = int(terms[0][1].lstrip("#"))
+            if index < len(self.transactions):
+                return [index], [self.transactions[index]]
+            return [], []
+
+        matches = []
+        for field, value in terms:
+            if field == "time":
+                matches.append(self.times.range(*parse_range(value)))
+            elif field == "amount":
+                matches.append(self.amounts.range(*parse_range(value)))
+            elif field in (None, "name"):
+                matches.append(self.names.prefix(value))
+            else:
+                raise ValueError(f"Unknown transaction search field '{field}'")
+        numbers = intersect(matches)
+        return numbers, [self.transactions[i] for i in numbers]
@@ -0,0 +1,461 @@
+import argparse
+import hmac
+import io
+import json
+import logging
+import os
+import secrets
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from web3 import Web3
+
+from allocation import BY_CAPACITY, BY_EFFICIENCY
+from client import ABI_CACHE_DIR, LuminClient, ClientError, OFFER_SORTS
+from provider_pool import ROUTINGS, ROUND_ROBIN
+from event_sync import SALE_ID
+from exporter import (CSV, DEFAULT_CHUNK_SIZE, ExportError, FORMATS, JSON_LINES, KINDS, TRANSACTIONS, export,
+                      read_chunks, text_writer, write_chunks)
+from metrics import metrics, serve_metrics
+
+# Command line and HTTP/JSON front end for the GUI-free client in client.py, for trading and reporting on machines
+# with no display. Every operation is available as a subcommand and, under `serve`, as an endpoint of a local API
+# whose request threads all share one LuminClient and so one pool of connections to the node.
+#
+#   python service.py --address 0x... offers --sort price --min-energy 100 --max-price 0.01
+#   python service.py --address 0x... buy-best --account 0x... --amount 50 --max-price 0.01
+#   python service.py --address 0x... serve --port 8000
+#   curl 'http://127.0.0.1:8000/history?account=0x...&limit=20'
+#   curl 'http://127.0.0.1:8000/analytics?account=0x...&manager=1'
+#   python service.py --address 0x... export --account 0x... --manager --output history.parquet
+#   curl -o history.csv 'http://127.0.0.1:8000/export?account=0x...&manager=1&format=csv'
+#   curl -H "Authorization: Bearer $LUMIN_API_TOKEN" -H 'Content-Type: application/json' \
+#        -d '{"account": "0x...", "sale_id": 3}' http://127.0.0.1:8000/buy
+#   curl http://127.0.0.1:8000/metrics
+#
+# Transactions are sent from the given account, which must be unlocked on the node, so every POST needs a JSON body
+# and the API token (--token, $LUMIN_API_TOKEN, or a random one printed at start-up). A web page the operator visits
+# can therefore neither send a plain form or text POST nor add the header; requests a browser marks as coming from
+# another site are refused outright. The API listens on 127.0.0.1 unless told otherwise.
+
+ALLOCATION_STRATEGIES = {"capacity": BY_CAPACITY, "efficiency": BY_EFFICIENCY}
+
+
+def sale_record(sale):
+    name, seller, energy, price, sale_id = sale
+    return {"id": sale_id, "seller_name": name, "seller": seller, "energy": energy, "price": price}
+
+
+def panel_record(panel):
+    panel_id, capacity, location, produced, consumed, balance, efficiency, owner = panel
+    return {"id": panel_id, "capacity": capacity, "location": location, "produced": produced, "consumed": consumed,
+            "balance": balance, "efficiency": efficiency, "owner": owner}
+
+
+def transaction_record(number, tx):
+    sender, receiver, produced, consumed, tokens, timestamp = tx
+    return {"number": number, "from": sender, "to": receiver, "produced": produced, "consumed": consumed,
+            "tokens": tokens, "timestamp": timestamp}
+
+
+def account_of(params):
+    return Web3.to_checksum_address(params['account'])
+
+
+def max_unit_price_of(params):
+    # max_price is in ETH per kWh; returns wei per kWh, or None for no limit
+    max_price = params.get('max_price')
+    return Web3.to_wei(float(max_price), 'ether') if max_price not in (None, '') else None
+
+
+def flag(value):
+    # Booleans arrive as bools from the CLI and JSON bodies and as strings from query strings
+    if isinstance(value, str):
+        return value.lower() in ("1", "true", "yes")
+    return bool(value)
+
+
+# Operations shared by the CLI and the HTTP API. params holds the subcommand's arguments or the request's query
+# string / JSON body; each returns something json.dumps can write.
+
+def login(client, params):
+    account = client.login(params['username'], params['password'])
+    if account is None:
+        return {"authenticated": False}
+    address, is_manager = account
+    return {"authenticated": True, "account": address, "manager": is_manager}
+
+
+def balance(client, params):
+    account = account_of(params)
+    return {"account": account, "balance": str(client.balance(account))}
+
+
+def offers(client, params):
+    sort = params.get('sort')
+    if sort is not None and sort not in OFFER_SORTS:
+        raise ValueError(f"Unknown sort {sort}, expected one of {', '.join(OFFER_SORTS)}")
+    min_energy = params.get('min_energy')
+    sales = client.offers(sort, int(min_energy) if min_energy not in (None, '') else None, max_unit_price_of(params))
+    return [sale_record(sale) for sale in sales]
+
+
+def panels(client, params):
+    offset = int(params.get('offset', 0))
+    accounts, count, rows = client.panels(account_of(params), flag(params.get('manager')), offset,
+                                          int(params.get('limit', -1)))
+    return {"accounts": accounts, "count": count, "panels": [panel_record(panel) for panel in rows]}
+
+
+def history(client, params):
+    # source "chain" reads the contract's own records instead of the local index
+    offset = int(params.get('offset', 0))
+    source = params.get('source') or "index"
+    if source not in ("index", "chain"):
+        raise ValueError(f"Unknown source {source}, expected index or chain")
+    read = client.chain_history if source == "chain" else client.history
+    accounts, count, rows = read(account_of(params), flag(params.get('manager')), offset, int(params.get('limit', -1)))
+    return {"accounts": accounts, "count": count,
+            "transactions": [transaction_record(offset + i, tx) for i, tx in enumerate(rows)]}
+
+
+def analytics(client, params):
+    # window is the span of the recent market summary in seconds
+    account = account_of(params)
+    report = client.analytics(account, flag(params.get('manager')), int(params.get('window') or 86400))
+    report["panels"] = [{"owner": owner, "id": panel_id, "capacity": capacity, "efficiency": efficiency,
+                         "buckets": buckets, "produced": produced, "consumed": consumed, "mean_yield": mean_yield,
+                         "yield_trend": trend}
+                        for owner, panel_id, capacity, efficiency, buckets, produced, consumed, mean_yield, trend
+                        in report["panels"]]
+    report["series"] = [{"start": start, "produced": produced, "consumed": consumed}
+                        for start, produced, consumed in report["series"]]
+    if report["manager"] is not None:
+        report["manager"] = dict(zip(["users", "produced", "consumed", "sold", "bought", "earned", "spent"],
+                                     report["manager"]))
+    return report
+
+
+def buy(client, params):
+    amount = client.buy(account_of(params), int(params['sale_id']))
+    if amount is None:
+        raise ValueError("You cannot buy energy from yourself.")
+    return {"bought": amount}
+
+
+def buy_best(client, params):
+    # max_price is in ETH per kWh; with dry_run the plan is returned without sending it
+    account = account_of(params)
+    plan = client.plan_order(account, int(params['amount']), max_unit_price_of(params))
+    result = {"requested": plan.amount, "planned": plan.filled, "cost": plan.cost,
+              "fills": [{"sale_id": sale[SALE_ID], "energy": take, "cost": cost} for sale, take, cost in plan.fills]}
+    if plan.fills and not flag(params.get('dry_run')):
+        result["filled"] = client.submit_order(account, plan)
+    return result
+
+
+def sell(client, params):
+    # price is in ETH for the whole amount
+    client.sell(account_of(params), int(params['panel_id']), int(params['amount']), float(params['price']))
+    return {"posted": int(params['amount'])}
+
+
+def allocate(client, params):
+    account = account_of(params)
+    strategy = ALLOCATION_STRATEGIES.get(params.get('strategy') or "capacity")
+    if strategy is None:
+        raise ValueError(f"Unknown strategy, expected one of {', '.join(ALLOCATION_STRATEGIES)}")
+    allocations, unallocated = client.plan_allocation(account, int(params['amount']), strategy)
+    if allocations and not flag(params.get('dry_run')):
+        client.allocate(account, allocations)
+    return {"allocations": [{"panel_id": panel_id, "energy": energy} for panel_id, energy in allocations],
+            "unallocated": unallocated}
+
+
+def providers(client, params):
+    return client.provider_stats()
+
+
+# name -> (HTTP method, operation); the name is both the subcommand and the endpoint path
+OPERATIONS = {
+    "login": ("POST", login),
+    "balance": ("GET", balance),
+    "offers": ("GET", offers),
+    "panels": ("GET", panels),
+    "history": ("GET", history),
+    "analytics": ("GET", analytics),
+    "buy": ("POST", buy),
+    "buy-best": ("POST", buy_best),
+    "sell": ("POST", sell),
+    "allocate": ("POST", allocate),
+    "providers": ("GET", providers),
+}
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    client = None  # The LuminClient shared by every request thread, set by serve()
+    token = None  # Bearer token every POST must carry, set by serve()
+
+    def foreign_origin(self):
+        # Browsers send Origin with cross-site requests; anything but this server itself is turned away
+        origin = self.headers.get('Origin')
+        if origin is not None and urlparse(origin).netloc != self.headers.get('Host'):
+            self.respond(403, {"error": "Cross-origin requests are not allowed"})
+            return True
+        return False
+
+    def authorized(self):
+        content_type = (self.headers.get('Content-Type') or "").split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            self.respond(415, {"error": "POST bodies must be sent as application/json"})
+            return False
+        scheme, _, token = (self.headers.get('Authorization') or "").partition(' ')
+        if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(), self.token.encode()):
+            self.respond(401, {"error": "Missing or wrong API token"})
+            return False
+        return True
+
+    def do_GET(self):
+        if self.foreign_origin():
+            return
+        url = urlparse(self.path)
+        if url.path == "/metrics":
+            # Prometheus text format rather than JSON
+            data = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == "/export":
+            self.stream_export(params)
+            return
+        self.dispatch("GET", url.path, params)
+
+    def stream_export(self, params):
+        # CSV or JSON lines written to the response chunk by chunk as they are read; the length is not known up front,
+        # so the end of the body is marked by closing the connection
+        try:
+            fmt = params.get('format') or JSON_LINES
+            kind = params.get('kind') or TRANSACTIONS
+            chunk_size = int(params.get('chunk_size') or DEFAULT_CHUNK_SIZE)
+            if fmt not in (CSV, JSON_LINES):
+                raise ValueError(f"Only {CSV} and {JSON_LINES} can be streamed, use the export command for {fmt}")
+            total, chunks = read_chunks(self.client, account_of(params), kind, flag(params.get('manager')), chunk_size)
+        except KeyError as e:
+            self.respond(400, {"error": f"Missing parameter {e}"})
+            return
+        except (ValueError, ExportError) as e:
+            self.respond(400, {"error": str(e)})
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv' if fmt == CSV else 'application/x-ndjson')
+        self.send_header('X-Total-Rows', str(total))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        stream = io.TextIOWrapper(self.wfile, encoding='utf-8', newline='', write_through=True)
+        writer = text_writer(fmt, stream, kind)
+        try:
+            with metrics.timed("lumin_api_seconds", operation="export"):
+                write_chunks(writer, chunks, total)
+        except Exception as e:
+            logging.error(f"Export stopped: {e}")  # Headers are gone; the client sees a truncated body
+        finally:
+            stream.detach()
+        self.close_connection = True
+
+    def do_POST(self):
+        if self.foreign_origin() or not self.authorized():
+            return
+        url = urlparse(self.path)
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            params = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(params, dict):
+                raise ValueError("The request body must be a JSON object")
+        except ValueError as e:
+            self.respond(400, {"error": f"Invalid request body: {e}"})
+            return
+        self.dispatch("POST", url.path, params)
+
+    def dispatch(self, method, path, params):
+        name = path.strip('/')
+        operation = OPERATIONS.get(name)
+        if operation is None:
+            self.respond(404, {"error": f"Unknown endpoint {path}"})
+            return
+        if operation[0] != method:
+            self.respond(405, {"error": f"Use {operation[0]} for {path}"})
+            return
+        try:
+            with metrics.timed("lumin_api_seconds", operation=name):
+                result = operation[1](self.client, params)
+        except KeyError as e:
+            self.respond(400, {"error": f"Missing parameter {e}"})
+        except ValueError as e:
+            self.respond(400, {"error": str(e)})
+        except Exception as e:
+            logging.error(f"Error handling {method} {path}: {e}")
+            self.respond(500, {"error": str(e)})
+        else:
+            self.respond(200, result)
+
+    def respond(self, status, body):
+        data = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(client, host, port, token=None):
+    # Without a token a random one is made up and printed
+    ApiHandler.client = client
+    ApiHandler.token = token or secrets.token_urlsafe(32)
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    print(f"Serving the Lumin API on http://{host}:{port}", flush=True)
+    if not token:
+        print(f"API token for POST requests: {ApiHandler.token}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def run_export(client, args):
+    # Progress goes to stderr so the summary on stdout stays machine-readable
+    def progress(written, total):
+        print(f"\rExported {written} of {total} {args.kind}", end="", file=sys.stderr, flush=True)
+
+    try:
+        written = export(client, Web3.to_checksum_address(args.account), args.kind, args.output, args.format,
+                         args.manager, args.chunk_size, progress)
+    except (ExportError, OSError) as e:
+        logging.error(f"export failed: {e}")
+        sys.exit(f"\nError: {e}")
+    except KeyboardInterrupt:
+        sys.exit("\nExport interrupted, the partial file was removed")
+    print(file=sys.stderr)
+    print(json.dumps({"kind": args.kind, "rows": written, "output": args.output}, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trade and report on the EnergyManagement contract without the GUI")
+    parser.add_argument("--rpc", action="append",
+                        help="JSON-RPC endpoint of a node, repeat for several (default: http://127.0.0.1:8545)")
+    parser.add_argument("--routing", choices=ROUTINGS, default=ROUND_ROBIN, help="How reads pick a node")
+    parser.add_argument("--address", required=True, help="Deployed EnergyManagement contract address")
+    parser.add_argument("--abi", default="build/contracts/EnergyManagement.json", help="Truffle artifact with the ABI")
+    parser.add_argument("--db", default="lumin_index.db", help="SQLite index of the contract")
+    parser.add_argument("--abi-cache", default=ABI_CACHE_DIR, help="Directory of ABIs extracted from artifacts")
+    parser.add_argument("--pool-size", type=int, default=10, help="Connections per node shared by all threads")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on 127.0.0.1 at this port")
+    parser.add_argument("--trace", help="Append every timed RPC, call and transaction to this JSON-lines file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("login", help="Check a username and password")
+    command.add_argument("--username", required=True)
+    command.add_argument("--password", required=True)
+
+    command = commands.add_parser("balance", help="ETH balance of an account")
+    command.add_argument("--account", required=True)
+
+    command = commands.add_parser("offers", help="Open energy sales")
+    command.add_argument("--sort", choices=list(OFFER_SORTS),
+                         help="Order of the offers, prices per kWh (default: posting order)")
+    command.add_argument("--min-energy", type=int, help="Only offers of at least this many kWh")
+    command.add_argument("--max-price", type=float, help="Only offers of at most this price per kWh in ETH")
+
+    for name, help_text in [("panels", "Panels of an account"), ("history", "Transaction history of an account")]:
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--account", required=True)
+        command.add_argument("--manager", action="store_true", help="Include every user managed by the account")
+        command.add_argument("--offset", type=int, default=0)
+        command.add_argument("--limit", type=int, default=-1, help="Rows to return (default: all)")
+        if name == "history":
+            command.add_argument("--source", choices=["index", "chain"], default="index",
+                                 help="Read the history from the local index or from the contract's records")
+
+    command = commands.add_parser("analytics", help="Market prices, panel trends and manager totals of an account")
+    command.add_argument("--account", required=True)
+    command.add_argument("--manager", action="store_true", help="Include every user managed by the account")
+    command.add_argument("--window", type=int, default=86400, help="Seconds covered by the recent market summary")
+
+    command = commands.add_parser("export", help="Write every transaction or panel of an account to a file")
+    command.add_argument("--account", required=True)
+    command.add_argument("--manager", action="store_true", help="Include every user managed by the account")
+    command.add_argument("--kind", choices=KINDS, default=TRANSACTIONS)
+    command.add_argument("--output", required=True, help="File to write; .csv, .jsonl or .parquet")
+    command.add_argument("--format", choices=FORMATS, help="Output format (default: from the file extension)")
+    command.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows read and written at a time")
+
+    command = commands.add_parser("buy", help="Buy the whole of one offer")
+    command.add_argument("--account", required=True)
+    command.add_argument("--sale-id", type=int, required=True)
+
+    command = commands.add_parser("buy-best", help="Buy an amount across the cheapest offers in one transaction")
+    command.add_argument("--account", required=True)
+    command.add_argument("--amount", type=int, required=True, help="kWh to buy")
+    command.add_argument("--max-price", type=float, help="Highest price per kWh in ETH")
+    command.add_argument("--dry-run", action="store_true", help="Only show the plan")
+
+    command = commands.add_parser("sell", help="Post energy from a panel for sale")
+    command.add_argument("--account", required=True)
+    command.add_argument("--panel-id", type=int, required=True)
+    command.add_argument("--amount", type=int, required=True, help="kWh to sell")
+    command.add_argument("--price", type=float, required=True, help="Price for the whole amount in ETH")
+
+    command = commands.add_parser("allocate", help="Split energy across an account's panels in one transaction")
+    command.add_argument("--account", required=True)
+    command.add_argument("--amount", type=int, required=True, help="kWh to allocate")
+    command.add_argument("--strategy", choices=list(ALLOCATION_STRATEGIES), default="capacity")
+    command.add_argument("--dry-run", action="store_true", help="Only show the allocation")
+
+    commands.add_parser("providers", help="Health and latency of each node")
+
+    command = commands.add_parser("serve", help="Run the HTTP/JSON API")
+    command.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    command.add_argument("--port", type=int, default=8000)
+    command.add_argument("--token", default=os.environ.get("LUMIN_API_TOKEN"),
+                         help="Bearer token for POST requests (default: $LUMIN_API_TOKEN, or a random one)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.trace:
+        metrics.enable_trace(args.trace)
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port)
+
+    try:
+        client = LuminClient.connect(args.rpc or ["http://127.0.0.1:8545"], args.address, args.abi, args.db,
+                                     args.pool_size, routing=args.routing, abi_cache_dir=args.abi_cache)
+    except ClientError as e:
+        sys.exit(f"Error: {e}")
+
+    try:
+        if args.command == "serve":
+            serve(client, args.host, args.port, args.token)
+            return
+        if args.command == "export":
+            run_export(client, args)
+            return
+        try:
+            result = OPERATIONS[args.command][1](client, vars(args))
+        except Exception as e:
+            logging.error(f"{args.command} failed: {e}")
+            sys.exit(f"Error: {e}")
+        print(json.dumps(result, indent=2, default=str))
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
 const EnergyManagement = artifacts.require("EnergyManagement");
+const LinearPanelScan = artifacts.require("LinearPanelScan");
+const ShiftingSaleBook = artifacts.require("ShiftingSaleBook");
+const StringTransactionLog = artifacts.require("StringTransactionLog");
 
 contract("EnergyManagement", (accounts) => {
   describe("deployment", async () => {
@@ -13,4 +16,376 @@ contract("EnergyManagement", (accounts) => {
       assert.notEqual(address, "0x0");
     });
   });
+
+  describe("username index", async () => {
+    it("resolves a registered username to its account", async () => {
+      const instance = await EnergyManagement.deployed();
+      const address = await instance.addressOfUsername("Sara");
+
+      assert.equal(address, accounts[2]);
+    });
+
+    it("rejects a username that is already taken", async () => {
+      const instance = await EnergyManagement.deployed();
+
+      try {
+        await instance.register("Sara", "Someone Else", web3.utils.keccak256(""), false, { from: accounts[6] });
+        assert.fail("Expected the duplicate username to be rejected");
+      } catch (error) {
+        assert.include(error.message, "Username already taken");
+      }
+    });
+  });
+
+  describe("events", async () => {
+    it("emits EnergyAllocated when energy is allocated to a panel", async () => {
+      const instance = await EnergyManagement.deployed();
+      const receipt = await instance.allocateEnergyToPanel(1, 10, { from: accounts[1] });
+      const log = receipt.logs.find((entry) => entry.event === "EnergyAllocated");
+
+      assert.exists(log);
+      assert.equal(log.args.owner, accounts[1]);
+      assert.equal(log.args.panelId.toNumber(), 1);
+      assert.equal(log.args.energy.toNumber(), 10);
+    });
+
+    it("lists the users assigned to a manager", async () => {
+      const instance = await EnergyManagement.deployed();
+      const managed = await instance.getManagedUsers({ from: accounts[5] });
+
+      assert.deepEqual(managed, [accounts[1], accounts[2], accounts[3], accounts[4]]);
+    });
+  });
+
+  describe("pagination", async () => {
+    it("pages through managed panels in displayManagedPanels order", async () => {
+      const instance = await EnergyManagement.deployed();
+      const all = await instance.displayManagedPanels({ from: accounts[5] });
+      const count = await instance.getManagedPanelCount({ from: accounts[5] });
+      const page = await instance.displayManagedPanelsPage(3, 2, { from: accounts[5] });
+
+      assert.equal(count.toNumber(), all.length);
+      assert.deepEqual(page.map((panel) => panel.id), all.slice(3, 5).map((panel) => panel.id));
+    });
+
+    it("returns an empty page past the end", async () => {
+      const instance = await EnergyManagement.deployed();
+      const count = await instance.getManagedTransactionCount({ from: accounts[5] });
+      const result = await instance.displayManagedTransactionsPage(count, 10, { from: accounts[5] });
+
+      assert.equal(result.owners.length, 0);
+      assert.equal(result.page.length, 0);
+    });
+  });
+
+  describe("panel index gas", function () {
+    this.timeout(0);
+
+    // Grow one user's panel count and compare the gas of the per-panel operations, on the last panel added, against
+    // the loops EnergyManagement used before (kept in LinearPanelScan)
+    it("keeps per-panel operations flat as a user's panel count grows", async () => {
+      const user = accounts[6];
+      const current = await EnergyManagement.new();
+      const baseline = await LinearPanelScan.new();
+      await current.register("bench", "Bench User", web3.utils.keccak256(""), false, { from: user });
+      await baseline.register("bench", { from: user });
+
+      const operations = {
+        produceEnergy: (instance, id) => instance.produceEnergy(id, 10, { from: user }),
+        consumeEnergy: (instance, id) => instance.consumeEnergy(id, 5, { from: user }),
+        allocateEnergyToPanel: (instance, id) => instance.allocateEnergyToPanel(id, 10, { from: user }),
+        reduceEnergyBalance: (instance, id) => instance.reduceEnergyBalance(id, 5, { from: user }),
+        postEnergyForSale: (instance, id) => instance.postEnergyForSale(50, 1, { from: user }),
+      };
+
+      const results = {};
+      let panels = 0;
+      for (const size of [10, 100, 500]) {
+        for (; panels < size; panels++) {
+          await current.addPanelToUser(user, panels + 1, 1000, "Bench", 100, 0, 90, { from: user });
+          await baseline.addPanelToUser(user, panels + 1, 1000, "Bench", 100, 0, 90, { from: user });
+        }
+        for (const [name, operation] of Object.entries(operations)) {
+          const before = (await operation(baseline, size)).receipt.gasUsed;
+          const after = (await operation(current, size)).receipt.gasUsed;
+          results[`${name} @ ${size}`] = { linear: before, indexed: after };
+        }
+      }
+      console.table(results);
+
+      for (const name of Object.keys(operations)) {
+        // Same work at 10 and 500 panels apart from small storage differences, and cheaper than the scan at 500
+        assert.isAtMost(results[`${name} @ 500`].indexed - results[`${name} @ 10`].indexed, 1000);
+        assert.isBelow(results[`${name} @ 500`].indexed, results[`${name} @ 500`].linear);
+      }
+    });
+
+    it("keeps the running energy balance in step with the panels", async () => {
+      const instance = await EnergyManagement.deployed();
+      const panels = await instance.displayPanels({ from: accounts[1] });
+      const total = panels.reduce((sum, panel) => sum.add(web3.utils.toBN(panel.energyBalance)), web3.utils.toBN(0));
+      const running = await instance.totalEnergyBalance(accounts[1]);
+
+      assert.equal(running.toString(), total.toString());
+    });
+  });
+
+  describe("order book", function () {
+    this.timeout(0);
+
+    const BOOK_SIZE = 1200;
+
+    it("keeps sale ids stable when other sales are filled", async () => {
+      const seller = accounts[7];
+      const buyer = accounts[8];
+      const instance = await EnergyManagement.new();
+      await instance.register("seller", "Seller", web3.utils.keccak256(""), false, { from: seller });
+      await instance.register("buyer", "Buyer", web3.utils.keccak256(""), false, { from: buyer });
+      await instance.addPanelToUser(seller, 1, 1000, "Bench", 500, 0, 90, { from: seller });
+      for (let i = 0; i < 3; i++) {
+        await instance.postEnergyForSale(10, 1000, { from: seller });
+      }
+
+      await instance.buyEnergy(1, 10, { from: buyer, value: 1000 });
+      const sales = await instance.getAvailableEnergySales();
+
+      assert.sameMembers(sales.map((sale) => sale.id.toNumber()), [2, 3]);
+      const third = await instance.energySales(3);
+      assert.equal(third.energy.toNumber(), 10);
+
+      try {
+        await instance.buyEnergy(1, 10, { from: buyer, value: 1000 });
+        assert.fail("Expected a filled sale to be rejected");
+      } catch (error) {
+        assert.include(error.message, "Invalid sale id");
+      }
+    });
+
+    it(`removes filled sales in constant gas with ${BOOK_SIZE} open offers`, async () => {
+      const seller = accounts[7];
+      const buyer = accounts[8];
+      const current = await EnergyManagement.new();
+      const baseline = await ShiftingSaleBook.new();
+      await current.register("seller", "Seller", web3.utils.keccak256(""), false, { from: seller });
+      await current.register("buyer", "Buyer", web3.utils.keccak256(""), false, { from: buyer });
+      await current.addPanelToUser(seller, 1, 1000000, "Bench", 100000, 0, 90, { from: seller });
+      await baseline.register("seller", { from: seller });
+      await baseline.register("buyer", { from: buyer });
+
+      for (let i = 0; i < BOOK_SIZE; i++) {
+        await current.postEnergyForSale(1, 1000, { from: seller });
+      }
+
+      // Fill the oldest sale, then a run of sales from the middle of the book, timing the whole run
+      const first = (await current.buyEnergy(1, 1, { from: buyer, value: 1000 })).receipt.gasUsed;
+      const buys = 200;
+      const gas = [];
+      const started = Date.now();
+      for (let id = BOOK_SIZE / 2; id < BOOK_SIZE / 2 + buys; id++) {
+        gas.push((await current.buyEnergy(id, 1, { from: buyer, value: 1000 })).receipt.gasUsed);
+      }
+      const seconds = (Date.now() - started) / 1000;
+      const count = await current.getSaleCount();
+
+      // The old book shifts every later sale, so removing the oldest of only 200 already costs more
+      for (let i = 0; i < 200; i++) {
+        await baseline.postEnergyForSale(1, 1000, { from: seller });
+      }
+      const shifting = (await baseline.buyEnergy(0, 1, { from: buyer, value: 1000 })).receipt.gasUsed;
+
+      console.table({
+        [`id-keyed, oldest of ${BOOK_SIZE}`]: { gasUsed: first },
+        [`id-keyed, ${buys} fills (max)`]: { gasUsed: Math.max(...gas) },
+        "shifting array, oldest of 200": { gasUsed: shifting },
+      });
+      console.log(`      ${buys} fills in ${seconds.toFixed(2)}s (${(buys / seconds).toFixed(1)} fills/s)`);
+
+      assert.equal(count.toNumber(), BOOK_SIZE - buys - 1);
+      assert.isAtMost(Math.max(...gas) - Math.min(...gas), 5000);
+      assert.isBelow(Math.max(first, ...gas), shifting);
+    });
+  });
+
+  describe("order matching", async () => {
+    it("fills an order across sales cheapest first and refunds the rest", async () => {
+      const seller = accounts[7];
+      const buyer = accounts[8];
+      const instance = await EnergyManagement.new();
+      await instance.register("seller", "Seller", web3.utils.keccak256(""), false, { from: seller });
+      await instance.register("buyer", "Buyer", web3.utils.keccak256(""), false, { from: buyer });
+      await instance.addPanelToUser(seller, 1, 1000, "Bench", 500, 0, 90, { from: seller });
+      await instance.postEnergyForSale(10, 1000, { from: seller }); // id 1, 100 wei per kWh
+      await instance.postEnergyForSale(5, 250, { from: seller }); // id 2, 50 wei per kWh
+      await instance.postEnergyForSale(20, 3000, { from: seller }); // id 3, 150 wei per kWh, above the limit
+
+      const receipt = await instance.matchOrder([2, 1, 3], 12, 100, { from: buyer, value: 1200 });
+      const matched = receipt.logs.find((entry) => entry.event === "OrderMatched");
+      const fills = receipt.logs.filter((entry) => entry.event === "EnergyBought");
+
+      assert.equal(matched.args.filled.toNumber(), 12);
+      assert.equal(matched.args.totalPrice.toNumber(), 950);
+      assert.deepEqual(fills.map((entry) => entry.args.saleId.toNumber()), [2, 1]);
+
+      // The partially filled sale keeps its price per kWh and the unspent ETH went back to the buyer
+      const partial = await instance.energySales(1);
+      assert.equal(partial.energy.toNumber(), 3);
+      assert.equal(partial.price.toNumber(), 300);
+      assert.equal(await web3.eth.getBalance(instance.address), "0");
+    });
+
+    it("rejects a sale of no energy", async () => {
+      const instance = await EnergyManagement.deployed();
+
+      try {
+        await instance.postEnergyForSale(0, 1000, { from: accounts[1] });
+        assert.fail("Expected the sale to be rejected");
+      } catch (error) {
+        assert.include(error.message, "Energy amount must be greater than 0");
+      }
+    });
+
+    it("rejects an order nothing matches", async () => {
+      const instance = await EnergyManagement.deployed();
+
+      try {
+        await instance.matchOrder([1, 2], 10, 1, { from: accounts[3], value: 10 });
+        assert.fail("Expected the order to be rejected");
+      } catch (error) {
+        assert.include(error.message, "No sale matched the order");
+      }
+    });
+  });
+
+  describe("batch allocation", async () => {
+    it("allocates to several panels in one transaction", async () => {
+      const user = accounts[7];
+      const instance = await EnergyManagement.new();
+      await instance.register("allocator", "Allocator", web3.utils.keccak256(""), false, { from: user });
+      for (let id = 1; id <= 20; id++) {
+        await instance.addPanelToUser(user, id, 1000, "Bench", 100, 0, 90, { from: user });
+      }
+      const ids = Array.from({ length: 20 }, (_, i) => i + 1);
+      const amounts = ids.map(() => 10);
+
+      const batch = await instance.allocateEnergyBatch(ids, amounts, { from: user });
+      let separate = 0;
+      for (const id of ids) {
+        separate += (await instance.allocateEnergyToPanel(id, 10, { from: user })).receipt.gasUsed;
+      }
+      console.log(`      20 panels: batch ${batch.receipt.gasUsed} gas, one transaction each ${separate} gas`);
+
+      const panels = await instance.displayPanels({ from: user });
+      assert.equal(batch.logs.filter((entry) => entry.event === "EnergyAllocated").length, 20);
+      assert.isTrue(panels.every((panel) => panel.energyBalance === "120"));
+      assert.equal((await instance.totalEnergyBalance(user)).toNumber(), 20 * 120);
+      assert.isBelow(batch.receipt.gasUsed, separate);
+    });
+
+    it("rejects mismatched panel ids and amounts", async () => {
+      const instance = await EnergyManagement.deployed();
+
+      try {
+        await instance.allocateEnergyBatch([1, 4], [10], { from: accounts[1] });
+        assert.fail("Expected the batch to be rejected");
+      } catch (error) {
+        assert.include(error.message, "differ in length");
+      }
+    });
+  });
+
+  describe("meter readings", async () => {
+    it("records production and consumption for several panels in one transaction", async () => {
+      const user = accounts[8];
+      const instance = await EnergyManagement.new();
+      await instance.register("meter", "Meter", web3.utils.keccak256(""), false, { from: user });
+      for (let id = 1; id <= 3; id++) {
+        await instance.addPanelToUser(user, id, 1000, "Roof", 0, 0, 90, { from: user });
+      }
+      await instance.allocateEnergyToPanel(3, 50, { from: user });
+
+      // Panel 9 does not exist and is skipped, as are zero deltas
+      const receipt = await instance.recordReadings([1, 2, 3, 9, 1], [40, 0, -20, 5, 10], { from: user });
+      const panels = await instance.displayPanels({ from: user });
+
+      assert.equal(receipt.logs.filter((entry) => entry.event === "EnergyProduced").length, 2);
+      assert.equal(receipt.logs.filter((entry) => entry.event === "EnergyConsumed").length, 1);
+      assert.deepEqual(panels.map((panel) => panel.energyBalance), ["50", "0", "30"]);
+      assert.equal(panels[0].producedEnergy, "50");
+      assert.equal(panels[2].consumedEnergy, "20");
+      assert.equal((await instance.totalEnergyBalance(user)).toNumber(), 80);
+    });
+
+    it("rejects a batch with a reading the panel cannot take", async () => {
+      const user = accounts[8];
+      const instance = await EnergyManagement.new();
+      await instance.register("meter", "Meter", web3.utils.keccak256(""), false, { from: user });
+      await instance.addPanelToUser(user, 1, 100, "Roof", 0, 0, 90, { from: user });
+
+      try {
+        await instance.recordReadings([1, 1], [60, -70], { from: user });
+        assert.fail("Expected the batch to be rejected");
+      } catch (error) {
+        assert.include(error.message, "Not enough energy in the panel");
+      }
+      const panels = await instance.displayPanels({ from: user });
+      assert.equal(panels[0].energyBalance, "0");
+    });
+  });
+
+  describe("packed transaction records", function () {
+    this.timeout(0);
+
+    const TRADES = 20;
+
+    // Partial fills of one sale write two records each; compare their gas and the size of the history page they
+    // make against the string records EnergyManagement kept before (kept in StringTransactionLog)
+    it("costs less gas per trade and returns smaller history pages", async () => {
+      const seller = accounts[7];
+      const buyer = accounts[8];
+      const current = await EnergyManagement.new();
+      const baseline = await StringTransactionLog.new();
+      await current.register("seller", "Seller", web3.utils.keccak256(""), false, { from: seller });
+      await current.register("buyer", "Buyer", web3.utils.keccak256(""), false, { from: buyer });
+      await current.addPanelToUser(seller, 1, 100000, "Bench", 10000, 0, 90, { from: seller });
+      await baseline.register("seller", { from: seller });
+      await baseline.register("buyer", { from: buyer });
+
+      const gas = {};
+      const bytes = {};
+      for (const [name, instance] of [["string records", baseline], ["packed records", current]]) {
+        // One more kWh than the trades take, so every fill is partial and none pays for closing the sale
+        await instance.postEnergyForSale(10 * TRADES + 1, 100 * (10 * TRADES + 1), { from: seller });
+        let total = 0;
+        for (let i = 0; i < TRADES; i++) {
+          total += (await instance.buyEnergy(1, 10, { from: buyer, value: 1000 })).receipt.gasUsed;
+        }
+        gas[name] = Math.round(total / TRADES);
+
+        const data = instance.contract.methods.displayTransactionsPage(0, TRADES).encodeABI();
+        const raw = await web3.eth.call({ to: instance.address, data, from: buyer });
+        bytes[name] = (raw.length - 2) / 2;
+      }
+      console.table(Object.fromEntries(Object.keys(gas).map((name) => [
+        name, { "gas per trade": gas[name], [`bytes per ${TRADES}-record page`]: bytes[name] },
+      ])));
+
+      const page = await current.displayTransactionsPage(0, 1, { from: buyer });
+      assert.equal(page[0].counterparty, seller);
+      assert.equal(page[0].energyConsumed, "10");
+      assert.equal(page[0].tokensTransferred, "1000");
+      assert.isBelow(gas["packed records"], gas["string records"]);
+      assert.isBelow(bytes["packed records"], bytes["string records"]);
+    });
+
+    it("tells a manager which user each record belongs to", async () => {
+      const instance = await EnergyManagement.deployed();
+      const count = await instance.getManagedTransactionCount({ from: accounts[5] });
+      const all = await instance.displayManagedTransactions({ from: accounts[5] });
+      const managed = await instance.getManagedUsers({ from: accounts[5] });
+
+      assert.equal(all.owners.length, count.toNumber());
+      assert.equal(all.transactions.length, count.toNumber());
+      assert.isTrue(all.owners.every((owner) => managed.includes(owner)));
+    });
+  });
 });
@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from allocation import BY_CAPACITY, BY_EFFICIENCY, plan_allocation, split
+
+# Unit tests of splitting purchased energy over panels; run with `python -m unittest discover test` from Source Code.
+
+
+def panel(panel_id, capacity, balance, efficiency=90):
+    # Laid out like the Panel struct: id, capacity, location, produced, consumed, balance, efficiency, owner
+    return (panel_id, capacity, "Roof", 0, 0, balance, efficiency, "0xA11CE")
+
+
+class SplitTest(unittest.TestCase):
+    def test_proportional_to_weights(self):
+        self.assertEqual(split(10, [1, 1], [10, 10]), [5, 5])
+        self.assertEqual(split(12, [1, 2, 3], [100, 100, 100]), [2, 4, 6])
+
+    def test_rounding_leftovers_go_to_the_largest_fractions(self):
+        # 2.5, 5 and 2.5 kWh: the one leftover kWh goes to the first of the equal fractions
+        self.assertEqual(split(10, [1, 2, 1], [100, 100, 100]), [3, 5, 2])
+        self.assertEqual(split(10, [1, 1, 1], [100, 100, 100]), [4, 3, 3])
+
+    def test_caps_are_never_exceeded_and_the_rest_is_spread(self):
+        self.assertEqual(split(10, [1, 1], [2, 100]), [2, 8])
+        self.assertEqual(split(10, [5, 1, 1], [1, 100, 100]), [1, 5, 4])
+
+    def test_what_no_panel_can_take_is_left(self):
+        self.assertEqual(split(10, [1, 1], [2, 3]), [2, 3])
+        self.assertEqual(split(10, [1, 1], [0, 0]), [0, 0])
+
+    def test_zero_weights_get_nothing(self):
+        self.assertEqual(split(5, [0, 1], [10, 10]), [0, 5])
+        self.assertEqual(split(5, [0, 0], [10, 10]), [0, 0])
+
+    def test_total_is_conserved(self):
+        weights = [7, 3, 11, 1, 5]
+        caps = [4, 50, 9, 30, 2]
+        for amount in range(0, 120):
+            shares = split(amount, weights, caps)
+            self.assertEqual(sum(shares), min(amount, sum(caps)))
+            self.assertTrue(all(0 <= share <= cap for share, cap in zip(shares, caps)))
+
+
+class PlanAllocationTest(unittest.TestCase):
+    def test_by_remaining_capacity(self):
+        panels = [panel(1, 100, 80), panel(2, 100, 40), panel(3, 50, 50)]
+        allocations, unallocated = plan_allocation(panels, 40, BY_CAPACITY)
+        self.assertEqual(allocations, [(1, 10), (2, 30)])
+        self.assertEqual(unallocated, 0)
+
+    def test_by_efficiency(self):
+        panels = [panel(1, 100, 0, efficiency=30), panel(2, 100, 0, efficiency=10)]
+        self.assertEqual(plan_allocation(panels, 20, BY_EFFICIENCY), ([(1, 15), (2, 5)], 0))
+
+    def test_remainder_is_returned_as_unallocated(self):
+        panels = [panel(1, 100, 95), panel(2, 10, 8)]
+        self.assertEqual(plan_allocation(panels, 20, BY_CAPACITY), ([(1, 5), (2, 2)], 13))
+        self.assertEqual(plan_allocation([], 20), ([], 20))
+
+    def test_duplicate_panel_ids_only_use_the_first(self):
+        # The contract updates the first panel with an id, so a later duplicate cannot receive energy
+        panels = [panel(1, 10, 0), panel(1, 100, 0), panel(2, 10, 0)]
+        self.assertEqual(plan_allocation(panels, 30, BY_CAPACITY), ([(1, 10), (2, 10)], 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,247 @@
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench_chain import connect
+from event_sync import event_signature
+from indexer import ChainIndexer
+from search_index import TransactionIndex
+
+# Tests of the chain index against py-evm through eth-tester (bench_chain.py --tester); run with
+# `python -m unittest discover test` from Source Code. No Solidity compiler is needed: the contract's events are
+# emitted by a tiny hand-assembled contract that logs whatever topics and data it is called with, and the index reads
+# them through the event ABI of contracts/Lumin.sol.
+
+
+def event(name, *inputs):
+    # inputs are (name, type, indexed)
+    return {'type': 'event', 'name': name, 'anonymous': False,
+            'inputs': [{'name': arg, 'type': kind, 'indexed': indexed} for arg, kind, indexed in inputs]}
+
+
+EVENT_ABI = [
+    event("UserRegistered", ("user", "address", True), ("username", "string", False), ("isManager", "bool", False)),
+    event("ManagerAssigned", ("manager", "address", True), ("users", "address[]", False)),
+    event("PanelAdded", ("owner", "address", True), ("panelId", "uint256", True), ("capacity", "uint256", False),
+          ("location", "string", False), ("producedEnergy", "uint256", False), ("consumedEnergy", "uint256", False),
+          ("efficiency", "uint256", False)),
+    event("EnergyPosted", ("saleId", "uint256", True), ("seller", "address", True), ("energy", "uint256", False),
+          ("price", "uint256", False)),
+    event("EnergyBought", ("saleId", "uint256", True), ("buyer", "address", True), ("seller", "address", True),
+          ("amount", "uint256", False), ("totalPrice", "uint256", False), ("remainingEnergy", "uint256", False),
+          ("timestamp", "uint256", False)),
+    event("EnergyProduced", ("owner", "address", True), ("panelId", "uint256", True), ("energy", "uint256", False),
+          ("timestamp", "uint256", False)),
+    event("EnergyConsumed", ("owner", "address", True), ("panelId", "uint256", True), ("energy", "uint256", False),
+          ("timestamp", "uint256", False)),
+    event("EnergyAllocated", ("owner", "address", True), ("panelId", "uint256", True), ("energy", "uint256", False)),
+    event("EnergyBalanceReduced", ("owner", "address", True), ("panelId", "uint256", True),
+          ("amount", "uint256", False)),
+]
+
+OPCODES = {'STOP': 0x00, 'ADD': 0x01, 'MUL': 0x02, 'SUB': 0x03, 'EQ': 0x14, 'CALLDATALOAD': 0x35,
+           'CALLDATASIZE': 0x36, 'CALLDATACOPY': 0x37, 'CODECOPY': 0x39, 'POP': 0x50, 'JUMPI': 0x57,
+           'JUMPDEST': 0x5b, 'RETURN': 0xf3}
+OPCODES.update({f'DUP{n}': 0x7f + n for n in range(1, 17)})
+OPCODES.update({f'LOG{n}': 0xa0 + n for n in range(5)})
+
+
+def assemble(program):
+    # program holds opcode names, ('push', byte) and ('push_label', label) for jumps, and ('label', label)
+    def size(item):
+        return {'push': 2, 'push_label': 3, 'label': 1}.get(item[0], 1) if isinstance(item, tuple) else 1
+
+    labels, offset = {}, 0
+    for item in program:
+        if isinstance(item, tuple) and item[0] == 'label':
+            labels[item[1]] = offset
+        offset += size(item)
+    code = bytearray()
+    for item in program:
+        if not isinstance(item, tuple):
+            code.append(OPCODES[item])
+        elif item[0] == 'push':
+            code += bytes([0x60, item[1]])
+        elif item[0] == 'push_label':
+            code += bytes([0x61]) + labels[item[1]].to_bytes(2, 'big')
+        else:
+            code.append(OPCODES['JUMPDEST'])
+    return bytes(code)
+
+
+def emitter_code():
+    # Creation code of a contract whose calldata is (topic count, topics..., event data) and that emits exactly that
+    # log: the data is copied to memory, the count picks LOG0..LOG4, and the topics are pushed last one first.
+    runtime = [('push', 0), 'CALLDATALOAD', ('push', 32), 'MUL', ('push', 32), 'ADD',  # data offset
+               'DUP1', 'CALLDATASIZE', 'SUB',  # data size
+               'DUP1', 'DUP3', ('push', 0), 'CALLDATACOPY',
+               ('push', 0), 'CALLDATALOAD']
+    for count in range(1, 5):
+        runtime += ['DUP1', ('push', count), 'EQ', ('push_label', count), 'JUMPI']
+    runtime += ['POP', 'DUP1', ('push', 0), 'LOG0', 'STOP']
+    for count in range(1, 5):
+        runtime += [('label', count), 'POP']
+        for topic in reversed(range(count)):
+            runtime += [('push', 32 + 32 * topic), 'CALLDATALOAD']
+        runtime += [f'DUP{count + 1}', ('push', 0), f'LOG{count}', 'STOP']
+    runtime = assemble(runtime)
+    init = assemble([('push', len(runtime)), ('push', 12), ('push', 0), 'CODECOPY',
+                     ('push', len(runtime)), ('push', 0), 'RETURN'])
+    return init + runtime
+
+
+class Chain:
+    # An eth-tester chain with the emitter deployed; emit() sends one contract event per transaction and block
+    def __init__(self):
+        self.web3 = connect(SimpleNamespace(tester=True, users=3, rpc=None))
+        self.tester = self.web3.provider.ethereum_tester
+        self.sender = self.web3.eth.accounts[0]
+        receipt = self.transact({'data': emitter_code()})
+        self.contract = self.web3.eth.contract(address=receipt['contractAddress'], abi=EVENT_ABI)
+        self.abi = {entry['name']: entry for entry in EVENT_ABI}
+
+    def transact(self, transaction):
+        tx_hash = self.web3.eth.send_transaction(dict(transaction, gas=1000000, **{'from': self.sender}))
+        return self.web3.eth.wait_for_transaction_receipt(tx_hash)
+
+    def emit(self, name, *values):
+        entry = self.abi[name]
+        codec = self.web3.codec
+        topics = [self.web3.keccak(text=event_signature(entry))]
+        types, data = [], []
+        for item, value in zip(entry['inputs'], values):
+            if item['indexed']:
+                topics.append(codec.encode([item['type']], [value]))
+            else:
+                types.append(item['type'])
+                data.append(value)
+        calldata = codec.encode(['uint256'], [len(topics)]) + b''.join(topics) + codec.encode(types, data)
+        return self.transact({'to': self.contract.address, 'data': calldata})
+
+
+class IndexerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.chain = Chain()
+        self.alice, self.bob, self.maria = self.chain.web3.eth.accounts[1:4]
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.db_path = os.path.join(directory.name, "index.db")
+        self.indexer = self.open_indexer()
+
+    def open_indexer(self):
+        indexer = ChainIndexer(self.chain.web3, self.chain.contract, self.db_path, batch_size=3)
+        self.addCleanup(indexer.close)
+        return indexer
+
+    def register(self):
+        self.chain.emit("UserRegistered", self.alice, "alice", False)
+        self.chain.emit("UserRegistered", self.bob, "bob", False)
+        self.chain.emit("UserRegistered", self.maria, "maria", True)
+
+
+class SyncTest(IndexerTestCase):
+    def test_sync_and_resume_from_the_checkpoint(self):
+        self.register()
+        self.chain.emit("PanelAdded", self.alice, 1, 100, "Riyadh", 10, 4, 90)
+        self.chain.emit("EnergyProduced", self.alice, 1, 5, 1000)
+        self.assertEqual(self.indexer.sync(), 5)
+        head = self.chain.web3.eth.block_number
+        self.assertEqual(self.indexer.checkpoint, head)
+        self.assertEqual(self.indexer.get_user(self.maria), ("maria", 1))
+        self.assertEqual(self.indexer.get_panels([self.alice]), [(1, 100, "Riyadh", 15, 4, 11, 90, self.alice)])
+        self.assertEqual(self.indexer.sync(), 0)  # Nothing new; the first range reaches past the head
+
+        # A restarted client only reads the blocks after the stored checkpoint
+        self.indexer.close()
+        self.chain.emit("EnergyConsumed", self.alice, 1, 6, 1001)
+        self.chain.emit("EnergyPosted", 1, self.alice, 5, 500)
+        resumed = self.open_indexer()
+        self.assertEqual(resumed.checkpoint, head)
+        self.assertEqual(resumed.sync(), 2)
+        self.assertEqual(resumed.checkpoint, self.chain.web3.eth.block_number)
+        self.assertEqual(resumed.get_panels([self.alice]), [(1, 100, "Riyadh", 15, 10, 5, 90, self.alice)])
+        self.assertEqual(resumed.get_sales(), [("alice", self.alice, 5, 500, 1)])
+        self.assertEqual(resumed.count_transactions([self.alice]), 2)
+        self.assertEqual(resumed.db.execute("SELECT COUNT(*) FROM events").fetchone()[0], 7)
+
+    def test_forked_blocks_are_rolled_back(self):
+        self.register()
+        self.chain.emit("PanelAdded", self.alice, 1, 100, "Riyadh", 0, 0, 90)
+        self.indexer.sync()
+        fork_point = self.chain.web3.eth.block_number
+        snapshot = self.chain.tester.take_snapshot()
+
+        self.chain.emit("EnergyProduced", self.alice, 1, 40, 1000)
+        self.chain.emit("EnergyPosted", 1, self.alice, 20, 2000)
+        self.chain.emit("EnergyProduced", self.alice, 1, 2, 1001)
+        self.indexer.sync()
+        generation = self.indexer.generation
+        self.assertEqual(self.indexer.count_transactions([self.alice]), 2)
+
+        # The three blocks after the fork point are replaced by a longer chain without the sale
+        self.chain.tester.revert_to_snapshot(snapshot)
+        self.chain.emit("EnergyConsumed", self.alice, 1, 1, 2000)
+        self.chain.emit("EnergyProduced", self.alice, 1, 7, 2001)
+        self.chain.emit("EnergyProduced", self.alice, 1, 8, 2002)
+        self.chain.emit("EnergyProduced", self.alice, 1, 9, 2003)
+        with self.assertLogs(level="ERROR") as logs:
+            self.indexer.sync()
+        self.assertIn(f"rolling the index back to block {fork_point}", logs.output[0])
+
+        self.assertEqual(self.indexer.generation, generation + 1)
+        self.assertEqual(self.indexer.checkpoint, self.chain.web3.eth.block_number)
+        self.assertEqual([row[2:4] + row[5:] for row in self.indexer.get_transactions([self.alice])],
+                         [(0, 1, 2000), (7, 0, 2001), (8, 0, 2002), (9, 0, 2003)])
+        self.assertEqual(self.indexer.get_panels([self.alice]), [(1, 100, "Riyadh", 24, 1, 23, 90, self.alice)])
+        # Readers keeping their own copy of the sales start over on the new generation
+        self.assertEqual(self.indexer.get_sales(), [])
+        self.assertEqual(self.indexer.get_user(self.alice), ("alice", 0))
+
+    def test_reset_rebuilds_from_the_start(self):
+        self.register()
+        self.indexer.sync()
+        generation = self.indexer.generation
+        self.indexer.reset()
+        self.assertEqual(self.indexer.generation, generation + 1)
+        self.assertIsNone(self.indexer.get_user(self.alice))
+
+
+class ManagedHistoryTest(IndexerTestCase):
+    def test_manager_history_is_listed_user_by_user(self):
+        # displayManagedTransactions lists every transaction of the first managed user, then of the next, so the
+        # index must too for "#N" to mean the same transaction in the history, the search and on chain
+        self.register()
+        self.chain.emit("ManagerAssigned", self.maria, [self.bob, self.alice])
+        self.chain.emit("EnergyProduced", self.alice, 1, 5, 1000)
+        self.chain.emit("EnergyProduced", self.bob, 2, 7, 1001)
+        self.chain.emit("EnergyConsumed", self.alice, 1, 3, 1002)
+        self.chain.emit("EnergyBought", 9, self.alice, self.bob, 2, 400, 0, 1003)
+        self.indexer.sync()
+
+        accounts = self.indexer.get_managed_users(self.maria)
+        self.assertEqual(accounts, [self.bob, self.alice])
+        history = self.indexer.get_transactions(accounts)
+        self.assertEqual(history, [
+            ("bob", "", 7, 0, 0, 1001),
+            ("bob", "alice", 2, 0, 400, 1003),
+            ("alice", "", 5, 0, 0, 1000),
+            ("alice", "", 0, 3, 0, 1002),
+            ("alice", "bob", 0, 2, 400, 1003),
+        ])
+        self.assertEqual(self.indexer.count_transactions(accounts), 5)
+        self.assertEqual(self.indexer.get_transactions(accounts, 1, 3), history[1:4])
+        chunks = list(self.indexer.iter_transactions(accounts, chunk_size=2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual([row[1:7] for chunk in chunks for row in chunk], history)
+        self.assertEqual(TransactionIndex(history).search("#2"), ([2], [history[2]]))
+        # A user's own history is unchanged
+        self.assertEqual(self.indexer.get_transactions([self.alice]), history[2:])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+import os
+import queue
+import sys
+import unittest
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ingest import Batch, Stats, Submitter, WindowAggregator
+from tx_pipeline import TransactionFailed, TransactionTimeout
+
+# Unit tests of meter reading ingestion without a node; run with `python -m unittest discover test` from Source Code.
+# The submitter sends through a stub pipeline whose futures are already settled when send() returns.
+
+ACCOUNT = "0xA11CE"
+
+
+def entries(batch):
+    return None if batch is None else batch.entries
+
+
+class WindowAggregatorTest(unittest.TestCase):
+    def test_window_closes_on_a_later_reading(self):
+        aggregator = WindowAggregator(window=60, max_panels=10)
+        self.assertEqual(aggregator.add(1, 2.0, 0), [])
+        self.assertEqual(aggregator.add(1, 3.0, 30), [])
+        self.assertEqual(aggregator.add(2, -4.0, 59), [])
+        batches = aggregator.add(1, 7.0, 60)
+        self.assertEqual([entries(batch) for batch in batches], [[(1, 5, 2), (2, -4, 1)]])
+        self.assertEqual(batches[0].readings, 3)
+        # The reading that closed the window starts the next one
+        self.assertEqual(entries(aggregator.flush()), [(1, 7, 1)])
+        self.assertIsNone(aggregator.flush())
+
+    def test_flushes_at_max_panels(self):
+        aggregator = WindowAggregator(window=60, max_panels=2)
+        self.assertEqual(aggregator.add(1, 1.0, 0), [])
+        self.assertEqual(aggregator.add(1, 1.0, 1), [])
+        batches = aggregator.add(2, 1.0, 2)
+        self.assertEqual([entries(batch) for batch in batches], [[(1, 2, 2), (2, 1, 1)]])
+        self.assertIsNone(aggregator.flush())
+
+    def test_rounding_remainder_is_carried(self):
+        aggregator = WindowAggregator(window=60, max_panels=10)
+        aggregator.add(1, 0.6, 0)
+        self.assertEqual(entries(aggregator.flush()), [(1, 1, 1)])  # 0.4 kWh too much is carried
+        aggregator.add(1, 0.6, 10)
+        self.assertIsNone(aggregator.flush())  # 0.2 kWh carried, nothing to send
+        aggregator.add(1, 0.4, 20)
+        self.assertEqual(entries(aggregator.flush()), [(1, 1, 1)])
+        self.assertAlmostEqual(aggregator.carry[1], -0.4)
+
+    def test_batch_split(self):
+        first, second = Batch([(1, 1, 1), (2, 2, 2), (3, 3, 3)], attempts=2).split()
+        self.assertEqual((first.entries, second.entries), ([(1, 1, 1)], [(2, 2, 2), (3, 3, 3)]))
+        self.assertEqual((first.attempts, second.attempts), (2, 2))
+
+
+class StubPipeline:
+    # outcome(panel ids, number of the send) returns None for a mined transaction or the exception its future fails
+    # with, or raises to fail send() itself
+    def __init__(self, outcome, tracked_outcome=None):
+        self.outcome = outcome
+        self.tracked_outcome = tracked_outcome
+        self.sent = []
+        self.tracked = []
+        self.resets = []
+
+    def send(self, contract_function, transaction):
+        self.sent.append(contract_function.panel_ids)
+        return settled(self.outcome(contract_function.panel_ids, len(self.sent)))
+
+    def track(self, tx_hash, function="unknown"):
+        self.tracked.append(tx_hash)
+        return settled(self.tracked_outcome)
+
+    def reset(self, account=None):
+        self.resets.append(account)
+
+
+def settled(error):
+    future = Future()
+    if error is None:
+        future.set_result({'status': 1})
+    else:
+        future.set_exception(error)
+    return future
+
+
+def record_readings(panel_ids, deltas):
+    return SimpleNamespace(panel_ids=panel_ids, deltas=deltas)
+
+
+CONTRACT = SimpleNamespace(functions=SimpleNamespace(recordReadings=record_readings))
+
+
+class SubmitterTest(unittest.TestCase):
+    def submit(self, pipeline, *batches):
+        stats = Stats()
+        submitter = Submitter(CONTRACT, pipeline, ACCOUNT, stats, max_in_flight=2, retries=2, backoff=0)
+        pending = queue.Queue()
+        for batch in batches:
+            pending.put(batch)
+        pending.put(None)
+        with self.assertLogs(level="ERROR") as self.logs:
+            submitter.run(pending)
+        self.assertEqual(submitter.in_flight, 0)
+        return stats
+
+    def test_reverted_batch_is_split_until_the_bad_reading_is_dropped(self):
+        def outcome(panel_ids, number):
+            return TransactionFailed(f"0x{number}", {'blockNumber': 7}) if 3 in panel_ids else None
+
+        pipeline = StubPipeline(outcome)
+        stats = self.submit(pipeline, Batch([(1, 5, 2), (2, 3, 1), (3, 99, 4), (4, 1, 1)]))
+        self.assertEqual(pipeline.sent, [[1, 2, 3, 4], [1, 2], [3, 4], [3], [4]])
+        self.assertEqual((stats.recorded, stats.rejected, stats.transactions), (4, 4, 5))
+        self.assertIn("Dropping 4 readings for panel 3", self.logs.output[0])
+
+    def test_timed_out_transaction_is_tracked_not_sent_again(self):
+        pipeline = StubPipeline(lambda panel_ids, number: TransactionTimeout("0xabc", 300))
+        stats = self.submit(pipeline, Batch([(1, 5, 2)]))
+        self.assertEqual(pipeline.sent, [[1]])
+        self.assertEqual(pipeline.tracked, ["0xabc"])
+        self.assertEqual(pipeline.resets, [ACCOUNT])
+        self.assertEqual((stats.recorded, stats.rejected, stats.retries), (2, 0, 1))
+
+    def test_transaction_that_never_shows_up_is_given_up(self):
+        timeout = TransactionTimeout("0xabc", 300)
+        pipeline = StubPipeline(lambda panel_ids, number: timeout, tracked_outcome=timeout)
+        stats = self.submit(pipeline, Batch([(1, 5, 2)]))
+        self.assertEqual(pipeline.sent, [[1]])
+        self.assertEqual(pipeline.tracked, ["0xabc", "0xabc"])
+        self.assertEqual((stats.recorded, stats.rejected), (0, 2))
+        self.assertIn("may still be recorded", self.logs.output[-1])
+
+    def test_send_that_never_reached_the_node_is_retried(self):
+        def outcome(panel_ids, number):
+            if number == 1:
+                raise requests.ConnectTimeout("timed out")
+            return None
+
+        pipeline = StubPipeline(outcome)
+        stats = self.submit(pipeline, Batch([(1, 5, 2)]))
+        self.assertEqual(pipeline.sent, [[1], [1]])
+        self.assertEqual((stats.recorded, stats.retries), (2, 1))
+
+    def test_send_that_may_have_reached_the_node_is_not_retried(self):
+        def outcome(panel_ids, number):
+            raise requests.ReadTimeout("read timed out")
+
+        pipeline = StubPipeline(outcome)
+        stats = self.submit(pipeline, Batch([(1, 5, 2)]))
+        self.assertEqual(pipeline.sent, [[1]])
+        self.assertEqual((stats.recorded, stats.rejected), (0, 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
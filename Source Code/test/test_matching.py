@@ -0,0 +1,86 @@
+import os
+import sys
+import unittest
+from fractions import Fraction
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import SPARE_CANDIDATES, plan_order, unit_price
+
+# Unit tests of planning market orders; run with `python -m unittest discover test` from Source Code.
+# Sales are laid out like the EnergySale struct: (seller name, seller address, energy, price, sale id).
+
+ALICE = "0xA11CE"
+BOB = "0xB0B"
+
+
+def sale(sale_id, energy, price, seller=BOB):
+    return ("alice" if seller == ALICE else "bob", seller, energy, price, sale_id)
+
+
+def fills(plan):
+    return [(row[4], take, cost) for row, take, cost in plan.fills]
+
+
+class PlanOrderTest(unittest.TestCase):
+    def setUp(self):
+        # Unit prices: 1 -> 100, 2 -> 50, 3 -> 150 (Alice's own), 4 -> 50, 5 -> 33.3 wei per kWh
+        self.sales = [sale(1, 10, 1000), sale(2, 5, 250), sale(3, 20, 3000, ALICE), sale(4, 40, 2000),
+                      sale(5, 3, 100)]
+
+    def test_cheapest_per_kwh_first_with_a_partial_last_fill(self):
+        plan = plan_order(self.sales, 12, ALICE)
+        # Equal unit prices fill in posting order; sale 4 is only partly taken, at its own price per kWh
+        self.assertEqual(fills(plan), [(5, 3, 100), (2, 5, 250), (4, 4, 200)])
+        self.assertEqual(plan.filled, 12)
+        self.assertEqual(plan.cost, 550)
+        self.assertEqual(plan.sale_ids, [5, 2, 4, 1])
+
+    def test_partial_fill_rounds_the_cost_down(self):
+        plan = plan_order([sale(1, 3, 100)], 2, ALICE)
+        self.assertEqual(fills(plan), [(1, 2, 66)])
+
+    def test_own_sales_are_skipped(self):
+        plan = plan_order(self.sales, 1000, ALICE)
+        self.assertNotIn(3, plan.sale_ids)
+        self.assertEqual(plan.filled, 58)
+        self.assertEqual(plan_order([sale(3, 20, 3000, ALICE)], 5, ALICE).fills, [])
+
+    def test_price_limit(self):
+        plan = plan_order(self.sales, 12, ALICE, max_unit_price=50)
+        self.assertEqual(fills(plan), [(5, 3, 100), (2, 5, 250), (4, 4, 200)])
+        self.assertEqual(plan.sale_ids, [5, 2, 4])  # Sale 1 is over the limit, so not even a spare
+        plan = plan_order(self.sales, 12, ALICE, max_unit_price=Fraction(100, 3))
+        self.assertEqual(fills(plan), [(5, 3, 100)])
+        self.assertEqual(plan.filled, 3)
+
+    def test_limit_and_value(self):
+        # Without a limit of their own the buyer pays at most the highest price per kWh in the plan, rounded up
+        plan = plan_order([sale(5, 3, 100)], 3, ALICE)
+        self.assertEqual(plan.limit, 34)
+        self.assertEqual(plan.value, 102)  # matchOrder refunds the 2 wei it does not spend
+        plan = plan_order(self.sales, 12, ALICE)
+        self.assertEqual(plan.limit, 50)
+        self.assertEqual(plan.value, 600)
+        self.assertGreaterEqual(plan.value, plan.cost)
+        plan = plan_order(self.sales, 12, ALICE, max_unit_price=60)
+        self.assertEqual(plan.limit, 60)
+        self.assertEqual(plan.value, 720)
+
+    def test_nothing_to_buy(self):
+        plan = plan_order([], 5, ALICE)
+        self.assertEqual((plan.filled, plan.cost, plan.limit, plan.value, plan.sale_ids), (0, 0, 0, 0, []))
+
+    def test_spares_follow_the_plan(self):
+        sales = [sale(i, 1, 10 * i) for i in range(1, SPARE_CANDIDATES + 5)]
+        plan = plan_order(sales, 2, ALICE)
+        self.assertEqual(fills(plan), [(1, 1, 10), (2, 1, 20)])
+        self.assertEqual([row[4] for row in plan.spares], list(range(3, 3 + SPARE_CANDIDATES)))
+        self.assertEqual(plan.sale_ids, list(range(1, 3 + SPARE_CANDIDATES)))
+
+    def test_unit_price_is_exact(self):
+        self.assertEqual(unit_price(sale(1, 3, 100)), Fraction(100, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import sys
+import unittest
+from fractions import Fraction
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matching import plan_order, unit_price
+from order_book import AMOUNT, POSTED, UNIT_PRICE, WEI_PER_ETH, OrderBook, parse_filter
+
+# Unit tests of the client-side order book; run with `python -m unittest discover test` from Source Code.
+# Sales are laid out like the EnergySale struct: (seller name, seller address, energy, price, sale id).
+
+ALICE = "0xA11CE"
+BOB = "0xB0B"
+
+
+def sale(sale_id, energy, price, seller=ALICE):
+    return ("alice" if seller == ALICE else "bob", seller, energy, price, sale_id)
+
+
+def ids(sales):
+    return [row[4] for row in sales]
+
+
+class OrderBookTest(unittest.TestCase):
+    def setUp(self):
+        # Unit prices: 1 -> 100, 2 -> 50, 3 -> 150, 4 -> 50 wei per kWh
+        self.book = OrderBook([sale(1, 10, 1000), sale(2, 5, 250, BOB), sale(3, 20, 3000), sale(4, 40, 2000, BOB)])
+
+    def test_orders_by_unit_price_not_total_price(self):
+        # Sale 4 costs more in total than sale 1 but less per kWh; equal unit prices keep posting order
+        self.assertEqual(ids(self.book.ordered(UNIT_PRICE)), [2, 4, 1, 3])
+        self.assertEqual(ids(self.book.ordered(UNIT_PRICE, descending=True)), [3, 1, 4, 2])
+        self.assertEqual(ids(self.book.ordered(AMOUNT)), [2, 1, 3, 4])
+        self.assertEqual(ids(self.book.ordered(POSTED)), [1, 2, 3, 4])
+
+    def test_insert(self):
+        self.book.apply(5, sale(5, 1, 10))
+        self.assertEqual(len(self.book), 5)
+        self.assertEqual(ids(self.book.ordered(UNIT_PRICE)), [5, 2, 4, 1, 3])
+        self.assertEqual(self.book.position(5, UNIT_PRICE), 0)
+        self.assertEqual(self.book.position(5, AMOUNT, descending=True), 4)
+
+    def test_partial_fill_keeps_unit_price_and_moves_by_amount(self):
+        # 36 of sale 4's 40 kWh are bought; the price left is for the 4 kWh left
+        self.book.apply(4, sale(4, 4, 200, BOB))
+        self.assertEqual(self.book.get(4), sale(4, 4, 200, BOB))
+        self.assertEqual(ids(self.book.ordered(UNIT_PRICE)), [2, 4, 1, 3])
+        self.assertEqual(ids(self.book.ordered(AMOUNT)), [4, 2, 1, 3])
+        self.assertEqual(len(self.book), 4)
+
+    def test_fill_removes_the_sale(self):
+        self.book.apply(2, None)
+        self.assertIsNone(self.book.get(2))
+        self.assertIsNone(self.book.position(2, UNIT_PRICE))
+        self.assertEqual(ids(self.book.ordered(UNIT_PRICE)), [4, 1, 3])
+        self.assertEqual(ids(self.book.query(seller=BOB)), [4])
+        self.book.apply(4, None)
+        self.assertEqual(self.book.query(seller=BOB), [])
+        self.book.apply(4, None)  # Removing a sale that is already gone changes nothing
+        self.assertEqual(len(self.book), 2)
+
+    def test_zero_energy_sales_are_left_out(self):
+        book = OrderBook([sale(1, 0, WEI_PER_ETH), sale(2, 5, 250)])
+        self.assertEqual(ids(book.ordered(UNIT_PRICE)), [2])
+        book.apply(3, sale(3, 0, 100))
+        self.assertIsNone(book.get(3))
+        book.apply(2, sale(2, 0, 0))
+        self.assertEqual(len(book), 0)
+        self.assertIsNone(book.best())
+
+    def test_zero_energy_sale_is_never_planned(self):
+        self.assertEqual(unit_price(sale(1, 0, 100)), float('inf'))
+        plan = plan_order([sale(1, 0, 100, BOB), sale(2, 5, 250, BOB)], 3, ALICE)
+        self.assertEqual([(row[4], take, cost) for row, take, cost in plan.fills], [(2, 3, 150)])
+
+    def test_query_filters(self):
+        self.assertEqual(ids(self.book.query(min_energy=10, order=UNIT_PRICE)), [4, 1, 3])
+        self.assertEqual(ids(self.book.query(max_unit_price=100, order=UNIT_PRICE)), [2, 4, 1])
+        self.assertEqual(ids(self.book.query(min_energy=10, max_unit_price=100, order=AMOUNT, descending=True)),
+                         [4, 1])
+        self.assertEqual(ids(self.book.query(min_unit_price=Fraction(100), max_energy=10)), [1])
+        self.assertEqual(ids(self.book.query(exclude_seller=BOB, order=UNIT_PRICE)), [1, 3])
+        self.assertEqual(ids(self.book.query(seller=ALICE, max_unit_price=100)), [1])
+        self.assertEqual(self.book.query(min_energy=1000), [])
+
+    def test_best_skips_own_sales(self):
+        self.assertEqual(self.book.best()[4], 2)
+        self.assertEqual(self.book.best(exclude_seller=BOB)[4], 1)
+        self.assertIsNone(OrderBook().best())
+
+    def test_parse_filter(self):
+        bounds = parse_filter("amount:100.. price:..0.01")
+        self.assertEqual(bounds['min_energy'], 100)
+        self.assertIsNone(bounds['max_energy'])
+        self.assertIsNone(bounds['min_unit_price'])
+        self.assertEqual(bounds['max_unit_price'], WEI_PER_ETH // 100)
+        self.assertEqual(parse_filter(""), {})
+        for text in ["sara", "price:abc", "amount:x"]:
+            with self.assertRaises(ValueError):
+                parse_filter(text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+import json
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from provider_pool import LEAST_LATENCY, Endpoint, ProviderPool, ProviderPoolError, pin_key
+
+# Unit tests of the provider pool's routing, retries and circuit breakers; run with `python -m unittest discover test`
+# from Source Code. Every endpoint's HTTP session is replaced by a stub node that answers with its own URL, so the
+# tests can see where each request went, or fails while its url is in `down`.
+
+ACCOUNT = "0xA11CE"
+OTHER_ACCOUNT = "0xB0B"
+
+
+class StubResponse:
+    def __init__(self, body):
+        self.body = body
+        self.content = json.dumps(body).encode()
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.body
+
+
+class StubSession:
+    def __init__(self, url, log, down):
+        self.url = url
+        self.log = log  # (url, method) of every request sent to any endpoint
+        self.down = down  # url -> exception raised by its requests
+
+    def post(self, url, data, headers, timeout):
+        payload = json.loads(data)
+        self.log.append((url, payload['method'] if isinstance(payload, dict) else "batch"))
+        if url in self.down:
+            raise self.down[url]
+        return StubResponse({'jsonrpc': '2.0', 'id': payload.get('id') if isinstance(payload, dict) else None,
+                             'result': url})
+
+
+def stub_pool(urls, **options):
+    pool = ProviderPool(urls, **options)
+    pool.log = []
+    pool.down = {}
+    for endpoint in pool.endpoints:
+        endpoint.session = StubSession(endpoint.url, pool.log, pool.down)
+    return pool
+
+
+def send_transaction(pool, account=ACCOUNT):
+    return pool.make_request("eth_sendTransaction", [{'from': account, 'data': '0x'}])['result']
+
+
+class EndpointTest(unittest.TestCase):
+    def setUp(self):
+        self.log = []
+        self.down = {}
+        self.endpoint = Endpoint("http://a", failure_threshold=2, cooldown=5.0, max_cooldown=12.0)
+        self.endpoint.session = StubSession("http://a", self.log, self.down)
+
+    def fail(self):
+        with self.assertRaises(requests.ConnectionError):
+            self.endpoint.post({'method': "eth_blockNumber", 'id': 1}, "eth_blockNumber")
+
+    def cool_down(self):
+        # As if the cool-down had passed
+        self.endpoint.open_until = time.monotonic() - 1
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        self.down["http://a"] = requests.ConnectionError("refused")
+        self.fail()
+        self.assertEqual(self.endpoint.stats()['state'], "closed")
+        self.assertTrue(self.endpoint.available(time.monotonic()))
+        self.fail()
+        self.assertEqual(self.endpoint.stats()['state'], "open")
+        self.assertFalse(self.endpoint.available(time.monotonic()))
+        self.assertTrue(self.endpoint.available(time.monotonic() + 5.1))
+        self.assertEqual(self.endpoint.stats()['failures'], 2)
+        self.assertEqual(self.endpoint.stats()['last_error'], "refused")
+
+    def test_half_open_trial_request(self):
+        self.down["http://a"] = requests.ConnectionError("refused")
+        self.fail()
+        self.fail()
+        self.cool_down()
+        self.assertEqual(self.endpoint.stats()['state'], "half-open")
+        # A failed trial request opens the breaker again for twice as long, up to max_cooldown
+        self.fail()
+        self.assertAlmostEqual(self.endpoint.open_until - time.monotonic(), 10.0, delta=0.5)
+        self.cool_down()
+        self.fail()
+        self.assertAlmostEqual(self.endpoint.open_until - time.monotonic(), 12.0, delta=0.5)
+        # A successful one closes it
+        self.cool_down()
+        del self.down["http://a"]
+        self.assertEqual(self.endpoint.post({'method': "eth_blockNumber", 'id': 2}, "eth_blockNumber")['result'],
+                         "http://a")
+        self.assertEqual(self.endpoint.stats()['state'], "closed")
+        self.assertEqual(self.endpoint.trips, 0)
+        self.assertIsNotNone(self.endpoint.stats()['latency_ms'])
+
+    def test_success_resets_the_failure_count(self):
+        self.down["http://a"] = requests.ConnectionError("refused")
+        self.fail()
+        del self.down["http://a"]
+        self.endpoint.post({'method': "eth_blockNumber", 'id': 1}, "eth_blockNumber")
+        self.down["http://a"] = requests.ConnectionError("refused")
+        self.fail()
+        self.assertEqual(self.endpoint.stats()['state'], "closed")
+
+
+class ProviderPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.urls = ["http://a", "http://b", "http://c"]
+        sleep = mock.patch("provider_pool.time.sleep")
+        self.sleep = sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def test_round_robin(self):
+        pool = stub_pool(self.urls)
+        results = [pool.make_request("eth_blockNumber", [])['result'] for _ in range(6)]
+        self.assertEqual(results, self.urls * 2)
+
+    def test_least_latency(self):
+        pool = stub_pool(self.urls, routing=LEAST_LATENCY)
+        for endpoint, latency in zip(pool.endpoints, [0.3, 0.1, 0.2]):
+            endpoint.latency = latency
+        results = {pool.make_request("eth_blockNumber", [])['result'] for _ in range(5)}
+        self.assertEqual(results, {"http://b"})
+        # An endpoint that has not been measured yet is tried first
+        pool.endpoints[2].latency = None
+        self.assertEqual(pool.make_request("eth_blockNumber", [])['result'], "http://c")
+
+    def test_unknown_routing(self):
+        with self.assertRaises(ValueError):
+            ProviderPool(self.urls, routing="random")
+        with self.assertRaises(ValueError):
+            ProviderPool([])
+
+    def test_failed_read_moves_to_the_next_endpoint(self):
+        pool = stub_pool(self.urls)
+        pool.down["http://a"] = requests.ConnectionError("refused")
+        self.assertEqual(pool.make_request("eth_blockNumber", [])['result'], "http://b")
+        self.assertEqual(pool.log, [("http://a", "eth_blockNumber"), ("http://b", "eth_blockNumber")])
+        self.assertEqual(pool.send_batch([{'jsonrpc': '2.0', 'id': 1, 'method': "eth_blockNumber", 'params': []}]),
+                         {'jsonrpc': '2.0', 'id': None, 'result': "http://b"})
+
+    def test_open_breaker_is_skipped(self):
+        pool = stub_pool(self.urls, failure_threshold=1)
+        pool.down["http://a"] = requests.ConnectionError("refused")
+        pool.make_request("eth_blockNumber", [])
+        del pool.down["http://a"]
+        results = {pool.make_request("eth_blockNumber", [])['result'] for _ in range(4)}
+        self.assertEqual(results, {"http://b", "http://c"})
+        self.assertEqual([stats['state'] for stats in pool.stats()], ["open", "closed", "closed"])
+
+    def test_every_breaker_open_still_tries(self):
+        pool = stub_pool(self.urls[:2], failure_threshold=1)
+        pool.endpoints[0].open_until = time.monotonic() + 60
+        pool.endpoints[1].open_until = time.monotonic() + 30
+        self.assertEqual(pool.make_request("eth_blockNumber", [])['result'], "http://b")
+
+    def test_exponential_backoff(self):
+        pool = stub_pool(self.urls, retries=4, backoff=0.25, max_backoff=1.0, failure_threshold=100)
+        for url in self.urls:
+            pool.down[url] = requests.ConnectionError("refused")
+        with self.assertRaises(ProviderPoolError) as raised:
+            pool.make_request("eth_blockNumber", [])
+        self.assertEqual([call.args[0] for call in self.sleep.call_args_list], [0.25, 0.5, 1.0, 1.0])
+        self.assertEqual(len(pool.log), 5)
+        self.assertIn("http://c: refused", str(raised.exception))
+
+    def test_writes_for_one_account_stay_on_one_endpoint(self):
+        pool = stub_pool(self.urls)
+        first = send_transaction(pool)
+        for _ in range(5):
+            pool.make_request("eth_blockNumber", [])
+            self.assertEqual(send_transaction(pool), first)
+            self.assertEqual(send_transaction(pool, ACCOUNT.lower()), first)
+            self.assertEqual(pool.make_request("eth_getTransactionCount", [ACCOUNT, "pending"])['result'], first)
+        # Another account is pinned on its own, wherever the rotation stood
+        other = send_transaction(pool, OTHER_ACCOUNT)
+        self.assertEqual({send_transaction(pool, OTHER_ACCOUNT) for _ in range(3)}, {other})
+        self.assertEqual(set(pool.pins), {ACCOUNT.lower(), OTHER_ACCOUNT.lower()})
+
+    def test_pin_moves_when_its_breaker_opens(self):
+        pool = stub_pool(self.urls, failure_threshold=1)
+        first = send_transaction(pool)
+        pool.endpoints[self.urls.index(first)].open_until = time.monotonic() + 60
+        second = send_transaction(pool)
+        self.assertNotEqual(second, first)
+        pool.endpoints[self.urls.index(first)].open_until = 0.0
+        self.assertEqual(send_transaction(pool), second)
+
+    def test_failed_write_is_not_sent_again(self):
+        # The node may have accepted the transaction before the connection broke
+        pool = stub_pool(self.urls)
+        pool.down["http://a"] = requests.ConnectionError("connection reset")
+        with self.assertRaises(requests.ConnectionError):
+            send_transaction(pool)
+        self.assertEqual(pool.log, [("http://a", "eth_sendTransaction")])
+
+    def test_write_that_never_connected_is_retried_on_its_endpoint(self):
+        pool = stub_pool(self.urls, retries=2, failure_threshold=100)
+        pool.down["http://a"] = requests.ConnectTimeout("timed out")
+        with self.assertRaises(ProviderPoolError):
+            send_transaction(pool)
+        self.assertEqual(pool.log, [("http://a", "eth_sendTransaction")] * 3)
+
+    def test_pin_keys(self):
+        self.assertEqual(pin_key("eth_newFilter", [{}]), "filters")
+        self.assertEqual(pin_key("eth_getFilterChanges", ["0x1"]), "filters")
+        self.assertEqual(pin_key("eth_sendTransaction", [{'from': ACCOUNT}]), ACCOUNT.lower())
+        self.assertEqual(pin_key("eth_getTransactionCount", [ACCOUNT, "pending"]), ACCOUNT.lower())
+        self.assertEqual(pin_key("eth_sendRawTransaction", ["0x00"]), "raw")
+        self.assertIsNone(pin_key("eth_call", [{}, "latest"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
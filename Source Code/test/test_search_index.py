@@ -0,0 +1,122 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from search_index import PanelIndex, SortedKeys, TransactionIndex, parse_range, parse_terms
+
+# Unit tests of the dashboard's in-memory search indexes; run with `python -m unittest discover test` from Source Code.
+# Panels are laid out like the Panel struct and transactions like the history rows of ChainIndexer.get_transactions:
+# (from name, to name, produced, consumed, tokens, timestamp).
+
+SARA = "0x5A4A"
+OMAR = "0x0A4A"
+USERNAMES = {SARA: "sara", OMAR: "omar"}
+
+PANELS = [
+    (1, 100, "Riyadh", 0, 0, 0, 90, SARA),
+    (12, 50, "Jeddah", 0, 0, 0, 80, OMAR),
+    (120, 75, "Riyadh North", 0, 0, 0, 85, OMAR),
+    (7, 20, "Dammam", 0, 0, 0, 70, SARA),
+]
+
+TRANSACTIONS = [
+    ("sara", "", 40, 0, 0, 1700000000),
+    ("omar", "sara", 0, 10, 5000, 1700000100),
+    ("sara", "omar", 0, 25, 9000, 1700000200),
+    ("omar", "", 60, 0, 0, 1700086400),
+]
+
+
+def panel_ids(panels):
+    return [panel[0] for panel in panels]
+
+
+class SortedKeysTest(unittest.TestCase):
+    def test_prefix_and_range(self):
+        keys = SortedKeys([("sara", 0), ("salem", 1), ("omar", 2), ("sara", 3)])
+        self.assertEqual(keys.prefix("sa"), {0, 1, 3})
+        self.assertEqual(keys.prefix("sara"), {0, 3})
+        self.assertEqual(keys.prefix("x"), set())
+        numbers = SortedKeys([(5, 0), (10, 1), (10, 2), (20, 3)])
+        self.assertEqual(numbers.range(10, 10), {1, 2})
+        self.assertEqual(numbers.range(None, 9), {0})
+        self.assertEqual(numbers.range(11), {3})
+        self.assertEqual(numbers.range(), {0, 1, 2, 3})
+
+    def test_parse(self):
+        self.assertEqual(parse_terms("Loc:Riyadh sara"), [("loc", "riyadh"), (None, "sara")])
+        self.assertEqual(parse_range("10..50"), (10, 50))
+        self.assertEqual(parse_range("10.."), (10, None))
+        self.assertEqual(parse_range("..50"), (None, 50))
+        self.assertEqual(parse_range("7"), (7, 7))
+        self.assertEqual(parse_range(""), (None, None))
+        with self.assertRaises(ValueError):
+            parse_range("ten")
+
+
+class PanelIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = PanelIndex(PANELS, USERNAMES)
+
+    def test_id_prefix(self):
+        self.assertEqual(panel_ids(self.index.search("12")), [12, 120])
+        self.assertEqual(panel_ids(self.index.search("id:1")), [1, 12, 120])
+        self.assertEqual(self.index.search("9"), [])
+
+    def test_location_and_owner(self):
+        self.assertEqual(panel_ids(self.index.search("loc:riyadh")), [1, 120])
+        self.assertEqual(panel_ids(self.index.search("owner:sara")), [1, 7])
+        self.assertEqual(panel_ids(self.index.search("owner:0x0a")), [12, 120])
+        # A bare word matches a location or an owner prefix
+        self.assertEqual(panel_ids(self.index.search("dam")), [7])
+        self.assertEqual(panel_ids(self.index.search("omar")), [12, 120])
+
+    def test_terms_narrow_the_result(self):
+        self.assertEqual(panel_ids(self.index.search("omar loc:riyadh")), [120])
+        self.assertEqual(self.index.search("sara loc:jeddah"), [])
+        self.assertEqual(panel_ids(self.index.search("")), [])
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            self.index.search("colour:red")
+
+
+class TransactionIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = TransactionIndex(TRANSACTIONS)
+
+    def test_row_number_lookup(self):
+        # "#N" and a bare number are the Transaction ID shown in the full list, i.e. the row's position in it
+        self.assertEqual(self.index.search("#2"), ([2], [TRANSACTIONS[2]]))
+        self.assertEqual(self.index.search("0"), ([0], [TRANSACTIONS[0]]))
+        self.assertEqual(self.index.search("#4"), ([], []))
+
+    def test_name_prefix_matches_either_side(self):
+        self.assertEqual(self.index.search("sara")[0], [0, 1, 2])
+        self.assertEqual(self.index.search("name:om")[0], [1, 2, 3])
+
+    def test_ranges(self):
+        self.assertEqual(self.index.search("time:1700000100..1700000200")[0], [1, 2])
+        self.assertEqual(self.index.search("time:1700086400..")[0], [3])
+        # The amount is the energy produced or, for consumption and trades, the energy consumed
+        self.assertEqual(self.index.search("amount:25..")[0], [0, 2, 3])
+        self.assertEqual(self.index.search("amount:..10")[0], [1])
+
+    def test_terms_narrow_the_result(self):
+        numbers, rows = self.index.search("sara amount:20..")
+        self.assertEqual(numbers, [0, 2])
+        self.assertEqual(rows, [TRANSACTIONS[0], TRANSACTIONS[2]])
+        # A number next to another term is a name prefix, not a row number
+        self.assertEqual(self.index.search("#1 sara")[0], [])
+
+    def test_invalid_queries(self):
+        with self.assertRaises(ValueError):
+            self.index.search("colour:red")
+        with self.assertRaises(ValueError):
+            self.index.search("amount:lots")
+
+
+if __name__ == "__main__":
+    unittest.main()
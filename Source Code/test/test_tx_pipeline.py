@@ -0,0 +1,168 @@
+import os
+import sys
+import threading
+import unittest
+from types import SimpleNamespace
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tx_pipeline import TransactionFailed, TransactionPipeline, TransactionTimeout
+
+# Unit tests of the transaction pipeline against a stub node; run with `python -m unittest discover test` from
+# Source Code. The stub's provider has no endpoint_uri, so receipts are fetched one request at a time through
+# web3.manager like eth-tester's.
+
+ACCOUNT = "0xA11CE"
+
+
+def raw_receipt(tx_hash, status=1):
+    return {'transactionHash': tx_hash, 'blockNumber': '0x10', 'blockHash': '0x' + 'ab' * 32,
+            'status': hex(status), 'gasUsed': '0x5208', 'logs': []}
+
+
+class StubManager:
+    def __init__(self):
+        self.receipts = {}  # tx hash -> raw receipt; missing ones are still pending
+        self.failing = None  # JSON-RPC error answered to every request
+
+    def request_blocking(self, method, params):
+        assert method == "eth_getTransactionReceipt"
+        if self.failing is not None:
+            raise ValueError(self.failing)  # How web3 raises JSON-RPC errors
+        return self.receipts.get(params[0])
+
+
+class StubEth:
+    def __init__(self):
+        self.transaction_count = 5
+        self.count_calls = 0
+
+    def get_transaction_count(self, account, block_identifier):
+        self.count_calls += 1
+        return self.transaction_count
+
+
+class StubWeb3:
+    def __init__(self):
+        self.eth = StubEth()
+        self.provider = SimpleNamespace(endpoint_uri=None)
+        self.manager = StubManager()
+
+
+class DownSession:
+    # A node that cannot be reached over HTTP
+    def post(self, url, json, timeout):
+        raise requests.ConnectionError("node down")
+
+
+class StubFunction:
+    # Stands in for a bound contract function; errors are raised by the next transact() calls, in order
+    fn_name = "addPanel"
+
+    def __init__(self, errors=()):
+        self.errors = list(errors)
+        self.nonces = []
+
+    def transact(self, transaction):
+        self.nonces.append(transaction['nonce'])
+        if self.errors:
+            raise self.errors.pop(0)
+        return '0x%064x' % len(self.nonces)
+
+
+class TransactionPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.web3 = StubWeb3()
+        self.receipts = []
+        self.pipeline = TransactionPipeline(self.web3, poll_interval=0.01, timeout=0.2, on_receipt=self.receipts.append)
+
+    def test_nonces_are_handed_out_locally(self):
+        function = StubFunction()
+        self.pipeline.send_all([(function, {'from': ACCOUNT})] * 3)
+        self.assertEqual(function.nonces, [5, 6, 7])
+        self.assertEqual(self.web3.eth.count_calls, 1)
+        self.pipeline.reset(ACCOUNT)
+        self.web3.eth.transaction_count = 9
+        self.pipeline.send(function, {'from': ACCOUNT})
+        self.assertEqual(function.nonces[-1], 9)
+
+    def test_stale_nonce_resyncs_once(self):
+        # Another client sent from the account: the local nonce 6 is stale and the node says 8
+        function = StubFunction()
+        self.pipeline.send(function, {'from': ACCOUNT})
+        function.errors = [ValueError("nonce too low")]
+        self.web3.eth.transaction_count = 8
+        self.pipeline.send(function, {'from': ACCOUNT})
+        self.assertEqual(function.nonces, [5, 6, 8])
+        self.assertEqual(self.web3.eth.count_calls, 2)
+        self.pipeline.send(function, {'from': ACCOUNT})
+        self.assertEqual(function.nonces[-1], 9)
+
+    def test_stale_nonce_is_not_retried_twice(self):
+        function = StubFunction([ValueError("nonce too low"), ValueError("nonce too low")])
+        with self.assertRaises(ValueError):
+            self.pipeline.send(function, {'from': ACCOUNT})
+        self.assertEqual(function.nonces, [5, 5])
+        self.assertEqual(self.web3.eth.count_calls, 2)
+
+    def test_other_errors_are_not_retried(self):
+        function = StubFunction([ValueError("insufficient funds")])
+        with self.assertRaises(ValueError):
+            self.pipeline.send(function, {'from': ACCOUNT})
+        self.assertEqual(function.nonces, [5])
+        # The local nonce is forgotten, so the next send asks the node again
+        self.pipeline.send(function, {'from': ACCOUNT})
+        self.assertEqual(self.web3.eth.count_calls, 2)
+
+    def test_mined_transaction_resolves_to_its_receipt(self):
+        tx_hash = '0x%064x' % 1
+        self.web3.manager.receipts[tx_hash] = raw_receipt(tx_hash)
+        receipt = self.pipeline.send(StubFunction(), {'from': ACCOUNT}).result(timeout=5)
+        self.assertEqual(receipt['status'], 1)
+        self.assertEqual(receipt['blockNumber'], 16)
+        self.assertEqual(self.receipts, [receipt])
+
+    def test_reverted_transaction_fails(self):
+        tx_hash = '0x%064x' % 1
+        self.web3.manager.receipts[tx_hash] = raw_receipt(tx_hash, status=0)
+        error = self.pipeline.send(StubFunction(), {'from': ACCOUNT}).exception(timeout=5)
+        self.assertIsInstance(error, TransactionFailed)
+        self.assertEqual(error.tx_hash, tx_hash)
+        self.assertEqual(error.receipt['status'], 0)
+
+    def assertTimesOut(self, future):
+        error = future.exception(timeout=5)
+        self.assertIsInstance(error, TransactionTimeout)
+        self.assertEqual(error.tx_hash, '0x%064x' % 1)
+        self.assertIn("not mined", str(error))
+        self.assertEqual(self.pipeline.pending, {})
+
+    def test_missing_receipt_times_out(self):
+        self.assertTimesOut(self.pipeline.send(StubFunction(), {'from': ACCOUNT}))
+
+    def test_failing_receipt_lookups_time_out(self):
+        # Both a node answering each lookup with an error and one that cannot be reached, failing the whole batch
+        with self.assertLogs(level="ERROR"):
+            self.web3.manager.failing = {'code': -32000, 'message': "header not found"}
+            self.assertTimesOut(self.pipeline.send(StubFunction(), {'from': ACCOUNT}))
+        with self.assertLogs(level="ERROR") as logs:
+            self.web3.provider.endpoint_uri = "http://127.0.0.1:8545"
+            self.pipeline.session = DownSession()
+            self.assertTimesOut(self.pipeline.send(StubFunction(), {'from': ACCOUNT}))
+        self.assertIn("Error polling transaction receipts: node down", logs.output[0])
+
+    def test_pending_transactions_from_several_threads(self):
+        function = StubFunction()
+        threads = [threading.Thread(target=self.pipeline.send, args=(function, {'from': ACCOUNT}))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(function.nonces), list(range(5, 13)))
+
+
+if __name__ == "__main__":
+    unittest.main()
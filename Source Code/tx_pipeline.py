@@ -0,0 +1,148 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from batch_reads import BatchReader
+from metrics import metrics
+
+# Sends contract transactions without waiting for each one to be mined. Nonces are handed out locally per account,
+# so several transactions from one account can be in the same block, and a single background thread polls the
+# receipts of every pending transaction in one JSON-RPC batch per interval. send() returns a Future that resolves
+# to the receipt, or fails with TransactionFailed if the transaction reverted and with TransactionTimeout if it was
+# not mined in time.
+
+
+class TransactionFailed(Exception):
+    def __init__(self, tx_hash, receipt):
+        super().__init__(f"Transaction {tx_hash} reverted in block {receipt['blockNumber']}")
+        self.tx_hash = tx_hash
+        self.receipt = receipt
+
+
+class TransactionTimeout(TimeoutError):
+    # The transaction may still be mined later, so it must not simply be sent again; track(tx_hash) keeps waiting
+    def __init__(self, tx_hash, timeout):
+        super().__init__(f"Transaction {tx_hash} was not mined within {timeout} seconds")
+        self.tx_hash = tx_hash
+
+
+class TransactionPipeline:
+    def __init__(self, web3, poll_interval=0.5, timeout=300, on_receipt=None, session=None):
+        self.web3 = web3
+        self.session = session  # requests session the receipt batches go through
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.on_receipt = on_receipt  # Called with every receipt, e.g. to invalidate cached views
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.account_locks = {}
+        self.nonces = {}  # account -> next nonce to use
+        self.pending = {}  # tx hash -> (future, time sent, function name)
+        self.poller = None
+
+    def account_lock(self, account):
+        with self.lock:
+            return self.account_locks.setdefault(account, threading.Lock())
+
+    def send(self, contract_function, transaction):
+        # Send contract_function.transact(transaction) with the next local nonce of transaction['from']
+        account = transaction['from']
+        with self.account_lock(account):
+            for attempt in range(2):
+                nonce = self.nonces.get(account)
+                if nonce is None:
+                    nonce = self.web3.eth.get_transaction_count(account, 'pending')
+                try:
+                    with metrics.timed("lumin_transaction_submit_seconds", function=contract_function.fn_name):
+                        tx_hash = contract_function.transact(dict(transaction, nonce=nonce))
+                    break
+                except Exception as e:
+                    # Something else sent from this account and the local nonce is stale: resync once and retry
+                    self.nonces.pop(account, None)
+                    if attempt or 'nonce' not in str(e).lower():
+                        raise
+            self.nonces[account] = nonce + 1
+        metrics.inc("lumin_transactions_total", function=contract_function.fn_name)
+        return self.track(tx_hash, contract_function.fn_name)
+
+    def send_all(self, calls):
+        # calls are (contract_function, transaction) pairs, sent back to back in order
+        return [self.send(contract_function, transaction) for contract_function, transaction in calls]
+
+    def track(self, tx_hash, function="unknown"):
+        if not isinstance(tx_hash, str):
+            tx_hash = '0x' + bytes(tx_hash).hex()
+        future = Future()
+        with self.lock:
+            self.pending[tx_hash] = (future, time.monotonic(), function)
+            if self.poller is None:
+                self.poller = threading.Thread(target=self.poll, name="receipt-poller", daemon=True)
+                self.poller.start()
+            self.wakeup.notify()
+        return future
+
+    def reset(self, account=None):
+        # Forget local nonces so the next send asks the node again
+        with self.lock:
+            if account is None:
+                self.nonces.clear()
+            else:
+                self.nonces.pop(account, None)
+
+    def poll(self):
+        while True:
+            with self.lock:
+                while not self.pending:
+                    self.wakeup.wait()
+                hashes = list(self.pending)
+
+            try:
+                batch = BatchReader(self.web3, self.session)
+                receipts = {tx_hash: batch.receipt(tx_hash) for tx_hash in hashes}
+                batch.execute()
+            except Exception as e:
+                # A node that keeps failing must not keep the transactions waiting past their timeout
+                logging.error(f"Error polling transaction receipts: {e}")
+                for tx_hash in hashes:
+                    self.check_timeout(tx_hash)
+                time.sleep(self.poll_interval)
+                continue
+
+            for tx_hash, pending in receipts.items():
+                try:
+                    receipt = pending.result
+                except Exception as e:
+                    logging.error(f"Error fetching the receipt of {tx_hash}: {e}")
+                    receipt = None
+                if receipt is None:
+                    self.check_timeout(tx_hash)
+                else:
+                    self.finish(tx_hash, receipt)
+
+            time.sleep(self.poll_interval)
+
+    def check_timeout(self, tx_hash):
+        with self.lock:
+            future, sent_at, function = self.pending[tx_hash]
+            if time.monotonic() - sent_at < self.timeout:
+                return
+            del self.pending[tx_hash]
+        metrics.inc("lumin_transaction_timeouts_total", function=function)
+        future.set_exception(TransactionTimeout(tx_hash, self.timeout))
+
+    def finish(self, tx_hash, receipt):
+        with self.lock:
+            future, sent_at, function = self.pending.pop(tx_hash)
+        # Submission to receipt as seen by the poller, so at most one poll interval late
+        metrics.observe("lumin_transaction_mined_seconds", time.monotonic() - sent_at, function=function,
+                        status="reverted" if receipt['status'] == 0 else "ok")
+        if self.on_receipt is not None:
+            try:
+                self.on_receipt(receipt)
+            except Exception as e:
+                logging.error(f"Error in receipt callback for {tx_hash}: {e}")
+        if receipt['status'] == 0:
+            future.set_exception(TransactionFailed(tx_hash, receipt))
+        else:
+            future.set_result(receipt)
@@ -0,0 +1,116 @@
+import threading
+import time
+
+from metrics import metrics
+
+# Results of contract view calls and other node reads, shared by every tab of the window. An entry is only valid for
+# the block it was read at: the head block number is re-read at most once per ttl seconds, a new head drops every
+# entry, and invalidate() (called after this client's own transactions are mined) drops them straight away.
+
+
+class ViewCache:
+    def __init__(self, web3, ttl=2.0):
+        self.web3 = web3
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.head = None  # Last head block number seen
+        self.checked_at = 0.0
+        self.entries = {}  # key -> (block number, value)
+        self.fetch_locks = {}  # key -> lock, so tabs asking for the same read at once share one request
+        self.generation = 0  # Bumped by invalidate() so reads already in flight are not stored afterwards
+        self.hits = 0
+        self.misses = 0
+
+    def head_is_fresh(self):
+        return self.head is not None and time.monotonic() - self.checked_at < self.ttl
+
+    def current_block(self):
+        with self.lock:
+            if self.head_is_fresh():
+                return self.head
+            generation = self.generation
+        number = self.web3.eth.block_number
+        self.observe_block(number, generation)
+        return number
+
+    def observe_block(self, number, generation=None):
+        # Record a head block number learned by any read; a different block makes every entry stale
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            if number != self.head:
+                self.entries.clear()
+                self.head = number
+            self.checked_at = time.monotonic()
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and self.head_is_fresh() and entry[0] == self.head:
+                return True, entry[1]
+            return False, None
+
+    def store(self, key, block, value, generation):
+        with self.lock:
+            if generation == self.generation and block == self.head:
+                self.entries[key] = (block, value)
+
+    def fetch_lock(self, key):
+        with self.lock:
+            return self.fetch_locks.setdefault(key, threading.Lock())
+
+    def get(self, key, fetch):
+        # fetch(block_number) reads the value at that block when there is no entry for the current head
+        with self.fetch_lock(key):
+            found, value = self.lookup(key)
+            if not found:
+                with self.lock:
+                    generation = self.generation
+                block = self.current_block()
+                found, value = self.lookup(key)
+                if not found:
+                    value = fetch(block)
+                    self.store(key, block, value, generation)
+            with self.lock:
+                if found:
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            metrics.inc("lumin_view_cache_requests_total", result="hit" if found else "miss")
+            return value
+
+    def call(self, contract_function, transaction=None):
+        # Cached contract_function.call(transaction), keyed by function, arguments and sender
+        transaction = transaction or {}
+        function = contract_function.fn_name
+        key = (function, tuple(contract_function.args), transaction.get('from'))
+        metrics.inc("lumin_contract_calls_total", function=function, via="cache")
+
+        def fetch(block):
+            with metrics.timed("lumin_contract_call_seconds", function=function):
+                return contract_function.call(transaction, block_identifier=block)
+        return self.get(key, fetch)
+
+    def balance(self, address):
+        return self.get(("eth_getBalance", address), lambda block: self.web3.eth.get_balance(address, block))
+
+    def sync(self, key, sync_fn):
+        # For reads that learn the head themselves, like the index sync: sync_fn() brings the data up to date and
+        # returns the head block number it saw. It is skipped while nothing can have changed since the last run.
+        with self.fetch_lock(key):
+            found, _ = self.lookup(key)
+            with self.lock:
+                generation = self.generation
+                if found:
+                    self.hits += 1
+                    return
+                self.misses += 1
+            head = sync_fn()
+            self.observe_block(head, generation)
+            self.store(key, head, head, generation)
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+            self.head = None
+            self.generation += 1
@@ -0,0 +1,112 @@
+import logging
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from metrics import metrics
+
+
+class WorkerSignals(QObject):
+    # Signals are emitted from the pool thread and delivered on the GUI thread
+    finished = pyqtSignal(object, object)  # (worker, result)
+    failed = pyqtSignal(object, object)  # (worker, exception)
+
+
+class CallbackSignal(QObject):
+    # Hands values from any thread, e.g. a live feed's, to slots on the GUI thread
+    fired = pyqtSignal(object)
+
+
+class Worker(QRunnable):
+    def __init__(self, key, fn, args, on_success, on_error):
+        super().__init__()
+        self.setAutoDelete(False)  # The runner keeps a reference until the result has been delivered
+
+        self.key = key
+        self.fn = fn
+        self.args = args
+        self.on_success = on_success
+        self.on_error = on_error
+        self.cancelled = False
+        self.signals = WorkerSignals()
+
+    def cancel(self):
+        # A cancelled worker still finishes its RPC (web3 calls cannot be interrupted) but its result is dropped
+        self.cancelled = True
+
+    def run(self):
+        if self.cancelled:
+            # Still reported, so the runner releases the worker; _on_finished drops the result of a cancelled one
+            self.signals.finished.emit(self, None)
+            return
+        try:
+            with metrics.timed("lumin_task_seconds", task=self.key or "anonymous"):
+                result = self.fn(*self.args)
+        except Exception as e:
+            self.signals.failed.emit(self, e)
+            return
+        self.signals.finished.emit(self, result)
+
+
+class TaskRunner(QObject):
+    # Runs blocking contract calls, transactions and receipt waits on a thread pool so the Qt event loop stays
+    # responsive. Tasks submitted with a key are coalesced: while one is queued or running, submitting the same key
+    # again reuses it instead of queueing a duplicate fetch, unless replace=True asks for fresh data.
+    def __init__(self, parent=None, max_threads=4):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.active = {}  # key -> worker currently queued or running
+        self.workers = set()  # every worker whose result has not been delivered yet
+
+    def submit(self, key, fn, *args, on_success=None, on_error=None, replace=False):
+        if key is not None and key in self.active:
+            if not replace:
+                return self.active[key]
+            self.cancel(key)
+
+        worker = Worker(key, fn, args, on_success, on_error)
+        worker.signals.finished.connect(self._on_finished)
+        worker.signals.failed.connect(self._on_failed)
+        self.workers.add(worker)
+        if key is not None:
+            self.active[key] = worker
+        self.pool.start(worker)
+        return worker
+
+    def is_running(self, key):
+        return key in self.active
+
+    def cancel(self, key):
+        worker = self.active.pop(key, None)
+        if worker is not None:
+            worker.cancel()
+            if self.pool.tryTake(worker):
+                # It never started, so no signal will arrive to release it
+                self.workers.discard(worker)
+
+    def cancel_all(self):
+        for key in list(self.active):
+            self.cancel(key)
+        for worker in list(self.workers):
+            worker.cancel()
+
+    def _release(self, worker):
+        self.workers.discard(worker)
+        if worker.key is not None and self.active.get(worker.key) is worker:
+            del self.active[worker.key]
+
+    def _on_finished(self, worker, result):
+        self._release(worker)
+        if worker.cancelled or worker.on_success is None:
+            return
+        # Time spent on the GUI thread filling widgets with the result
+        with metrics.timed("lumin_ui_update_seconds", task=worker.key or "anonymous"):
+            worker.on_success(result)
+
+    def _on_failed(self, worker, error):
+        self._release(worker)
+        if worker.cancelled:
+            return
+        if worker.on_error is not None:
+            worker.on_error(error)
+        else:
+            logging.error(f"Background task {worker.key} failed: {error}")